@@ -10,3 +10,4 @@ from .data import HiCData, HiCParser
 from .mcmc import RandomWalk, AdaptiveWalk
 from .hmc import HamiltonianMonteCarlo
 from .rex import ReplicaExchange, ReplicaHistory, ReplicaState
+from .core import set_n_threads, get_n_threads
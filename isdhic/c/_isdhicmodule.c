@@ -8,6 +8,7 @@ static PyMethodDef methods[] = {
   {"nblist", (PyCFunction) PyNBList_nblist, 1},
   {"prolsq", (PyCFunction) PyProlsq_New, 1},
   {"rosetta", (PyCFunction) PyRosetta_New, 1,},
+  {"tabulated", (PyCFunction) PyTabulated_New, 1},
   {NULL, NULL}
 };
 
@@ -21,6 +22,7 @@ void init_isdhic(void) {
 
   PyProlsq_Type.ob_type = &PyType_Type;
   PyRosetta_Type.ob_type = &PyType_Type;
+  PyTabulated_Type.ob_type = &PyType_Type;
   PyNBList_Type.ob_type = &PyType_Type;
 }
 
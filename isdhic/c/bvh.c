@@ -0,0 +1,342 @@
+#define NO_IMPORT_ARRAY
+
+#include "isdhic.h"
+
+/*
+  Bounding volume hierarchy (BVH) over contiguous segments of a chain.
+  Every leaf holds the bounding box of 'segment_length' consecutive atoms;
+  the inner nodes are built top-down by splitting the segments at the
+  median of their centers along the longest axis. A traversal of the
+  hierarchy against itself yields all pairs of segments whose bounding
+  boxes are closer than the cutoff.
+ */
+
+BVH *bvh_new(void) {
+
+  BVH *bvh = MALLOC(1, BVH);
+
+  if (!bvh) return NULL;
+
+  bvh->n_atoms        = 0;
+  bvh->segment_length = 0;
+  bvh->n_segments     = 0;
+  bvh->n_nodes        = 0;
+  bvh->nodes          = NULL;
+  bvh->segments       = NULL;
+  bvh->centers        = NULL;
+  bvh->offsets        = NULL;
+  bvh->partners       = NULL;
+  bvh->n_pairs        = 0;
+  bvh->capacity       = 0;
+  bvh->first          = NULL;
+  bvh->second         = NULL;
+
+  return bvh;
+}
+
+static void del_segments(BVH *bvh) {
+
+  if (bvh->nodes)    free(bvh->nodes);
+  if (bvh->segments) free(bvh->segments);
+  if (bvh->centers)  free(bvh->centers);
+  if (bvh->offsets)  free(bvh->offsets);
+
+  bvh->nodes      = NULL;
+  bvh->segments   = NULL;
+  bvh->centers    = NULL;
+  bvh->offsets    = NULL;
+  bvh->n_segments = 0;
+}
+
+void bvh_del(BVH *bvh) {
+
+  if (!bvh) return;
+
+  del_segments(bvh);
+
+  if (bvh->partners) free(bvh->partners);
+  if (bvh->first)    free(bvh->first);
+  if (bvh->second)   free(bvh->second);
+
+  free(bvh);
+}
+
+static int set_segments(BVH *bvh, int n_segments) {
+
+  if (n_segments == bvh->n_segments) return 0;
+
+  del_segments(bvh);
+
+  /* leaves are stored after the 'n_segments - 1' inner nodes */
+
+  if (!(bvh->nodes    = MALLOC(2 * n_segments - 1, BVHNode)) ||
+      !(bvh->segments = MALLOC(n_segments, int)) ||
+      !(bvh->centers  = MALLOC(3 * n_segments, double)) ||
+      !(bvh->offsets  = MALLOC(n_segments + 1, int))) {
+    del_segments(bvh);
+    RAISE(PyExc_MemoryError, "bvh_build: malloc failed.", -1);
+  }
+  bvh->n_segments = n_segments;
+
+  return 0;
+}
+
+static void select_median(BVH *bvh, int begin, int end, int mid, int axis) {
+  /*
+    Partially sorts the segments such that the segment at position 'mid'
+    is the median with respect to the center coordinate along 'axis'.
+   */
+  int *segments = bvh->segments;
+  double *centers = bvh->centers;
+  double pivot;
+  int i, j, tmp;
+
+  end--;
+
+  while (begin < end) {
+
+    pivot = centers[3 * segments[(begin + end) / 2] + axis];
+
+    i = begin;
+    j = end;
+
+    while (i <= j) {
+      while (centers[3 * segments[i] + axis] < pivot) i++;
+      while (centers[3 * segments[j] + axis] > pivot) j--;
+      if (i <= j) {
+	tmp = segments[i];
+	segments[i] = segments[j];
+	segments[j] = tmp;
+	i++;
+	j--;
+      }
+    }
+    if (mid <= j) {
+      end = j;
+    }
+    else if (mid >= i) {
+      begin = i;
+    }
+    else {
+      break;
+    }
+  }
+}
+
+static int build_node(BVH *bvh, int begin, int end) {
+  /*
+    Builds the subtree over the segments stored from 'begin' to 'end - 1'
+    and returns the index of its root.
+   */
+  int i, l, axis=0, mid, id;
+  double c, lo[3], hi[3];
+  BVHNode *node, *left, *right;
+
+  if (end - begin == 1) {
+    return bvh->n_segments - 1 + bvh->segments[begin];
+  }
+
+  /* split along the axis of the largest spread of the centers */
+
+  for (l = 0; l < 3; l++) {
+    lo[l] = hi[l] = bvh->centers[3 * bvh->segments[begin] + l];
+  }
+  for (i = begin + 1; i < end; i++) {
+    for (l = 0; l < 3; l++) {
+      c = bvh->centers[3 * bvh->segments[i] + l];
+      if (c < lo[l]) lo[l] = c;
+      if (c > hi[l]) hi[l] = c;
+    }
+  }
+  for (l = 1; l < 3; l++) {
+    if (hi[l] - lo[l] > hi[axis] - lo[axis]) axis = l;
+  }
+
+  mid = (begin + end) / 2;
+  select_median(bvh, begin, end, mid, axis);
+
+  id = bvh->n_nodes++;
+
+  bvh->nodes[id].segment = -1;
+  bvh->nodes[id].left    = build_node(bvh, begin, mid);
+  bvh->nodes[id].right   = build_node(bvh, mid, end);
+
+  node  = &bvh->nodes[id];
+  left  = &bvh->nodes[node->left];
+  right = &bvh->nodes[node->right];
+
+  for (l = 0; l < 3; l++) {
+    node->lo[l] = left->lo[l] < right->lo[l] ? left->lo[l] : right->lo[l];
+    node->hi[l] = left->hi[l] > right->hi[l] ? left->hi[l] : right->hi[l];
+  }
+  return id;
+}
+
+int bvh_build(BVH *bvh, vector *coords, int n_atoms, int segment_length) {
+  /*
+    Computes the bounding boxes of all segments and builds the hierarchy.
+   */
+  int s, n, l, first, last, n_segments;
+  BVHNode *leaf;
+
+  if (n_atoms < 1) {
+    RAISE(PyExc_ValueError, "bvh_build: no atoms.", -1);
+  }
+  if (segment_length < 1) segment_length = 1;
+
+  n_segments = (n_atoms + segment_length - 1) / segment_length;
+
+  if (set_segments(bvh, n_segments)) return -1;
+
+  bvh->n_atoms        = n_atoms;
+  bvh->segment_length = segment_length;
+
+  for (s = 0; s < n_segments; s++) {
+
+    leaf  = &bvh->nodes[n_segments - 1 + s];
+    first = s * segment_length;
+    last  = first + segment_length < n_atoms ? first + segment_length : n_atoms;
+
+    leaf->left = leaf->right = -1;
+    leaf->segment = s;
+
+    for (l = 0; l < 3; l++) leaf->lo[l] = leaf->hi[l] = coords[first][l];
+
+    for (n = first + 1; n < last; n++) {
+      for (l = 0; l < 3; l++) {
+	if (coords[n][l] < leaf->lo[l]) leaf->lo[l] = coords[n][l];
+	if (coords[n][l] > leaf->hi[l]) leaf->hi[l] = coords[n][l];
+      }
+    }
+    for (l = 0; l < 3; l++) {
+      bvh->centers[3 * s + l] = 0.5 * (leaf->lo[l] + leaf->hi[l]);
+    }
+    bvh->segments[s] = s;
+  }
+  bvh->n_nodes = 0;
+
+  build_node(bvh, 0, n_segments);
+
+  return 0;
+}
+
+static double box_distance(BVHNode *a, BVHNode *b) {
+  /*
+    Squared distance between the closest points of two boxes.
+   */
+  double d, d2=0.;
+  int l;
+
+  for (l = 0; l < 3; l++) {
+    d = a->lo[l] - b->hi[l];
+    if (d < b->lo[l] - a->hi[l]) d = b->lo[l] - a->hi[l];
+    if (d > 0.) d2 += d * d;
+  }
+  return d2;
+}
+
+static int add_pair(BVH *bvh, int s, int t) {
+
+  int capacity, *first, *second;
+
+  if (bvh->n_pairs >= bvh->capacity) {
+
+    capacity = bvh->capacity > 0 ? 2 * bvh->capacity : 1024;
+
+    if (!(first = (int*) realloc(bvh->first, capacity * sizeof(int)))) {
+      RAISE(PyExc_MemoryError, "bvh_find_pairs: realloc failed.", -1);
+    }
+    bvh->first = first;
+
+    if (!(second = (int*) realloc(bvh->second, capacity * sizeof(int)))) {
+      RAISE(PyExc_MemoryError, "bvh_find_pairs: realloc failed.", -1);
+    }
+    bvh->second   = second;
+    bvh->capacity = capacity;
+  }
+  bvh->first[bvh->n_pairs]  = s < t ? s : t;
+  bvh->second[bvh->n_pairs] = s < t ? t : s;
+  bvh->n_pairs++;
+
+  return 0;
+}
+
+static int visit(BVH *bvh, int a, int b, double cutoff2) {
+  /*
+    Collects all pairs of segments from the subtrees rooted at 'a' and 'b'
+    whose boxes are closer than the cutoff.
+   */
+  BVHNode *A = &bvh->nodes[a], *B = &bvh->nodes[b];
+  double size_a=0., size_b=0.;
+  int l;
+
+  if (a == b) {
+    if (A->segment >= 0) return add_pair(bvh, A->segment, A->segment);
+
+    return visit(bvh, A->left, A->left, cutoff2)   ||
+           visit(bvh, A->right, A->right, cutoff2) ||
+           visit(bvh, A->left, A->right, cutoff2);
+  }
+  if (box_distance(A, B) > cutoff2) return 0;
+
+  if (A->segment >= 0 && B->segment >= 0) {
+    return add_pair(bvh, A->segment, B->segment);
+  }
+
+  /* descend into the larger box */
+
+  for (l = 0; l < 3; l++) {
+    size_a += A->hi[l] - A->lo[l];
+    size_b += B->hi[l] - B->lo[l];
+  }
+  if (B->segment >= 0 || (A->segment < 0 && size_a >= size_b)) {
+    return visit(bvh, A->left, b, cutoff2) || visit(bvh, A->right, b, cutoff2);
+  }
+  else {
+    return visit(bvh, a, B->left, cutoff2) || visit(bvh, a, B->right, cutoff2);
+  }
+}
+
+static int compare_ints(const void *a, const void *b) {
+  return *((int*) a) - *((int*) b);
+}
+
+int bvh_find_pairs(BVH *bvh, double cutoff) {
+  /*
+    Finds all pairs of segments that are closer than the cutoff and stores
+    them in compressed sparse row layout. Returns the number of pairs.
+   */
+  int s, n, *partners;
+
+  bvh->n_pairs = 0;
+
+  if (visit(bvh, 0, 0, cutoff * cutoff)) return -1;
+
+  if (!(partners = (int*) realloc(bvh->partners, bvh->capacity * sizeof(int)))) {
+    RAISE(PyExc_MemoryError, "bvh_find_pairs: realloc failed.", -1);
+  }
+  bvh->partners = partners;
+
+  /* counting sort by the first segment */
+
+  for (s = 0; s <= bvh->n_segments; s++) bvh->offsets[s] = 0;
+
+  for (n = 0; n < bvh->n_pairs; n++) bvh->offsets[bvh->first[n] + 1]++;
+
+  for (s = 0; s < bvh->n_segments; s++) bvh->offsets[s+1] += bvh->offsets[s];
+
+  for (n = 0; n < bvh->n_pairs; n++) {
+    bvh->partners[bvh->offsets[bvh->first[n]]++] = bvh->second[n];
+  }
+  for (s = bvh->n_segments; s > 0; s--) bvh->offsets[s] = bvh->offsets[s-1];
+
+  bvh->offsets[0] = 0;
+
+  /* neighboring segments are stored in the order of the chain */
+
+  for (s = 0; s < bvh->n_segments; s++) {
+    qsort(bvh->partners + bvh->offsets[s], bvh->offsets[s+1] - bvh->offsets[s],
+	  sizeof(int), compare_ints);
+  }
+  return bvh->n_pairs;
+}
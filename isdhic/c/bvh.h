@@ -0,0 +1,43 @@
+#ifndef BVH_H
+#define BVH_H
+
+/* bounding volume hierarchy over contiguous segments of a chain */
+
+typedef struct _BVHNode {
+
+  vector lo;               /* lower corner of the bounding box */
+  vector hi;               /* upper corner of the bounding box */
+  int left;                /* children (-1 for leaves) */
+  int right;
+  int segment;             /* segment stored in a leaf (-1 for inner nodes) */
+
+} BVHNode;
+
+typedef struct _BVH {
+
+  int n_atoms;             /* no. of atoms covered by the hierarchy */
+  int segment_length;      /* no. of consecutive atoms per segment */
+  int n_segments;          /* no. of segments (leaves) */
+  int n_nodes;             /* no. of nodes in use */
+  BVHNode *nodes;          /* nodes, the root is the first node */
+  int *segments;           /* segment ids sorted by the tree */
+  double *centers;         /* centers of the segment boxes */
+
+  int *offsets;            /* compressed sparse row layout of segment pairs:
+			      the segments that are close to segment 's'
+			      are stored in 'partners' from 'offsets[s]'
+			      to 'offsets[s+1]' (including 's' itself) */
+  int *partners;
+  int n_pairs;             /* no. of close segment pairs */
+  int capacity;            /* size of 'first', 'second' and 'partners' */
+  int *first;              /* close segment pairs in the order in which */
+  int *second;             /* they were found */
+
+} BVH;
+
+BVH *bvh_new(void);
+void bvh_del(BVH *bvh);
+int  bvh_build(BVH *bvh, vector *coords, int n_atoms, int segment_length);
+int  bvh_find_pairs(BVH *bvh, double cutoff);
+
+#endif
@@ -2,37 +2,41 @@
 
 #include "isdhic.h"
 
-double forcefield_energy(PyForceFieldObject *self, 
-			 double *coordinates, 
-			 int *types,
-			 int n_particles) {
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+static double energy_sweep(PyForceFieldObject *self, 
+			   double *coordinates, 
+			   int *types,
+			   int begin,
+			   int end) {
   /*
-    Evaluates non-bonded interactions based on the current neighbor list. 
+    Loops over all pairs of the atoms from 'begin' to 'end - 1' in the
+    neighbor list. Coordinates and types must be in the same order as
+    the atoms in the list.
    */
-  if (!self->enabled) return 0.;
-
-  int n_types     = self->n_types;
-  int *n_contacts = self->nblist->n_contacts;
-  int **contacts  = self->nblist->contacts;
-  vector *coords  = (vector*) coordinates;
+  int n_types    = self->n_types;
+  int *offsets   = self->nblist->offsets;
+  int *contacts  = self->nblist->contacts;
+  vector *coords = (vector*) coordinates;
 
   double *k = self->k;
   double *d = self->d;
 
   double E=0., r;
-  int    *contacts_i, index, i, j, type_i, n;
+  int    index, i, j, type_i, n;
   vector dx;
   
   /* loop through interactions of all atoms */
 
-  for (i = 0; i < n_particles; i++) {
+  for (i = begin; i < end; i++) {
 
-    type_i     = types[i] * n_types;
-    contacts_i = contacts[i];
+    type_i = types[i] * n_types;
 
-    for (n = 0; n < n_contacts[i]; n++) {
+    for (n = offsets[i]; n < offsets[i+1]; n++) {
 
-      j = contacts_i[n];
+      j = contacts[n];
       index = type_i + types[j];
 
       vector_sub(dx, coords[i], coords[j]);
@@ -41,57 +45,52 @@ double forcefield_energy(PyForceFieldObject *self,
       E += self->f((PyObject*) self, r, d[index], k[index]);
     }
   }
-
-  /* non-bonded overall force constant */
-
-  E *= self->K;
-
   return E;
 }
 
-double forcefield_gradient(PyForceFieldObject *self, 
-			   double *coordinates,
-			   double *gradient,
-			   int *types, 
-			   int n_particles,
-			   double *E_ptr) {
+static double gradient_sweep(PyForceFieldObject *self, 
+			     double *coordinates,
+			     double *gradient,
+			     int *types, 
+			     int begin,
+			     int end) {
   /*
-    Evaluates the non-bonded energy and its gradient based on the current neighbor list. 
+    Loops over all pairs of the atoms from 'begin' to 'end - 1' and
+    accumulates the gradient. Returns the energy without the overall
+    force constant.
    */
-  if (!self->enabled) return -1;
-
-  int n_types     = self->n_types;
-  int *n_contacts = self->nblist->n_contacts;
-  int **contacts  = self->nblist->contacts;
+  int n_types    = self->n_types;
+  int *offsets   = self->nblist->offsets;
+  int *contacts  = self->nblist->contacts;
 
   double *k = self->k;
   double *d = self->d;
+  double K  = self->K;
 
   vector *forces = (vector*) gradient;
   vector *coords = (vector*) coordinates;
 
   double E=0., r, c;
-  int    *contacts_i, index, i, j, n, l, type_i;
+  int    index, i, j, n, l, type_i;
   vector dx;
 
-  for (i = 0; i < n_particles; i++) {
+  for (i = begin; i < end; i++) {
 
     /* for the first atom, get atom-type */
 
-    type_i     = types[i] * n_types;
-    contacts_i = contacts[i];
+    type_i = types[i] * n_types;
 
     /* loop through all interaction partners of atom 'atom' */
 
-    for (n = 0; n < n_contacts[i]; n++) {
+    for (n = offsets[i]; n < offsets[i+1]; n++) {
       
-      j = contacts_i[n];
+      j = contacts[n];
       index = type_i + types[j];
       
       vector_sub(dx, coords[i], coords[j]);
       r = sqrt(vector_dot(dx, dx));
  
-      c = self->grad_f((PyObject*) self, r, d[index], k[index], &E);
+      c = K * self->grad_f((PyObject*) self, r, d[index], k[index], &E);
 
       for (l = 0; l < 3; l++) {
 	forces[i][l] += c * dx[l];
@@ -99,12 +98,494 @@ double forcefield_gradient(PyForceFieldObject *self,
       }
     }
   }
-  if (E_ptr) {
+  return E;
+}
+
+static int update_params(PyForceFieldObject *self) {
+  /*
+    Fills the table of per type pair constants used by the pair kernel.
+    The table is tiny and therefore recomputed before every sweep, such
+    that it always reflects the current parameters. Returns -1 if the
+    pair kernel or its parameters are not available and -2 if the table
+    could not be allocated.
+   */
+  int size = self->n_types * self->n_types * self->n_params;
+  double *params;
+
+  if (!self->kernel || !self->k || !self->d || self->n_params > MAX_PARAMS) return -1;
+
+  if (size > self->params_size) {
+    if (!(params = (double*) realloc(self->params, size * sizeof(double)))) return -2;
+    self->params = params;
+    self->params_size = size;
+  }
+  self->set_params((PyObject*) self, self->params);
+
+  return 0;
+}
+
+static void kernel_error(int status) {
+  /*
+    Sets the exception for an evaluation that requires the pair kernel
+    although it could not be prepared (see 'update_params').
+   */
+  if (status == -2) {
+    PyErr_NoMemory();
+  }
+  else {
+    PyErr_SetString(PyExc_RuntimeError, 
+		    "pair kernel and its parameters are required without stored pairs.");
+  }
+}
+
+static void init_block(PyForceFieldObject *self, PairBlock *block) {
+  /*
+    With a single atom type, the constants are the same for all pairs
+    and are filled in only once.
+   */
+  int l, m;
+
+  if (self->n_types == 1) {
+    for (l = 0; l < self->n_params; l++) {
+      for (m = 0; m < PAIR_BLOCK; m++) block->p[l][m] = self->params[l];
+    }
+  }
+}
+
+static double atom_sweep(PyForceFieldObject *self, 
+			 PairBlock *block,
+			 vector *coords,
+			 vector *forces,
+			 int *types, 
+			 int i,
+			 int *partners,
+			 double *sq_distances,
+			 int n_partners) {
+  /*
+    Evaluates the interactions of atom 'i' with its partners in blocks.
+    The difference vectors, squared distances and constants of a block
+    are gathered into contiguous buffers, the pair kernel evaluates all
+    pairs of the block in a single call and the gradient factors are
+    scattered back to the forces (if 'forces' is not NULL). Squared
+    distances are reused if they are provided. Returns the energy
+    without the overall force constant.
+   */
+  int n_types  = self->n_types;
+  int n_params = self->n_params;
+  int type_i   = types[i] * n_types;
+
+  double K = self->K;
+  double E=0., c, *params;
+  int    j, n, m, l;
+  vector x, f;
+
+  for (l = 0; l < 3; l++) {
+    x[l] = coords[i][l];
+    f[l] = 0.;
+  }
+
+  for (n = 0; n < n_partners; n += PAIR_BLOCK) {
+
+    block->n = n_partners - n < PAIR_BLOCK ? n_partners - n : PAIR_BLOCK;
+
+    for (m = 0; m < block->n; m++) {
+      j = partners[n+m];
+      for (l = 0; l < 3; l++) block->dx[l][m] = x[l] - coords[j][l];
+    }
+    if (sq_distances) {
+      for (m = 0; m < block->n; m++) block->r2[m] = sq_distances[n+m];
+    }
+    else {
+      for (m = 0; m < block->n; m++) {
+	block->r2[m] = block->dx[0][m] * block->dx[0][m] + 
+	               block->dx[1][m] * block->dx[1][m] + 
+	               block->dx[2][m] * block->dx[2][m];
+      }
+    }
+    if (n_types > 1) {
+      for (m = 0; m < block->n; m++) {
+	params = self->params + n_params * (type_i + types[partners[n+m]]);
+	for (l = 0; l < n_params; l++) block->p[l][m] = params[l];
+      }
+    }
+
+    E += self->kernel((PyObject*) self, block);
+
+    if (!forces) continue;
+
+    for (m = 0; m < block->n; m++) {
+      j = partners[n+m];
+      c = K * block->c[m];
+      for (l = 0; l < 3; l++) {
+	f[l] += c * block->dx[l][m];
+	forces[j][l] -= c * block->dx[l][m];
+      }
+    }
+  }
+  if (forces) {
+    for (l = 0; l < 3; l++) forces[i][l] += f[l];
+  }
+  return E;
+}
+
+static double kernel_sweep(PyForceFieldObject *self, 
+			   double *coords,
+			   double *forces,
+			   int *types, 
+			   int begin,
+			   int end) {
+  /*
+    Evaluates the pairs of the atoms from 'begin' to 'end - 1' in the
+    neighbor list with the pair kernel. The squared distances stored in
+    the list are not reused, since the atoms may have moved within the
+    skin.
+   */
+  int *offsets  = self->nblist->offsets;
+  int *contacts = self->nblist->contacts;
+  double E=0.;
+  int i;
+
+  PairBlock block;
+
+  init_block(self, &block);
+
+  for (i = begin; i < end; i++) {
+    E += atom_sweep(self, &block, (vector*) coords, (vector*) forces, types, i,
+		    contacts + offsets[i], NULL, offsets[i+1] - offsets[i]);
+  }
+  return E;
+}
+
+static int traversal_sweep(PyForceFieldObject *self, 
+			   double *coords,
+			   double *forces,
+			   int *types, 
+			   int begin,
+			   int end,
+			   double *E) {
+  /*
+    Evaluates the interactions of the atoms from 'begin' to 'end - 1'
+    without a stored list: the partners of every atom are collected from
+    the cells right before they are evaluated, and the squared distances
+    computed while walking the cells are reused. Returns -1 if the
+    buffer for the partners could not be allocated.
+   */
+  int i, n, status=0;
+
+  PairBlock  block;
+  PairBuffer row;
+
+  init_block(self, &block);
+  memset(&row, 0, sizeof(PairBuffer));
+
+  for (i = begin; i < end; i++) {
+
+    if ((n = nblist_partners(self->nblist, (vector*) coords, i, &row)) < 0) {
+      status = -1;
+      break;
+    }
+    *E += atom_sweep(self, &block, (vector*) coords, (vector*) forces, types, i,
+		     row.contacts, row.sq_distances, n);
+  }
+  nblist_free_row(&row);
+
+  return status;
+}
+
+static int sweep(PyForceFieldObject *self, 
+		 double *coords,
+		 double *forces,
+		 int *types, 
+		 int begin,
+		 int end,
+		 int use_kernel,
+		 double *E) {
+  /*
+    Adds the energy of the atoms from 'begin' to 'end - 1' to 'E'. Returns
+    -1 if the evaluation failed.
+   */
+  if (nblist_is_listfree(self->nblist)) {
+    return traversal_sweep(self, coords, forces, types, begin, end, E);
+  }
+  else if (use_kernel) {
+    *E += kernel_sweep(self, coords, forces, types, begin, end);
+  }
+  else if (forces) {
+    *E += gradient_sweep(self, coords, forces, types, begin, end);
+  }
+  else {
+    *E += energy_sweep(self, coords, types, begin, end);
+  }
+  return 0;
+}
+
+static int reserve_buffers(PyForceFieldObject *self, int size) {
+
+  double *buffers;
+
+  if (size > self->buffers_size) {
+    if (!(buffers = (double*) realloc(self->buffers, size * sizeof(double)))) return -1;
+    self->buffers = buffers;
+    self->buffers_size = size;
+  }
+  return 0;
+}
+
+static int parallel_sweep(PyForceFieldObject *self, 
+			  double *coords,
+			  double *forces,
+			  int *types, 
+			  int n_particles,
+			  int use_kernel,
+			  double *E_ptr) {
+  /*
+    Every thread evaluates the pairs of a contiguous block of atoms that
+    holds about the same number of pairs. Since a pair contributes to the
+    forces of both atoms, every thread accumulates its forces in its own
+    buffer; the buffers are summed up afterwards. For a given number of
+    threads, the result does not depend on the scheduling. Returns -1 if
+    the evaluation failed in any of the threads.
+   */
+  int n_threads = self->n_threads;
+  int *offsets  = self->nblist->offsets;
+  int status=0;
+  double E=0.;
+
+  if (n_threads > 1 && forces && reserve_buffers(self, 3 * n_particles * n_threads)) {
+    n_threads = 1;
+  }
+  if (n_threads <= 1 || n_particles < n_threads) {
+    status = sweep(self, coords, forces, types, 0, n_particles, use_kernel, &E);
     *E_ptr = E;
+    return status;
+  }
+
+#ifdef _OPENMP
+#pragma omp parallel num_threads(n_threads) reduction(+:E) reduction(|:status)
+#endif
+  {
+    int thread_id = 0, n_used = 1, begin, end, i, t;
+    long n_pairs = offsets[n_particles];
+    double *f = NULL;
+
+#ifdef _OPENMP
+    thread_id = omp_get_thread_num();
+    n_used    = omp_get_num_threads();
+#endif
+
+    /* blocks of atoms with a similar number of pairs (or of the same
+       size if the pairs are not stored) */
+
+    if (nblist_is_listfree(self->nblist)) {
+      begin = (int) ((long) n_particles * thread_id / n_used);
+      end   = (int) ((long) n_particles * (thread_id + 1) / n_used);
+    }
+    else {
+      begin = 0;
+      while (begin < n_particles && offsets[begin] < n_pairs * thread_id / n_used) begin++;
+      end = begin;
+      while (end < n_particles && offsets[end] < n_pairs * (thread_id + 1) / n_used) end++;
+      if (thread_id == n_used - 1) end = n_particles;
+    }
+
+    if (forces) {
+      f = self->buffers + 3 * n_particles * thread_id;
+      memset(f, 0, 3 * n_particles * sizeof(double));
+    }
+
+    status |= sweep(self, coords, f, types, begin, end, use_kernel, &E);
+
+    if (forces) {
+
+#ifdef _OPENMP
+#pragma omp barrier
+#pragma omp for
+#endif
+      for (i = 0; i < 3 * n_particles; i++) {
+	for (t = 0; t < n_used; t++) {
+	  forces[i] += self->buffers[3 * n_particles * t + i];
+	}
+      }
+    }
+  }
+  *E_ptr = E;
+
+  return status;
+}
+
+double forcefield_energy(PyForceFieldObject *self, 
+			 double *coords, 
+			 int *types,
+			 int n_particles) {
+  /*
+    Evaluates non-bonded interactions based on the current neighbor list. 
+    Returns zero if the force field is disabled. Sets an exception and
+    returns zero if the evaluation failed.
+   */
+  double E=0.;
+
+  if (!self->enabled) return 0.;
+
+  PyNBListObject *nblist = self->nblist;
+  int listfree   = nblist_is_listfree(nblist);
+  int status     = (self->vectorize || listfree || !self->f) ? update_params(self) : -1;
+  int use_kernel = !status;
+
+  /* without stored pairs, the interactions can only be evaluated with
+     the pair kernel */
+
+  if (!use_kernel && (listfree || !self->f)) {
+    kernel_error(status);
+    return 0.;
+  }
+
+  if (nblist->reorder) {
+    nblist_gather(nblist, coords, types, n_particles);
+    coords = nblist->x;
+    types  = nblist->t;
+  }
+
+  if (parallel_sweep(self, coords, NULL, types, n_particles, use_kernel, &E) < 0) {
+    PyErr_NoMemory();
+    return 0.;
+  }
+
+  /* non-bonded overall force constant */
+
+  return self->K * E;
+}
+
+double forcefield_gradient(PyForceFieldObject *self, 
+			   double *coords,
+			   double *forces,
+			   int *types, 
+			   int n_particles,
+			   double *E_ptr) {
+  /*
+    Evaluates the non-bonded energy and its gradient based on the current neighbor list. 
+    Returns -1 and leaves the forces untouched if the force field is
+    disabled; the energy is zero in this case. Returns -1 with an exception
+    set if the evaluation failed.
+   */
+  if (E_ptr) *E_ptr = 0.;
+
+  if (!self->enabled) return -1;
+
+  PyNBListObject *nblist = self->nblist;
+  double *x=coords, *f=forces, E;
+  int *t=types, listfree = nblist_is_listfree(nblist);
+  int status     = (self->vectorize || listfree || !self->grad_f) ? update_params(self) : -1;
+  int use_kernel = !status;
+
+  if (!use_kernel && (listfree || !self->grad_f)) {
+    kernel_error(status);
+    return -1;
+  }
+
+  /* with sorted atoms, the gradient is evaluated in sorted order
+     and then added to the forces of the original atoms */
+
+  if (nblist->reorder) {
+    nblist_gather(nblist, coords, types, n_particles);
+    x = nblist->x;
+    f = nblist->f;
+    t = nblist->t;
+  }
+  if (parallel_sweep(self, x, f, t, n_particles, use_kernel, &E) < 0) {
+    PyErr_NoMemory();
+    return -1;
+  }
+  if (E_ptr) *E_ptr = self->K * E;
+
+  if (nblist->reorder) {
+    nblist_scatter(nblist, forces, n_particles);
   }
   return 0;
 }
 
+/*
+  Coordinates and forces can be stored in single or double precision.
+  Interactions are always evaluated in double precision: coordinates in
+  single precision are converted before the evaluation, the gradient is
+  accumulated in double precision and then added to the forces.
+ */
+
+PyObject * forcefield_py_energy(PyForceFieldObject *self, PyObject *args) {
+  
+  PyArrayObject *coords, *types, *x;
+  double E;
+
+  if (!PyArg_ParseTuple(args, "O!O!", &PyArray_Type, &coords, &PyArray_Type, &types)) {
+    RAISE(PyExc_ValueError, "numpy arrays storing coordinates and atom types expected.", NULL);
+  }
+  if (!(x = (PyArrayObject*) PyArray_ContiguousFromObject((PyObject*) coords, PyArray_DOUBLE, 1, 2))) {
+    return NULL;
+  }
+  E = forcefield_energy(self, (double*) x->data, (int*) types->data, types->dimensions[0]);
+
+  Py_DECREF(x);
+
+  if (PyErr_Occurred()) return NULL;
+
+  return Py_BuildValue("d", E);
+}
+
+PyObject * forcefield_py_update_gradient(PyForceFieldObject *self, PyObject *args) {
+  
+  int calculate_energy = 0, i, n;
+  PyArrayObject *coords, *forces, *types, *x, *f;
+  double E=0.;
+
+  if (!PyArg_ParseTuple(args, "O!O!O!i", 
+			&PyArray_Type, &coords, 
+			&PyArray_Type, &forces, 
+			&PyArray_Type, &types, 
+			&calculate_energy)) {
+    RAISE(PyExc_TypeError, "numpy arrays storing coordinates, forces and atom types expected.", NULL);
+  }
+  if (!PyArray_ISCONTIGUOUS(forces) || 
+      (forces->descr->type_num != PyArray_DOUBLE && forces->descr->type_num != PyArray_FLOAT)) {
+    RAISE(PyExc_TypeError, "contiguous array of floats or doubles expected for forces.", NULL);
+  }
+  if (!(x = (PyArrayObject*) PyArray_ContiguousFromObject((PyObject*) coords, PyArray_DOUBLE, 1, 2))) {
+    return NULL;
+  }
+  if (forces->descr->type_num == PyArray_DOUBLE) {
+    f = forces;
+    Py_INCREF(f);
+  }
+  else if (!(f = (PyArrayObject*) PyArray_ZEROS(forces->nd, forces->dimensions, PyArray_DOUBLE, 0))) {
+    Py_DECREF(x);
+    return NULL;
+  }
+  if (forcefield_gradient(self, 
+			  (double*) x->data, 
+			  (double*) f->data, 
+			  (int*) types->data, 
+			  types->dimensions[0],
+			  calculate_energy ? &E : NULL) < 0) {
+    E = 0.;
+    if (PyErr_Occurred()) {
+      Py_DECREF(x);
+      Py_DECREF(f);
+      return NULL;
+    }
+  }
+  if (f != forces) {
+    n = PyArray_SIZE(forces);
+    for (i = 0; i < n; i++) ((float*) forces->data)[i] += (float) ((double*) f->data)[i];
+  }
+  Py_DECREF(x);
+  Py_DECREF(f);
+
+  if (calculate_energy) {
+    return Py_BuildValue("d", E);
+  }
+  else {
+    RETURN_PY_NONE;
+  }
+}
+
 int forcefield_set_k(PyForceFieldObject *self, PyObject *op){
   
   int n_types, i, j, s0, s1;
@@ -190,9 +671,17 @@ void forcefield_dealloc(PyForceFieldObject *self) {
   if (self->d) {
     free(self->d); 
   }
+  if (self->params) {
+    free(self->params);
+  }
+  if (self->buffers) {
+    free(self->buffers);
+  }
   if (self->nblist) {
     Py_DECREF((PyObject*) self->nblist);
   }
+  self->params  = NULL;
+  self->buffers = NULL;
   self->k = NULL;
   self->d = NULL;
 
@@ -209,6 +698,19 @@ void forcefield_init(PyForceFieldObject *self) {
   self->d = NULL;
 
   self->nblist = NULL;
+
+  /* pair kernels are set by the specific force fields */
+
+  self->vectorize   = 1;
+  self->n_params    = 0;
+  self->params_size = 0;
+  self->params      = NULL;
+  self->kernel      = NULL;
+  self->set_params  = NULL;
+
+  self->n_threads    = 1;
+  self->buffers_size = 0;
+  self->buffers      = NULL;
 }
 
 PyObject * forcefield_getattr(PyForceFieldObject *self, char *name) {
@@ -255,6 +757,12 @@ PyObject * forcefield_getattr(PyForceFieldObject *self, char *name) {
   else if (!strcmp(name, "K")) {
     return Py_BuildValue("d", self->K);
   }
+  else if (!strcmp(name, "vectorize")) {
+    return Py_BuildValue("i", self->vectorize);
+  }
+  else if (!strcmp(name, "n_threads")) {
+    return Py_BuildValue("i", self->n_threads);
+  }
   return NULL;
 }
 
@@ -269,6 +777,21 @@ int forcefield_setattr(PyForceFieldObject *self, char *name, PyObject *op) {
     self->enabled = (int) PyInt_AsLong(op);
 #endif
   }
+  else if (!strcmp(name, "vectorize")) {
+#if PY_MAJOR_VERSION >= 3
+    self->vectorize = (int) PyLong_AsLong(op);
+#else
+    self->vectorize = (int) PyInt_AsLong(op);
+#endif
+  }
+  else if (!strcmp(name, "n_threads")) {
+#if PY_MAJOR_VERSION >= 3
+    self->n_threads = (int) PyLong_AsLong(op);
+#else
+    self->n_threads = (int) PyInt_AsLong(op);
+#endif
+    if (self->n_threads < 1) self->n_threads = 1;
+  }
   else if (!strcmp(name, "n_types")) {
 #if PY_MAJOR_VERSION >= 3
     n_types = (int) PyLong_AsLong(op);
@@ -12,6 +12,7 @@
 #include <stdlib.h>
 
 #include "mathutils.h"
+#include "bvh.h"
 #include "nblist.h"
 
 #define RAISE(a,b,c) {PyErr_SetString(a, b); return c;}
@@ -25,6 +26,24 @@ typedef int (*forcefield_gradientfunc) (PyObject*, PyObject*, double *);
 typedef double (*forcefield_energyterm) (PyObject*, double, double, double);
 typedef double (*forcefield_gradenergyterm) (PyObject*, double, double, double, double *);
 
+/* block of interaction partners of a single atom that is processed by a
+   specialized pair kernel (structure of arrays, such that the kernel can
+   be vectorized) */
+
+#define PAIR_BLOCK 64
+#define MAX_PARAMS 8
+
+typedef struct {
+  int    n;                           /* no. of pairs in block */
+  double dx[3][PAIR_BLOCK];           /* difference vectors */
+  double r2[PAIR_BLOCK];              /* squared distances */
+  double p[MAX_PARAMS][PAIR_BLOCK];   /* constants of the type pairs */
+  double c[PAIR_BLOCK];               /* gradient factor of every pair (output) */
+} PairBlock;
+
+typedef double (*forcefield_pairkernel) (PyObject*, PairBlock*);
+typedef void (*forcefield_paramfunc) (PyObject*, double*);
+
 #define PyForceFieldObject_HEAD \
         PyObject_HEAD \
         double K;                /* overall force constant */ \
@@ -36,7 +55,17 @@ typedef double (*forcefield_gradenergyterm) (PyObject*, double, double, double,
         forcefield_energyterm f; \
         forcefield_gradenergyterm grad_f; \
 	forcefield_energyfunc   energy; \
-        forcefield_gradientfunc gradient;
+        forcefield_gradientfunc gradient; \
+        int vectorize;           /* switch for using the specialized pair kernel (always
+                                    used if there is no energy term per pair) */\
+        int n_params;            /* no. of constants per type pair used by the kernel */\
+        int params_size;         /* size of the table of constants */\
+        double *params;          /* constants of all type pairs */\
+        forcefield_pairkernel kernel; \
+        forcefield_paramfunc set_params; \
+        int n_threads;           /* no. of threads evaluating the interactions */\
+        int buffers_size;        /* size of the per-thread force buffers */\
+        double *buffers;         /* per-thread force buffers */
 
 /* Force fields */
 
@@ -59,8 +88,20 @@ typedef struct {
 
 } PyRosettaObject;
 
+typedef struct {
+  PyForceFieldObject_HEAD
+
+  /* cubic splines in the squared distance */
+
+  double r_max;            /* distance cutoff */
+  int n_bins;              /* no. of spline segments per type pair */
+  double *table;           /* spline coefficients of all type pairs */
+
+} PyTabulatedObject;
+
 extern PyTypeObject PyRosetta_Type;
 extern PyTypeObject PyProlsq_Type;
+extern PyTypeObject PyTabulated_Type;
 
 // general force field routines
 
@@ -72,9 +113,12 @@ int        forcefield_setattr(PyForceFieldObject *self, char *name, PyObject *op
 PyObject * forcefield_getattr(PyForceFieldObject *self, char *name);
 double     forcefield_energy(PyForceFieldObject *self, double *coords, int *types, int n_particles);
 double     forcefield_gradient(PyForceFieldObject *self, double *coords, double *forces, int *types, int n_particles, double *E);
+PyObject * forcefield_py_energy(PyForceFieldObject *self, PyObject *args);
+PyObject * forcefield_py_update_gradient(PyForceFieldObject *self, PyObject *args);
 
 PyObject * PyProlsq_New(PyObject *self, PyObject *args);
 PyObject * PyRosetta_New(PyObject *self, PyObject *args);
+PyObject * PyTabulated_New(PyObject *self, PyObject *args);
 
 #ifdef __cplusplus
  }
@@ -2,34 +2,68 @@
 
 #include "isdhic.h"
 
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
 static void set_neighbors(PyNBListObject *self) {
   /*
-   * Generates relative grid indices of neighbors in a cubic grid.
-   * Assumes that MAX_NO_NEIGHBORS is 13.
+   * Generates relative grid indices of neighbors in a cubic grid. With
+   * 'subdivision' cells per cutoff, the stencil extends over 'subdivision'
+   * cells in each direction, but cells that are further away from the
+   * central cell than the cutoff are dropped.
    */
 
-  int j, k, n=self->n_cells, counter=1;
+  int i, j, k, l, d2, counter=0, n[3], m=self->subdivision;
 
-  /* i = 0 */  
-  self->neighbors[0] = INDEX(0, 0, 1, n);
+  /* the dense grid is padded with empty cells */
 
-  for (k = -1; k < 2; k++, counter++) {
-    self->neighbors[counter] = INDEX(0, 1, k, n);
-  }
+  for (i = 0; i < 3; i++) n[i] = self->shape[i] + 2 * m;
+
+  for (i = 0; i <= m; i++) for (j = -m; j <= m; j++) for (k = -m; k <= m; k++) {
+
+    /* only use the half of the stencil following the central cell */
+
+    if (i == 0 && (j < 0 || (j == 0 && k < 1))) continue;
+
+    /* squared distance between the closest points of both cells in
+       units of the cell size */
+
+    d2 = 0;
+    l  = abs(i) - 1; if (l > 0) d2 += l * l;
+    l  = abs(j) - 1; if (l > 0) d2 += l * l;
+    l  = abs(k) - 1; if (l > 0) d2 += l * l;
+
+    if (d2 >= m * m) continue;
+
+    self->neighbors[counter] = INDEX(i, j, k, n);
+
+    self->neighbor_index[counter][0] = i;
+    self->neighbor_index[counter][1] = j;
+    self->neighbor_index[counter][2] = k;
 
-  /* i = 1 */
-  for (j = -1; j < 2; j++) for (k = -1; k < 2; k++) {
-    self->neighbors[counter] = INDEX(1, j, k, n);
     counter++;
   }
+  self->n_neighbors = counter;
 }
 
 static int init_cells(PyNBListObject *self, int n_atoms) {
 
   int n_cells, i;
 
-  n_cells = self->n_cells + 2;
-  n_cells = n_cells * n_cells * n_cells;
+  if (self->sparse) {
+
+    /* hash table with load factor of at most 1/2 */
+
+    n_cells = 1;
+    while (n_cells < 2 * n_atoms) n_cells *= 2;
+  }
+  else {
+
+    /* dense grid will be allocated once the bounding box is known */
+
+    n_cells = 0;
+  }
 
   /* at most #atoms-cells can be non-empty */
 
@@ -37,16 +71,18 @@ static int init_cells(PyNBListObject *self, int n_atoms) {
     RAISE(PyExc_MemoryError, "init_cells: malloc failed.", -1);
   }
 
+  /* storage for the objects will be allocated once a cell is used */
+
   for (i = 0; i < n_atoms; i++) {
-    if (!(self->filled[i].objects = MALLOC(self->n_per_cell, int))) {
-      RAISE(PyExc_MemoryError, "init_cells: malloc failed.", -1);
-    }
+    self->filled[i].objects   = NULL;
+    self->filled[i].capacity  = 0;
     self->filled[i].n_objects = 0;
   }
 
-  if (!(self->cells = MALLOC(n_cells, Cell*))) {
+  if (n_cells && !(self->cells = MALLOC(n_cells, Cell*))) {
     RAISE(PyExc_MemoryError, "init_cells: malloc failed.", -1);
   }
+  self->n_table = n_cells;
 
   /* initially, all cells are empty. */
 
@@ -60,6 +96,8 @@ static void del_cells(PyNBListObject *self) {
 
   int i;
 
+  /* 'cells' only points into 'filled' */
+
   if (self->filled) {
     for (i = 0; i < self->n_atoms; i++) {      
       if (self->filled[i].objects) {
@@ -69,309 +107,1154 @@ static void del_cells(PyNBListObject *self) {
     free(self->filled);
   }
   if (self->cells) {
-    for (i = 0; i < (self->n_cells+2) * (self->n_cells+2) * (self->n_cells+2) ; i++) {
-      if (self->cells[i]) {
-	free(self->cells[i]);
-      }
-    }
     free(self->cells);
   }
   self->filled   = NULL;
   self->cells    = NULL;
+  self->n_table  = 0;
+  self->n_filled = 0;
+}
+
+static int grow_cell(PyNBListObject *self, Cell *cell) {
+  /*
+    Enlarges the storage of a cell. A new cell gets room for 'n_per_cell'
+    objects, a full cell doubles its capacity.
+   */
+  int capacity = cell->capacity > 0 ? 2 * cell->capacity : self->n_per_cell;
+  int *objects;
+
+  if (capacity < 1) capacity = 1;
+
+  if (!(objects = (int*) realloc(cell->objects, capacity * sizeof(int)))) {
+    RAISE(PyExc_MemoryError, "grow_cell: realloc failed.", -1);
+  }
+  if (cell->capacity > 0) self->n_resizes++;
+
+  cell->objects  = objects;
+  cell->capacity = capacity;
+
+  return 0;
+}
+
+static Cell *hashed_cell(PyNBListObject *self, int i, int j, int k, int *n_filled) {
+  /*
+    Looks up cell (i,j,k) in the hash table by linear probing. If 'n_filled'
+    is not NULL, a missing cell is taken from the list of filled cells and
+    inserted into the table, otherwise NULL is returned for empty cells.
+   */
+  unsigned int mask = self->n_table - 1;
+  unsigned int h = HASH(i, j, k) & mask;
+  Cell *cell;
+
+  while ((cell = self->cells[h])) {
+    if (cell->index[0] == i && cell->index[1] == j && cell->index[2] == k) {
+      return cell;
+    }
+    h = (h + 1) & mask;
+  }
+  if (!n_filled) return NULL;
+
+  cell = &self->filled[*n_filled];
+  cell->id = h;
+  cell->index[0] = i;
+  cell->index[1] = j;
+  cell->index[2] = k;
+
+  self->cells[h] = cell;
+  (*n_filled)++;
+
+  return cell;
+}
+
+static void update_bbox(PyNBListObject *self, vector *coords, int n) {
+  /*
+    Determine box that contains all coordinates. The lower corner of the
+    box is stored in 'origin' and its extent along each axis in 'size'.
+   */
+  vector x_min, x_max;
+  int i, l;
+
+  for (l=0; l < 3; l++) x_min[l] = x_max[l] = coords[0][l];
+
+  for (i=1; i < n; i++) {
+    for (l=0; l < 3; l++) {
+      if (coords[i][l] < x_min[l]) {
+	x_min[l] = coords[i][l];
+      }
+      else if (coords[i][l] > x_max[l]) {
+	x_max[l] = coords[i][l];
+      }
+    }
+  }
+
+  for (l=0; l < 3; l++) {
+    self->origin[l] = x_min[l] - BOX_MARGIN;
+    self->size[l]   = x_max[l] + BOX_MARGIN - x_min[l];
+  }
+}
+
+static int fit_grid(PyNBListObject *self, double *cellsize) {
+  /*
+    Chooses the number of cells along each axis such that the dense grid
+    covers the bounding box. If this would require more than 'n_cells^3'
+    cells, the cell size is increased until the grid fits. The storage of
+    the grid is enlarged if the padded grid no longer fits into it.
+   */
+  double n_total, scale, budget = (double) self->n_cells * self->n_cells * self->n_cells;
+  int l, shape[3], changed=0;
+  long n_table = 1;
+
+  if (budget < 1.) budget = 1.;
+
+  while (1) {
+
+    n_total = 1.;
+
+    for (l=0; l < 3; l++) {
+      shape[l] = (int) floor(self->size[l] / *cellsize) + 1;
+      n_total *= shape[l];
+    }
+    if (n_total <= budget) break;
+
+    scale = cbrt(n_total / budget);
+    *cellsize *= scale > 1. + 1.e-8 ? scale : 1. + 1.e-8;
+  }
+
+  for (l=0; l < 3; l++) {
+    changed |= shape[l] != self->shape[l];
+    self->shape[l] = shape[l];
+    n_table *= shape[l] + 2 * self->subdivision;
+  }
+  if (changed) set_neighbors(self);
+
+  if (n_table > INT_MAX) {
+    RAISE(PyExc_ValueError, "fit_grid: grid is too large, reduce n_cells.", -1);
+  }
+  if (n_table > self->n_table) {
+    if (self->cells) free(self->cells);
+    if (!(self->cells = (Cell**) calloc(n_table, sizeof(Cell*)))) {
+      self->n_table = 0;
+      RAISE(PyExc_MemoryError, "fit_grid: calloc failed.", -1);
+    }
+    self->n_table = (int) n_table;
+  }
+  return 0;
+}
+
+static int needs_rebuild(PyNBListObject *self, vector *coords, int n_coords) {
+  /*
+    Checks if some particle has moved more than half of the skin since
+    the last rebuild of the list.
+   */
+  int n;
+  double max_displacement = 0.25 * self->skin * self->skin;
+  vector dx;
+
+  if (self->skin <= 0. || self->n_pairs < 0 || n_coords != self->n_atoms) {
+    return 1;
+  }
+  for (n = 0; n < n_coords; n++) {
+    vector_sub(dx, coords[n], ((vector*) self->x0)[n]);
+    if (vector_dot(dx, dx) > max_displacement) return 1;
+  }
+  return 0;
+}
+
+static Cell *get_cell(PyNBListObject *self, int i, int j, int k) {
+  /*
+    Returns cell (i,j,k) of the current grid. If the cell is empty, it is
+    taken from the list of filled cells.
+   */
+  int index, padded[3], m=self->subdivision;
+  Cell *cell;
+
+  if (self->sparse) return hashed_cell(self, i, j, k, &self->n_filled);
+
+  padded[0] = self->shape[0] + 2 * m;
+  padded[1] = self->shape[1] + 2 * m;
+  padded[2] = self->shape[2] + 2 * m;
+
+  index = INDEX(i+m, j+m, k+m, padded);
+
+  if (!(cell = self->cells[index])) {
+    cell = self->cells[index] = &self->filled[self->n_filled];
+    cell->id = index;
+    cell->index[0] = i;
+    cell->index[1] = j;
+    cell->index[2] = k;
+    self->n_filled++;
+  }
+  return cell;
+}
+
+static int add_atom(PyNBListObject *self, Cell *cell, int n) {
+  /*
+    Appends atom 'n' to a cell, enlarging its storage if the cell is full.
+   */
+  if (cell->n_objects >= cell->capacity) {
+    if (grow_cell(self, cell)) return -1;
+  }
+  self->cell_of[n] = cell;
+  self->slot[n]    = cell->n_objects;
+
+  cell->objects[cell->n_objects] = n;
+  cell->n_objects++;
+
+  if (cell->n_objects > self->max_per_cell) {
+    self->max_per_cell = cell->n_objects;
+  }
+  return 0;
+}
+
+static void clear_cells(PyNBListObject *self) {
+  /*
+    Empties all cells, the cells keep their storage.
+   */
+  int i;
+
+  for (i = 0; i < self->n_filled; i++) {
+    self->filled[i].n_objects = 0;
+    self->cells[self->filled[i].id] = NULL;
+  }
+  if (self->n_filled > 0) self->n_filled = 0;
+}
+
+static int assign_atoms(PyNBListObject *self, vector *coords, int n_coords, int new_box) {
+  /*
+    Assigns the atoms to the cells of the grid that is used to 
+    generate the non-bonded list.    
+  */
+  
+  int i, j, k, n;
+
+  double cellsize = (self->cellsize + self->skin) / self->subdivision;
+
+  if (!self->offsets || !self->cell_of || !self->slot) {
+    RAISE(PyExc_MemoryError, "assign_atoms: offsets have not been allocated.", -1);
+  }
+
+  /* remove the atoms from the previous assignment */
+
+  clear_cells(self);
+
+  /* determine new bounding box. The dense grid is adapted to the
+     shape of the box, if it cannot be covered with 'n_cells^3' cells
+     of size 'cellsize', we increase the cell size until everthing fits.
+     The sparse grid can cover boxes of any size. */
+
+  if (new_box || (!self->sparse && !self->n_table)) {
+
+    update_bbox(self, coords, n_coords);
+
+    /* leave some room such that atoms can move without leaving the grid */
+
+    if (self->incremental) {
+      for (i = 0; i < 3; i++) {
+	self->origin[i] -= cellsize;
+	self->size[i]   += 2 * cellsize;
+      }
+    }
+  }
+  if (!self->sparse) {
+    if (fit_grid(self, &cellsize)) return -1;
+  }
+  self->gridsize = cellsize;
   self->n_filled = 0;
+
+  for (n=0; n < n_coords; n++) {
+
+    /* project coordinates onto grid */
+    
+    i = (int) floor((coords[n][0] - self->origin[0]) / cellsize);
+    j = (int) floor((coords[n][1] - self->origin[1]) / cellsize);
+    k = (int) floor((coords[n][2] - self->origin[2]) / cellsize);
+
+    if (add_atom(self, get_cell(self, i, j, k), n)) return -1;
+  }
+  return 0;
+}
+
+static void unhash_cell(PyNBListObject *self, Cell *cell) {
+  /*
+    Removes a cell from the hash table. Subsequent cells of the same probe
+    sequence are shifted back such that lookups by linear probing still
+    find them.
+   */
+  unsigned int mask = self->n_table - 1;
+  unsigned int h = cell->id, j = h, home;
+  Cell *other;
+
+  self->cells[h] = NULL;
+
+  while ((other = self->cells[j = (j + 1) & mask])) {
+
+    home = HASH(other->index[0], other->index[1], other->index[2]) & mask;
+
+    /* 'other' can move to the free slot unless its home lies
+       cyclically between the free slot and its current slot */
+
+    if ((h <= j) ? (home <= h || home > j) : (home <= h && home > j)) {
+      self->cells[h] = other;
+      self->cells[j] = NULL;
+      other->id = h;
+      h = j;
+    }
+  }
+}
+
+static void release_cell(PyNBListObject *self, Cell *cell) {
+  /*
+    Removes an empty cell from the grid. The last filled cell takes its
+    place in the list of filled cells, so that the filled cells remain
+    contiguous.
+   */
+  int k;
+  Cell tmp, *last;
+
+  if (self->sparse) {
+    unhash_cell(self, cell);
+  }
+  else {
+    self->cells[cell->id] = NULL;
+  }
+  last = &self->filled[--self->n_filled];
+
+  if (last == cell) return;
+
+  /* swap cells such that the storage of the empty cell is kept */
+
+  tmp   = *cell;
+  *cell = *last;
+  *last = tmp;
+
+  self->cells[cell->id] = cell;
+
+  for (k = 0; k < cell->n_objects; k++) {
+    self->cell_of[cell->objects[k]] = cell;
+  }
+}
+
+static int move_atoms(PyNBListObject *self, vector *coords, int n_coords) {
+  /*
+    Incremental assignment: only atoms that have left their cell since
+    the last update are moved to their new cell. Returns the number of
+    moved atoms or -1 if an atom left the dense grid and all atoms have
+    to be assigned from scratch.
+   */
+  int i, j, k, n, label, last, n_moved=0;
+  Cell *cell;
+
+  double cellsize = self->gridsize;
+
+  for (n=0; n < n_coords; n++) {
+
+    i = (int) floor((coords[n][0] - self->origin[0]) / cellsize);
+    j = (int) floor((coords[n][1] - self->origin[1]) / cellsize);
+    k = (int) floor((coords[n][2] - self->origin[2]) / cellsize);
+
+    /* cells and atoms refer to the sorted atoms */
+
+    label = self->rank[n];
+    cell  = self->cell_of[label];
+
+    if (cell->index[0] == i && cell->index[1] == j && cell->index[2] == k) continue;
+
+    if (!self->sparse && (i < 0 || j < 0 || k < 0 || i >= self->shape[0] ||
+			  j >= self->shape[1] || k >= self->shape[2])) {
+      return -1;
+    }
+
+    /* remove atom from its old cell by moving the last atom into its slot */
+
+    last = cell->objects[--cell->n_objects];
+
+    if (last != label) {
+      cell->objects[self->slot[label]] = last;
+      self->slot[last] = self->slot[label];
+    }
+    if (!cell->n_objects) release_cell(self, cell);
+
+    if (add_atom(self, get_cell(self, i, j, k), label)) {
+      self->n_pairs = -1;
+      return -2;
+    }
+    n_moved++;
+  }
+  return n_moved;
+}
+
+static int grow_buffer(PairBuffer *buffer, int n) {
+  /*
+    Enlarges a contact buffer such that it can hold at least 'n' pairs.
+    The capacity is doubled to keep the number of reallocations
+    logarithmic in the number of pairs. Does not touch the Python error
+    indicator, so it can be called from worker threads.
+   */
+  int capacity = buffer->capacity > 0 ? buffer->capacity : 1024;
+  int *contacts;
+  double *sq_distances;
+
+  while (capacity < n) capacity *= 2;
+
+  if (!(contacts = (int*) realloc(buffer->contacts, capacity * sizeof(int)))) {
+    return -1;
+  }
+  buffer->contacts = contacts;
+
+  if (!(sq_distances = (double*) realloc(buffer->sq_distances, capacity * sizeof(double)))) {
+    return -1;
+  }
+  buffer->sq_distances = sq_distances;
+
+  if (buffer->capacity > 0) buffer->n_resizes++;
+
+  buffer->capacity = capacity;
+
+  return 0;
+}
+
+static int reserve_pairs(PyNBListObject *self, int n) {
+  /*
+    Makes sure that the flat buffers of the list can hold 'n' pairs. The
+    buffers are owned by numpy arrays. Growing the list creates new arrays
+    rather than reallocating the old ones, so existing views of the pairs
+    remain valid (but no longer follow the list).
+   */
+  int capacity = self->capacity > 0 ? self->capacity : 1024;
+  npy_intp size;
+  PyArrayObject *first, *contacts, *sq_distances;
+
+  if (n <= self->capacity) return 0;
+
+  while (capacity < n) capacity *= 2;
+
+  size = capacity;
+
+  first        = (PyArrayObject*) PyArray_SimpleNew(1, &size, NPY_INT);
+  contacts     = (PyArrayObject*) PyArray_SimpleNew(1, &size, NPY_INT);
+  sq_distances = (PyArrayObject*) PyArray_SimpleNew(1, &size, NPY_DOUBLE);
+
+  if (!first || !contacts || !sq_distances) {
+    Py_XDECREF(first);
+    Py_XDECREF(contacts);
+    Py_XDECREF(sq_distances);
+    RAISE(PyExc_MemoryError, "reserve_pairs: allocation failed", -1);
+  }
+  if (self->capacity > 0) self->n_resizes++;
+
+  Py_XDECREF(self->first_array);
+  Py_XDECREF(self->contacts_array);
+  Py_XDECREF(self->sq_distances_array);
+
+  self->first_array        = first;
+  self->contacts_array     = contacts;
+  self->sq_distances_array = sq_distances;
+
+  self->first        = (int*) PyArray_DATA(first);
+  self->contacts     = (int*) PyArray_DATA(contacts);
+  self->sq_distances = (double*) PyArray_DATA(sq_distances);
+  self->capacity     = capacity;
+
+  return 0;
+}
+
+static PyObject *pair_view(PyArrayObject *array, int n) {
+  /*
+    Read-only view of the first 'n' elements of a flat buffer.
+   */
+  npy_intp size = n;
+  PyObject *view = PyArray_SimpleNewFromData(1, &size, PyArray_TYPE(array),
+					     PyArray_DATA(array));
+  if (!view) return NULL;
+
+  Py_INCREF(array);
+  if (PyArray_SetBaseObject((PyArrayObject*) view, (PyObject*) array)) {
+    Py_DECREF(view);
+    return NULL;
+  }
+  PyArray_CLEARFLAGS((PyArrayObject*) view, NPY_ARRAY_WRITEABLE);
+
+  return view;
+}
+
+static void del_buffers(PyNBListObject *self) {
+
+  int t;
+
+  if (self->buffers) {
+    for (t = 0; t < self->n_threads; t++) {
+      if (self->buffers[t].contacts) free(self->buffers[t].contacts);
+      if (self->buffers[t].sq_distances) free(self->buffers[t].sq_distances);
+    }
+    free(self->buffers);
+  }
+  self->buffers = NULL;
+}
+
+static int set_nthreads(PyNBListObject *self, int n_threads) {
+
+  del_buffers(self);
+
+  self->n_threads = n_threads > 1 ? n_threads : 1;
+
+  /* buffers will be allocated when the list is built */
+
+  if (!(self->buffers = (PairBuffer*) calloc(self->n_threads, sizeof(PairBuffer)))) {
+    RAISE(PyExc_MemoryError, "set_nthreads: calloc failed", -1);
+  }
+  return 0;
+}
+
+typedef struct {
+
+  unsigned long long code;
+  Cell *cell;
+
+} MortonCell;
+
+static unsigned long long spread_bits(unsigned int x) {
+  /*
+    Inserts two zeros between the lowest 21 bits of 'x'.
+   */
+  unsigned long long v = x & 0x1fffff;
+
+  v = (v | v << 32) & 0x1f00000000ffffULL;
+  v = (v | v << 16) & 0x1f0000ff0000ffULL;
+  v = (v | v << 8)  & 0x100f00f00f00f00fULL;
+  v = (v | v << 4)  & 0x10c30c30c30c30c3ULL;
+  v = (v | v << 2)  & 0x1249249249249249ULL;
+
+  return v;
+}
+
+static int compare_codes(const void *a, const void *b) {
+
+  unsigned long long x = ((MortonCell*) a)->code;
+  unsigned long long y = ((MortonCell*) b)->code;
+
+  return (x > y) - (x < y);
+}
+
+static int sort_atoms(PyNBListObject *self, vector *coords, int n_coords) {
+  /*
+    Sorts the filled cells along a Morton curve and relabels the atoms
+    such that the atoms of one cell are consecutive and neighboring cells
+    are close in memory. The cells and the assignment of atoms to cells
+    are translated to the sorted order and the coordinates are gathered
+    in sorted order.
+   */
+  int i, k, n, r=0;
+  Cell *cell;
+  MortonCell *sorted;
+
+  if (!self->order || !self->rank || !self->x) {
+    RAISE(PyExc_MemoryError, "sort_atoms: permutation has not been allocated.", -1);
+  }
+  if (!(sorted = MALLOC(self->n_filled, MortonCell))) {
+    RAISE(PyExc_MemoryError, "sort_atoms: malloc failed.", -1);
+  }
+  for (n = 0; n < self->n_filled; n++) {
+    cell = &self->filled[n];
+    sorted[n].cell = cell;
+    sorted[n].code = spread_bits((unsigned int) cell->index[0]) << 2 |
+                     spread_bits((unsigned int) cell->index[1]) << 1 |
+                     spread_bits((unsigned int) cell->index[2]);
+  }
+  qsort(sorted, self->n_filled, sizeof(MortonCell), compare_codes);
+
+  for (n = 0; n < self->n_filled; n++) {
+
+    cell = sorted[n].cell;
+
+    for (k = 0; k < cell->n_objects; k++, r++) {
+
+      i = cell->objects[k];
+
+      self->order[r] = i;
+      self->rank[i]  = r;
+
+      /* store sorted atoms in cell */
+
+      cell->objects[k] = r;
+      self->cell_of[r] = cell;
+      self->slot[r]    = k;
+    }
+  }
+  free(sorted);
+
+  for (r = 0; r < n_coords; r++) {
+    memcpy(self->x + 3 * r, coords[self->order[r]], 3 * sizeof(double));
+  }
+  return 0;
+}
+
+void nblist_gather(PyNBListObject *self, double *coords, int *types, int n) {
+  /*
+    Copies coordinates and types into sorted order and clears the sorted
+    forces.
+   */
+  int r, i;
+
+  for (r = 0; r < n; r++) {
+
+    i = self->order[r];
+
+    self->x[3*r+0] = coords[3*i+0];
+    self->x[3*r+1] = coords[3*i+1];
+    self->x[3*r+2] = coords[3*i+2];
+
+    self->t[r] = types[i];
+  }
+  memset(self->f, 0, 3 * n * sizeof(double));
+}
+
+void nblist_scatter(PyNBListObject *self, double *forces, int n) {
+  /*
+    Adds the forces computed in sorted order to the forces of the atoms.
+   */
+  int r, i;
+
+  for (r = 0; r < n; r++) {
+
+    i = self->order[r];
+
+    forces[3*i+0] += self->f[3*r+0];
+    forces[3*i+1] += self->f[3*r+1];
+    forces[3*i+2] += self->f[3*r+2];
+  }
+}
+
+static int collect_partners(PyNBListObject *self, vector *positions, int atom_id,
+			    PairBuffer *buffer, int n_pairs) {
+  /*
+    Appends the interaction partners of atom 'atom_id' from its own cell
+    and the neighboring cells to 'buffer' starting at position 'n_pairs'.
+    Returns the new number of pairs or -1 if the buffer could not be
+    enlarged.
+  */
+  int i, j, k, partner_id;
+  int *objects, *neighbor_objects;
+  double sq_distance;
+  Cell *current_cell, *neighbor, **stencil = buffer->stencil;
+  vector dx;
+
+  int *neighbors   = self->neighbors;
+  Cell **cells     = self->cells;
+  double cellsize2 = (self->cellsize + self->skin) * (self->cellsize + self->skin);
+
+  current_cell = self->cell_of[atom_id];
+
+  if (!current_cell) return n_pairs;
+
+  objects = current_cell->objects;
+
+  /* intra-cell interactions with all atoms stored after 'atom_id' */
+
+  for (j = self->slot[atom_id]+1; j < current_cell->n_objects; j++) {
+
+    /* get index of other interacting atom. */
+
+    partner_id = objects[j];
+
+    /* check if distance is larger than cell size */
+
+    vector_sub(dx, positions[atom_id], positions[partner_id]);
+	
+    sq_distance = vector_dot(dx, dx);
+    if (sq_distance > cellsize2) continue;
+
+    /* add interaction i-j */
+
+    if (n_pairs >= buffer->capacity && grow_buffer(buffer, n_pairs+1)) return -1;
+
+    buffer->contacts[n_pairs]     = partner_id;
+    buffer->sq_distances[n_pairs] = sq_distance;
+
+    n_pairs++;
+  }
+  
+  /* inter-cell interactions: atoms of the same cell share the
+     neighbor cells, which are looked up only once */
+
+  if (current_cell != buffer->stencil_cell) {
+
+    for (i=0; i < self->n_neighbors; i++) {
+
+      if (self->sparse) {
+	stencil[i] = hashed_cell(self,
+				 current_cell->index[0] + self->neighbor_index[i][0],
+				 current_cell->index[1] + self->neighbor_index[i][1],
+				 current_cell->index[2] + self->neighbor_index[i][2],
+				 NULL);
+      }
+      else {
+	stencil[i] = cells[current_cell->id + neighbors[i]];
+      }
+    }
+    buffer->stencil_cell = current_cell;
+  }
+
+  for (i=0; i < self->n_neighbors; i++) {
+
+    neighbor = stencil[i];
+
+    /* if neighbor is empty, continue */
+
+    if (!neighbor) {
+      continue;
+    }
+
+    neighbor_objects = neighbor->objects;
+ 
+    /* loop through all objects in neighboring cell */
+
+    for (k=0; k < neighbor->n_objects; k++) {
+
+      /* get index of other interacting atom. */
+
+      partner_id = neighbor_objects[k];
+
+      /* check if distance is larger than cell size */
+	  
+      vector_sub(dx, positions[atom_id], positions[partner_id]);
+
+      sq_distance = vector_dot(dx, dx);
+      if (sq_distance > cellsize2) continue;
+
+      /* add interaction i-k */
+
+      if (n_pairs >= buffer->capacity && grow_buffer(buffer, n_pairs+1)) return -1;
+
+      buffer->contacts[n_pairs]     = partner_id;
+      buffer->sq_distances[n_pairs] = sq_distance;
+
+      n_pairs++;
+    }
+  }
+  return n_pairs;
+}
+
+static int collect_pairs(PyNBListObject *self, vector *positions, int first, int last,
+			 PairBuffer *buffer, int *offsets) {
+  /*
+    Collects the interaction partners of atoms 'first' to 'last - 1'. The
+    partners of one atom are stored contiguously in 'buffer' and their
+    start is stored in 'offsets'. Returns the number of pairs or -1 if the
+    buffer could not be enlarged.
+  */
+  int atom_id, n_pairs=0;
+
+  /* cells may have moved since the last call */
+
+  buffer->stencil_cell = NULL;
+
+  for (atom_id=first; atom_id < last; atom_id++) {
+
+    offsets[atom_id] = n_pairs;
+
+    if ((n_pairs = collect_partners(self, positions, atom_id, buffer, n_pairs)) < 0) return -1;
+  }
+  return n_pairs;
+}
+
+int nblist_is_listfree(PyNBListObject *self) {
+  return !self->store_pairs && !self->use_bvh;
+}
+
+int nblist_partners(PyNBListObject *self, vector *positions, int atom_id, PairBuffer *row) {
+  /*
+    Collects the interaction partners of a single atom from the current
+    cells into 'row' (which must be zeroed before its first use and
+    whose 'stencil_cell' must be reset after the cells were updated).
+    With sorted atoms, 'positions' and 'atom_id' refer to the sorted
+    order. Returns the number of partners or -1 if 'row' could not be
+    enlarged.
+   */
+  return collect_partners(self, positions, atom_id, row, 0);
+}
+
+void nblist_free_row(PairBuffer *row) {
+
+  if (row->contacts)     free(row->contacts);
+  if (row->sq_distances) free(row->sq_distances);
+
+  row->contacts     = NULL;
+  row->sq_distances = NULL;
+  row->capacity     = 0;
 }
 
-static double update_bbox(PyNBListObject *self, double *coords, int n) {
+static double point_box_distance(vector x, BVHNode *box) {
   /*
-    Determine box that contains all coordinates. The box is stored in a
-    3D vector: [x_min, x_max, x_max - x_min]
+    Squared distance between a point and the closest point of a box.
    */
-  double x, x_min = coords[0], x_max = coords[0];
-  int i;
-
-  for (i=1; i < n; i++) {
+  double d, d2=0.;
+  int l;
 
-    x = coords[i];
-    if (x < x_min) {
-      x_min = x;
-    }
-    else if (x > x_max) {
-      x_max = x;
-    }
+  for (l = 0; l < 3; l++) {
+    d = box->lo[l] - x[l];
+    if (d < x[l] - box->hi[l]) d = x[l] - box->hi[l];
+    if (d > 0.) d2 += d * d;
   }
-
-  self->origin = x_min - BOX_MARGIN;
-
-  return x_max + BOX_MARGIN - x_min;
+  return d2;
 }
 
-static int assign_atoms(PyNBListObject *self, vector *coords, int n_coords, int new_box) {
+static int collect_segment_pairs(PyNBListObject *self, vector *positions, int first, int last,
+				 PairBuffer *buffer, int *offsets) {
   /*
-    Assigns the atoms to the cells of the grid that is used to 
-    generate the non-bonded list.    
+    Collects the interaction partners of atoms 'first' to 'last - 1' from
+    the segments that are close to their own segment according to the
+    bounding volume hierarchy. Pairs of atoms in the same segment are
+    listed by the atom that comes first in the chain.
   */
-  
-  int i, j, k, n, index, n_filled=0;
-  Cell *current_cell;
+  int s, t, m, j, j_last, atom_id, n_pairs=0;
+  double sq_distance;
+  vector dx;
 
-  double cellsize = self->cellsize;
-  int *n_contacts = self->n_contacts;  
-  int n_cells     = self->n_cells;
+  BVH *bvh         = self->bvh;
+  int length       = bvh->segment_length;
+  double cellsize2 = (self->cellsize + self->skin) * (self->cellsize + self->skin);
 
-  if (!n_contacts) {
-    RAISE(PyExc_MemoryError, "assign_atoms: n_contacts has not been allocated.", -1);
-  }
+  for (atom_id=first; atom_id < last; atom_id++) {
 
-  /* determine new bounding box: if the bounding box cannot be 
-     covered with 'n_cells' cells of size 'cellsize', we increase 
-     the cell size until everthing fits. */
+    offsets[atom_id] = n_pairs;
 
-  if (new_box) {
-    double size = update_bbox(self, (double*) coords, 3 * n_coords);
-    if ((int) floor(size / cellsize) >= n_cells) {
-      cellsize = size / (n_cells - 1. + 1.e-8);
-    }
-  }
+    s = atom_id / length;
 
-  Cell **cells = self->cells;
+    for (m = bvh->offsets[s]; m < bvh->offsets[s+1]; m++) {
 
-  for (n=0; n < n_coords; n++) {
+      t = bvh->partners[m];
 
-    /* set no. of interactions for all objects to 0 */
-    
-    n_contacts[n] = 0;
+      /* skip segments whose box is out of reach of the atom */
 
-    /* project coordinates onto grid */
-    
-    i = (int) floor((coords[n][0] - self->origin) / cellsize);
-    j = (int) floor((coords[n][1] - self->origin) / cellsize);
-    k = (int) floor((coords[n][2] - self->origin) / cellsize);
+      if (t != s && point_box_distance(positions[atom_id],
+				       &bvh->nodes[bvh->n_segments - 1 + t]) > cellsize2) {
+	continue;
+      }
 
-    index = INDEX(i+1, j+1, k+1, n_cells);
+      j      = t == s ? atom_id + 1 : t * length;
+      j_last = (t + 1) * length < bvh->n_atoms ? (t + 1) * length : bvh->n_atoms;
 
-    if (!cells[index]) {
-      cells[index] = &self->filled[n_filled];
-      cells[index]->id = index;
-      n_filled++;
-    }
+      for (; j < j_last; j++) {
 
-    current_cell = cells[index];
+	vector_sub(dx, positions[atom_id], positions[j]);
 
-    /* if cell is not empty, check if it has enough space */
+	sq_distance = vector_dot(dx, dx);
+	if (sq_distance > cellsize2) continue;
 
-    if (current_cell->n_objects >= self->n_per_cell) {
-      printf("WARNING: no space left in cell (%d).\n", current_cell->id);
-      continue;
-    }
+	if (n_pairs >= buffer->capacity && grow_buffer(buffer, n_pairs+1)) return -1;
 
-    /* add object to current cell */
+	buffer->contacts[n_pairs]     = j;
+	buffer->sq_distances[n_pairs] = sq_distance;
 
-    current_cell->objects[current_cell->n_objects] = n;
-    current_cell->n_objects++;
+	n_pairs++;
+      }
+    }
   }
-  self->n_filled = n_filled;
-
-  return 0;
+  return n_pairs;
 }
 
-int nblist_update(PyNBListObject *self, vector *coords, int n_coords, int new_box) {
+static int collect_all_pairs(PyNBListObject *self, vector *positions, int n_coords) {
   /*
-    The NB-list is generated as follows:
-  */	     
- 
-  int i, j, k, n, partner_id, current_cell_id, total_n_contacts=0;
-  int atom_id, *atom_contacts, *objects, *neighbor_objects;
-  double sq_distance;
-  Cell *current_cell, *neighbor;
-  vector dx;
-  
-  if (!self->enabled) return -1;
-
-  int *n_contacts       = self->n_contacts;
-  int *neighbors        = self->neighbors;
-  int **contacts        = self->contacts;
-  double **sq_distances = self->sq_distances;
-  double cellsize2      = self->cellsize * self->cellsize;
-
-  // assign atoms to grid cells 
-
-  if (assign_atoms(self, coords, n_coords, new_box)) return -1;
-
-  // need to set points AFTER calling assign_atoms because
-  // pointer might be allocated in this routine for the first time
-
-  Cell **cells = self->cells;
+    Every thread collects the partners of a contiguous block of atoms in its
+    own buffer. Afterwards, the buffers are concatenated, such that the list
+    does not depend on the number of threads.
+   */
+  int t, n, k, base, n_used=1, total=0;
+  int first[self->n_threads], last[self->n_threads], counts[self->n_threads];
 
-  for (n=0; n < self->n_filled; n++) {
+  PairBuffer *buffers = self->buffers;
 
-    current_cell    = &self->filled[n];
-    objects         = current_cell->objects;
-    current_cell_id = current_cell->id;
+#ifdef _OPENMP
+#pragma omp parallel num_threads(self->n_threads) if (self->n_threads > 1)
+#endif
+  {
+    int thread_id = 0, n_threads = 1;
 
-    /* loop through objects in current cell. */
+#ifdef _OPENMP
+    thread_id = omp_get_thread_num();
+    n_threads = omp_get_num_threads();
+#endif
+    if (thread_id == 0) n_used = n_threads;
 
-    for (i=0; i < current_cell->n_objects; i++) {
+    first[thread_id] = (int) ((long) n_coords * thread_id / n_threads);
+    last[thread_id]  = (int) ((long) n_coords * (thread_id + 1) / n_threads);
 
-      /* index of object 'i' */
-      
-      atom_id = objects[i];
+    if (self->use_bvh) {
+      counts[thread_id] = collect_segment_pairs(self, positions, first[thread_id], last[thread_id],
+						&buffers[thread_id], self->offsets);
+    }
+    else {
+      counts[thread_id] = collect_pairs(self, positions, first[thread_id], last[thread_id],
+					&buffers[thread_id], self->offsets);
+    }
+  }
 
-      /* get interaction list for 'atom' and
-	 set interaction counter for first atom. */
+  for (t = 0; t < n_used; t++) {
+    self->n_resizes += buffers[t].n_resizes;
+    buffers[t].n_resizes = 0;
+    if (counts[t] < 0) {
+      RAISE(PyExc_MemoryError, "collect_all_pairs: realloc failed", -1);
+    }
+    total += counts[t];
+  }
 
-      atom_contacts = contacts[atom_id];
+  /* merge buffers and shift offsets */
 
-      /* intra-cell interactions */     
+  if (reserve_pairs(self, total)) return -1;
 
-      for (j = i+1; j < current_cell->n_objects; j++) {
+  for (t = 0, base = 0; t < n_used; base += counts[t], t++) {
 
-	/* get index of other interacting atom. */
+    memcpy(self->contacts + base, buffers[t].contacts, counts[t] * sizeof(int));
+    memcpy(self->sq_distances + base, buffers[t].sq_distances, counts[t] * sizeof(double));
 
-	partner_id = objects[j];
+    for (n = first[t]; n < last[t]; n++) {
+      self->offsets[n] += base;
+    }
+  }
+  self->offsets[n_coords] = total;
 
-	/* check if distance is larger than cell size */
+  for (n = 0; n < n_coords; n++) {
+    for (k = self->offsets[n]; k < self->offsets[n+1]; k++) {
+      self->first[k] = n;
+    }
+  }
+  return total;
+}
 
-	vector_sub(dx, coords[atom_id], coords[partner_id]);
-	
-	sq_distance = vector_dot(dx, dx);
-	if (sq_distance > cellsize2) continue;
+int nblist_update(PyNBListObject *self, vector *coords, int n_coords, int new_box) {
+  /*
+    The NB-list is generated as follows: after sorting the atoms into
+    cells, we loop over all atoms and collect their interaction partners
+    from their own cell and the neighboring cells. The partners of one
+    atom are stored contiguously such that the contacts form a compressed
+    sparse row matrix.
+  */	     
+ 
+  int i, n_moved, total_n_contacts;
+  vector *positions = coords;
+  
+  if (!self->enabled) return -1;
 
-	/* add interaction i-j */
+  /* within the skin, the current list is still complete */
 
-	atom_contacts[n_contacts[atom_id]] = partner_id;
-	sq_distances[atom_id][n_contacts[atom_id]] = sq_distance;
+  if (!needs_rebuild(self, coords, n_coords)) return self->n_pairs;
 
-	n_contacts[atom_id]++;
+  /* the hierarchy is built over segments of the chain in its original
+     order */
 
-	total_n_contacts++;
-      }
-  
-      /* inter-cell interactions */
+  if (self->use_bvh) {
 
-      for (j=0; j < MAX_NO_NEIGHBORS; j++) {
+    if (!self->bvh && !(self->bvh = bvh_new())) {
+      RAISE(PyExc_MemoryError, "nblist_update: malloc failed.", -1);
+    }
+    if (bvh_build(self->bvh, coords, n_coords, self->segment_length) ||
+	bvh_find_pairs(self->bvh, self->cellsize + self->skin) < 0) {
+      self->n_pairs = -1;
+      return -1;
+    }
+    n_moved = n_coords;
+  }
 
-        neighbor = cells[current_cell_id + neighbors[j]];
+  /* the grid is only maintained if the pairs are not found by the
+     hierarchy; in incremental mode, only atoms that changed their cell
+     are moved, otherwise all atoms are assigned to grid cells from
+     scratch */
 
-	/* if neighbor is empty, continue */
+  else {
 
-	if (!neighbor) {
-	  continue;
-	}
+    n_moved = -1;
 
-	neighbor_objects = neighbor->objects;
- 
-        /* loop through all objects in neighboring cell */
+    if (self->incremental && self->n_pairs >= 0 && self->n_filled > 0 &&
+	n_coords == self->n_atoms) {
 
-        for (k=0; k < neighbor->n_objects; k++) {
+      /* the grid is kept fixed unless atoms leave it */
 
-	  /* get index of other interacting atom. */
+      if ((n_moved = move_atoms(self, coords, n_coords)) < -1) return -1;
+      new_box = n_moved < 0;
+    }
+    if (n_moved < 0) {
 
-	  partner_id = neighbor_objects[k];
+      if (assign_atoms(self, coords, n_coords, new_box)) {
+	self->n_pairs = -1;
+	return -1;
+      }
 
-	  /* check if distance is larger than cell size */
-	  
-	  vector_sub(dx, coords[atom_id], coords[partner_id]);
+      /* optionally, continue with atoms sorted along a space-filling curve */
 
-	  sq_distance = vector_dot(dx, dx);
-	  if (sq_distance > cellsize2) continue;
+      if (self->reorder && sort_atoms(self, coords, n_coords)) {
+	self->n_pairs = -1;
+	return -1;
+      }
+      n_moved = n_coords;
+    }
+    else if (self->reorder) {
+      for (i = 0; i < n_coords; i++) {
+	memcpy(self->x + 3 * i, coords[self->order[i]], 3 * sizeof(double));
+      }
+    }
+  }
+  self->n_moved = n_moved;
 
-	  /* add interaction i-k */
+  if (self->reorder && !self->use_bvh) positions = (vector*) self->x;
 
-	  atom_contacts[n_contacts[atom_id]] = partner_id;
-	  sq_distances[atom_id][n_contacts[atom_id]] = sq_distance;
+  // collect pairs (unless they are collected during the evaluation)
 
-	  n_contacts[atom_id]++;
+  if (nblist_is_listfree(self)) {
+    memset(self->offsets, 0, (n_coords + 1) * sizeof(int));
+    total_n_contacts = 0;
+  }
+  else {
+    total_n_contacts = collect_all_pairs(self, positions, n_coords);
+  }
 
-	  total_n_contacts++;
-        }
-      }
-    } 
+  if (total_n_contacts < 0) {
+    self->n_pairs = -1;
+    return -1;
   }
 
-  /* cleanup */
+  /* remember positions for checking the displacements */
 
-  for (i = 0; i < self->n_filled; i++) {
-    self->filled[i].n_objects = 0;
-    self->cells[self->filled[i].id] = NULL;
+  if (self->x0) {
+    memcpy(self->x0, coords, 3 * n_coords * sizeof(double));
   }
+  self->n_pairs = total_n_contacts;
+  self->n_rebuilds++;
 
   return total_n_contacts;
 }
 
 static PyObject *py_update(PyNBListObject *self, PyObject *args) {
 
-  PyArrayObject *coords;
-  int new_box;
+  PyArrayObject *coords, *x;
+  int new_box, counter;
   
   if (!PyArg_ParseTuple(args, "O!i", &PyArray_Type, &coords, &new_box)) {
     return NULL;
   }
 
-  int counter = nblist_update(self, (vector*) coords->data, coords->dimensions[0], new_box);
+  /* coordinates in single precision are converted */
+
+  if (!(x = (PyArrayObject*) PyArray_ContiguousFromObject((PyObject*) coords, PyArray_DOUBLE, 2, 2))) {
+    return NULL;
+  }
+  counter = nblist_update(self, (vector*) x->data, x->dimensions[0], new_box);
+
+  Py_DECREF(x);
+
+  if (counter < 0 && PyErr_Occurred()) return NULL;
 
   return Py_BuildValue("i", counter);
 }
 
 static PyObject *py_update_bbox(PyNBListObject *self, PyObject *args) {
 
-  PyArrayObject *coords;
+  PyArrayObject *coords, *x;
   
   if (!PyArg_ParseTuple(args, "O!", &PyArray_Type, &coords)) {
     return NULL;
   }
-  double size = update_bbox(self, (double*) coords->data, 3 * coords->dimensions[0]);
+  if (!(x = (PyArrayObject*) PyArray_ContiguousFromObject((PyObject*) coords, PyArray_DOUBLE, 2, 2))) {
+    return NULL;
+  }
+  update_bbox(self, (vector*) x->data, x->dimensions[0]);
+
+  Py_DECREF(x);
+
+  return Py_BuildValue("(ddd)", self->size[0], self->size[1], self->size[2]);
+}
 
-  return Py_BuildValue("d", size);
+static PyObject *py_reset(PyNBListObject *self, PyObject *args) {
+
+  if (!PyArg_ParseTuple(args, "")) return NULL;
+
+  /* enforce rebuild in next update */
+
+  self->n_pairs = -1;
+
+  RETURN_PY_NONE;
+}
+
+static PyObject *py_pairs(PyNBListObject *self, PyObject *args) {
+
+  int n = self->n_pairs > 0 ? self->n_pairs : 0;
+  PyObject *first, *second, *sq_distances;
+
+  if (!PyArg_ParseTuple(args, "")) return NULL;
+
+  if (!self->first_array) RETURN_PY_NONE;
+
+  first        = pair_view(self->first_array, n);
+  second       = pair_view(self->contacts_array, n);
+  sq_distances = pair_view(self->sq_distances_array, n);
+
+  if (!first || !second || !sq_distances) {
+    Py_XDECREF(first);
+    Py_XDECREF(second);
+    Py_XDECREF(sq_distances);
+    return NULL;
+  }
+  return Py_BuildValue("(NNN)", first, second, sq_distances);
 }
 
 static PyMethodDef nblist_methods[] = {
   {"update", (PyCFunction) py_update, 1},
   {"update_bbox", (PyCFunction) py_update_bbox, 1},
+  {"reset", (PyCFunction) py_reset, 1},
+  {"pairs", (PyCFunction) py_pairs, 1},
   {NULL, NULL }
 };
 
 static void del_contacts(PyNBListObject *self) {
 
-  int i;
-
-  if (self->n_contacts) {
-    free(self->n_contacts);
-    self->n_contacts = NULL;
+  if (self->offsets) {
+    free(self->offsets);
+    self->offsets = NULL;
   }
-  
-  if (self->contacts) {
-    for(i = 0; i < self->n_atoms; i++) {
-      if (self->contacts[i]) {
-	free(self->contacts[i]);
-	self->contacts[i] = NULL;
-      }
-    }
-    free(self->contacts);
-    self->contacts = NULL;
+  if (self->order) {
+    free(self->order);
+    self->order = NULL;
   }
-
-  if (self->sq_distances) {
-    for(i = 0; i < self->n_atoms; i++) {
-      if (self->sq_distances[i]) {
-	free(self->sq_distances[i]);
-	self->sq_distances[i] = NULL;
-      }
-    }
-    free(self->sq_distances);
-    self->sq_distances = NULL;
+  if (self->rank) {
+    free(self->rank);
+    self->rank = NULL;
+  }
+  if (self->x) {
+    free(self->x);
+    self->x = NULL;
   }
+  if (self->f) {
+    free(self->f);
+    self->f = NULL;
+  }
+  if (self->t) {
+    free(self->t);
+    self->t = NULL;
+  }
+  if (self->cell_of) {
+    free(self->cell_of);
+    self->cell_of = NULL;
+  }
+  if (self->slot) {
+    free(self->slot);
+    self->slot = NULL;
+  }
+  Py_XDECREF(self->first_array);
+  Py_XDECREF(self->contacts_array);
+  Py_XDECREF(self->sq_distances_array);
+
+  self->first_array        = NULL;
+  self->contacts_array     = NULL;
+  self->sq_distances_array = NULL;
+
+  self->first        = NULL;
+  self->contacts     = NULL;
+  self->sq_distances = NULL;
+  self->capacity     = 0;
 }
 
 static int set_natoms(PyNBListObject *self, int n) {
 
-  int i, max_n;
-
-  // estimate maximum number of interactions
-
-  max_n = self->n_per_cell * (MAX_NO_NEIGHBORS+1);
-  max_n = (max_n > n) ? n : max_n;
-  
-  self->max_n_contacts = max_n;
+  int i;
 
   /* free old interaction lists */
 
@@ -379,28 +1262,46 @@ static int set_natoms(PyNBListObject *self, int n) {
 
   /* allocate new interaction lists */
   
-  if (!(self->n_contacts = MALLOC(n, int))) {
-    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (n_contacts)", -1);
+  if (self->x0) free(self->x0);
+  if (!(self->x0 = MALLOC(3 * n, double))) {
+    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (x0)", -1);
   }
-  if (!(self->contacts = MALLOC(n, int*))) {
-    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (contacts)", -1);
+  self->n_pairs = -1;
+
+  if (!(self->offsets = MALLOC(n+1, int))) {
+    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (offsets)", -1);
   }
-  if (!(self->sq_distances = MALLOC(n, double*))) {
-    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (sq_distances)", -1);
+  if (!(self->order = MALLOC(n, int)) || !(self->rank = MALLOC(n, int)) ||
+      !(self->t = MALLOC(n, int))) {
+    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (order)", -1);
+  }
+  if (!(self->x = MALLOC(3 * n, double)) || !(self->f = MALLOC(3 * n, double))) {
+    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (x)", -1);
+  }
+  if (!(self->cell_of = MALLOC(n, Cell*))) {
+    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (cell_of)", -1);
+  }
+  if (!(self->slot = MALLOC(n, int))) {
+    RAISE(PyExc_MemoryError, "set_natoms: malloc failed (slot)", -1);
+  }
+  for (i=0; i <= n; i++) {
+    self->offsets[i] = 0;
+  }
+  for (i=0; i < n; i++) {
+    self->order[i] = self->rank[i] = i;
   }
-    
-  for(i=0; i < n; i++) {
 
-    self->n_contacts[i]   = 0;
-    self->contacts[i]     = NULL;
-    self->sq_distances[i] = NULL;
-    
-    if (!(self->contacts[i] = MALLOC(max_n, int))) {
-      RAISE(PyExc_MemoryError, "set_natoms: malloc failed (contacts[i])", -1);
-    }
-    if (!(self->sq_distances[i] = MALLOC(max_n, double))) {
-      RAISE(PyExc_MemoryError, "set_natoms: malloc failed (sq_distances[i])", -1);
-    }
+  /* initial guess for the number of pairs, buffers will grow if
+     needed */
+
+  if (reserve_pairs(self, 8 * n)) return -1;
+
+  /* there can be as many filled cells as atoms */
+
+  if (self->filled) {
+    del_cells(self);
+    self->n_atoms = n;
+    return init_cells(self, n);
   }
   self->n_atoms = n;
 
@@ -409,18 +1310,22 @@ static int set_natoms(PyNBListObject *self, int n) {
 
 static void dealloc(PyNBListObject *self) {
   del_contacts(self);
+  del_buffers(self);
   del_cells(self);
+  bvh_del(self->bvh);
+  if (self->x0) free(self->x0);
   PyObject_Del(self);
 }
 
 static PyObject *getattr(PyNBListObject *self, char *name) {
 
-  int i, j, n, n_dims, max, dims[2];
+  int i, j, k, n, r, n_dims, max, dims[2];
   int *dummy;
   double *ddummy;
+  PyObject *attr;
 
   if (!strcmp(name, "contacts")) {
-    if (!self->contacts) {
+    if (!self->offsets) {
       RETURN_PY_NONE;
     }
     n_dims  = 2;
@@ -430,7 +1335,8 @@ static PyObject *getattr(PyNBListObject *self, char *name) {
     
     max = 0;
     for (i = 0; i < dims[0]; i++) {
-      n = self->n_contacts[i];
+      r = self->reorder ? self->rank[i] : i;
+      n = self->offsets[r+1] - self->offsets[r];
       max = n > max ? n : max;
     }    
 
@@ -444,21 +1350,26 @@ static PyObject *getattr(PyNBListObject *self, char *name) {
     
     for (i = 0; i < dims[0]; i++) {
 
-      n = self->n_contacts[i];
+      r = self->reorder ? self->rank[i] : i;
+      n = self->offsets[r+1] - self->offsets[r];
 
       for (j = 0; j < n; j++) {
-	dummy[i*max + j] = self->contacts[i][j];
+	k = self->contacts[self->offsets[r] + j];
+	dummy[i*max + j] = self->reorder ? self->order[k] : k;
       }
       for (; j < max; j++) {
 	dummy[i*max + j] = -1;
       }
     }
-    return PyArray_CopyFromDimsAndData(n_dims, dims, PyArray_INT, (char*) dummy);
+    attr = PyArray_CopyFromDimsAndData(n_dims, dims, PyArray_INT, (char*) dummy);
+    free(dummy);
+
+    return attr;
   }
 
   else if (!strcmp(name, "sq_distances")) {
 
-    if (!self->sq_distances) RETURN_PY_NONE;
+    if (!self->offsets) RETURN_PY_NONE;
 
     n_dims = 2;
 
@@ -468,7 +1379,8 @@ static PyObject *getattr(PyNBListObject *self, char *name) {
     
     max = 0;
     for (i = 0; i < dims[0]; i++) {
-      n = self->n_contacts[i];
+      r = self->reorder ? self->rank[i] : i;
+      n = self->offsets[r+1] - self->offsets[r];
       max = n > max ? n : max;
     }    
 
@@ -482,37 +1394,74 @@ static PyObject *getattr(PyNBListObject *self, char *name) {
     
     for (i = 0; i < dims[0]; i++) {
 
-      n = self->n_contacts[i];
+      r = self->reorder ? self->rank[i] : i;
+      n = self->offsets[r+1] - self->offsets[r];
 
       for (j = 0; j < n; j++) {
-	ddummy[i*max + j] = self->sq_distances[i][j];
+	ddummy[i*max + j] = self->sq_distances[self->offsets[r] + j];
       }
       for (; j < max; j++) {
 	ddummy[i*max + j] = -1;
       }
     }
-
-    return PyArray_CopyFromDimsAndData(n_dims, dims, PyArray_DOUBLE,
+    attr = PyArray_CopyFromDimsAndData(n_dims, dims, PyArray_DOUBLE,
 				       (char*) ddummy);
+    free(ddummy);
+
+    return attr;
   }
 
   else if (!strcmp(name, "n_contacts")) {
 
-    if (!self->n_contacts) RETURN_PY_NONE;
+    if (!self->offsets) RETURN_PY_NONE;
+
+    n_dims = 1;
+
+    dims[0] = self->n_atoms;
+
+    if (!(dummy = MALLOC(dims[0], int))) {
+      RAISE(PyExc_MemoryError, "n_contacts: MALLOC failed", NULL);
+    }
+    for (i = 0; i < dims[0]; i++) {
+      r = self->reorder ? self->rank[i] : i;
+      dummy[i] = self->offsets[r+1] - self->offsets[r];
+    }
+    attr = PyArray_CopyFromDimsAndData(n_dims, dims, PyArray_INT,
+				       (char*) dummy);
+    free(dummy);
+
+    return attr;
+  }
+
+  else if (!strcmp(name, "order")) {
+
+    if (!self->order) RETURN_PY_NONE;
 
     n_dims = 1;
 
     dims[0] = self->n_atoms;
 
     return PyArray_CopyFromDimsAndData(n_dims, dims, PyArray_INT,
-				       (char*) self->n_contacts);
+				       (char*) self->order);
+  }
+
+  else if (!strcmp(name, "offsets")) {
+
+    if (!self->offsets) RETURN_PY_NONE;
+
+    n_dims = 1;
+
+    dims[0] = self->n_atoms + 1;
+
+    return PyArray_CopyFromDimsAndData(n_dims, dims, PyArray_INT,
+				       (char*) self->offsets);
   }
 
   else if (!strcmp(name, "neighbors")) {
 
     n_dims = 1;
 
-    dims[0] = MAX_NO_NEIGHBORS;
+    dims[0] = self->n_neighbors;
 
     return PyArray_CopyFromDimsAndData(n_dims, dims, PyArray_INT,
 				       (char*) self->neighbors);
@@ -534,11 +1483,65 @@ static PyObject *getattr(PyNBListObject *self, char *name) {
     return Py_BuildValue("d", self->cellsize);
   }
   else if (!strcmp(name, "origin")) {
-    return Py_BuildValue("d", self->origin);
+    return Py_BuildValue("(ddd)", self->origin[0], self->origin[1], self->origin[2]);
+  }
+  else if (!strcmp(name, "shape")) {
+    return Py_BuildValue("(iii)", self->shape[0], self->shape[1], self->shape[2]);
   }
   else if (!strcmp(name, "n_per_cell")) {
     return Py_BuildValue("i", self->n_per_cell);
   }
+  else if (!strcmp(name, "sparse")) {
+    return Py_BuildValue("i", self->sparse);
+  }
+  else if (!strcmp(name, "reorder")) {
+    return Py_BuildValue("i", self->reorder);
+  }
+  else if (!strcmp(name, "n_threads")) {
+    return Py_BuildValue("i", self->n_threads);
+  }
+  else if (!strcmp(name, "max_per_cell")) {
+    return Py_BuildValue("i", self->max_per_cell);
+  }
+  else if (!strcmp(name, "n_resizes")) {
+    return Py_BuildValue("i", self->n_resizes);
+  }
+  else if (!strcmp(name, "skin")) {
+    return Py_BuildValue("d", self->skin);
+  }
+  else if (!strcmp(name, "n_pairs")) {
+    return Py_BuildValue("i", self->n_pairs);
+  }
+  else if (!strcmp(name, "capacity")) {
+    return Py_BuildValue("i", self->capacity);
+  }
+  else if (!strcmp(name, "incremental")) {
+    return Py_BuildValue("i", self->incremental);
+  }
+  else if (!strcmp(name, "store_pairs")) {
+    return Py_BuildValue("i", self->store_pairs);
+  }
+  else if (!strcmp(name, "bvh")) {
+    return Py_BuildValue("i", self->use_bvh);
+  }
+  else if (!strcmp(name, "segment_length")) {
+    return Py_BuildValue("i", self->segment_length);
+  }
+  else if (!strcmp(name, "n_segment_pairs")) {
+    return Py_BuildValue("i", self->bvh ? self->bvh->n_pairs : 0);
+  }
+  else if (!strcmp(name, "subdivision")) {
+    return Py_BuildValue("i", self->subdivision);
+  }
+  else if (!strcmp(name, "n_neighbors")) {
+    return Py_BuildValue("i", self->n_neighbors);
+  }
+  else if (!strcmp(name, "n_moved")) {
+    return Py_BuildValue("i", self->n_moved);
+  }
+  else if (!strcmp(name, "n_rebuilds")) {
+    return Py_BuildValue("i", self->n_rebuilds);
+  }
   else {
     return Py_FindMethod(nblist_methods, (PyObject *)self, name);
   }
@@ -546,6 +1549,8 @@ static PyObject *getattr(PyNBListObject *self, char *name) {
 
 static int setattr(PyNBListObject *self, char *name, PyObject *op) {  
 
+  int n;
+
   if (!strcmp(name, "enabled")) {
 #if PY_MAJOR_VERSION >= 3
     self->enabled = (int) PyLong_AsLong(op);
@@ -555,6 +1560,128 @@ static int setattr(PyNBListObject *self, char *name, PyObject *op) {
   }
   else if (!strcmp(name, "cellsize")) {
     self->cellsize = (double) PyFloat_AsDouble(op);
+    self->n_pairs  = -1;
+  }
+  else if (!strcmp(name, "skin")) {
+    self->skin    = (double) PyFloat_AsDouble(op);
+    self->n_pairs = -1;
+  }
+  else if (!strcmp(name, "sparse")) {
+#if PY_MAJOR_VERSION >= 3
+    self->sparse = (int) PyLong_AsLong(op) != 0;
+#else
+    self->sparse = (int) PyInt_AsLong(op) != 0;
+#endif
+    self->n_pairs = -1;
+
+    /* switch between dense grid and hash table */
+
+    if (self->filled) {
+      del_cells(self);
+      return init_cells(self, self->n_atoms);
+    }
+  }
+  else if (!strcmp(name, "reorder")) {
+#if PY_MAJOR_VERSION >= 3
+    self->reorder = (int) PyLong_AsLong(op) != 0;
+#else
+    self->reorder = (int) PyInt_AsLong(op) != 0;
+#endif
+    self->n_pairs = -1;
+
+    /* the list refers to the atoms in their original order */
+
+    if (!self->reorder && self->order) {
+      for (n = 0; n < self->n_atoms; n++) {
+	self->order[n] = self->rank[n] = n;
+      }
+    }
+  }
+  else if (!strcmp(name, "bvh")) {
+#if PY_MAJOR_VERSION >= 3
+    self->use_bvh = (int) PyLong_AsLong(op) != 0;
+#else
+    self->use_bvh = (int) PyInt_AsLong(op) != 0;
+#endif
+    self->n_pairs = -1;
+
+    /* the hierarchy refers to the atoms in their original order */
+
+    if (self->order) {
+      for (n = 0; n < self->n_atoms; n++) {
+	self->order[n] = self->rank[n] = n;
+      }
+    }
+  }
+  else if (!strcmp(name, "segment_length")) {
+#if PY_MAJOR_VERSION >= 3
+    self->segment_length = (int) PyLong_AsLong(op);
+#else
+    self->segment_length = (int) PyInt_AsLong(op);
+#endif
+    if (self->segment_length < 1) self->segment_length = 1;
+    self->n_pairs = -1;
+  }
+  else if (!strcmp(name, "subdivision")) {
+#if PY_MAJOR_VERSION >= 3
+    n = (int) PyLong_AsLong(op);
+#else
+    n = (int) PyInt_AsLong(op);
+#endif
+    if (n < 1 || n > MAX_SUBDIVISION) {
+      RAISE(PyExc_ValueError, "subdivision must be 1, 2 or 3", -1);
+    }
+    self->subdivision = n;
+    self->n_pairs = -1;
+
+    /* enforce a new layout of the dense grid */
+
+    self->shape[0] = self->shape[1] = self->shape[2] = 0;
+    set_neighbors(self);
+  }
+  else if (!strcmp(name, "incremental")) {
+#if PY_MAJOR_VERSION >= 3
+    self->incremental = (int) PyLong_AsLong(op) != 0;
+#else
+    self->incremental = (int) PyInt_AsLong(op) != 0;
+#endif
+  }
+  else if (!strcmp(name, "store_pairs")) {
+#if PY_MAJOR_VERSION >= 3
+    self->store_pairs = (int) PyLong_AsLong(op) != 0;
+#else
+    self->store_pairs = (int) PyInt_AsLong(op) != 0;
+#endif
+    /* enforce rebuild in next update */
+    self->n_pairs = -1;
+  }
+  else if (!strcmp(name, "n_threads")) {
+#if PY_MAJOR_VERSION >= 3
+    return set_nthreads(self, (int) PyLong_AsLong(op));
+#else
+    return set_nthreads(self, (int) PyInt_AsLong(op));
+#endif
+  }
+  else if (!strcmp(name, "n_rebuilds")) {
+#if PY_MAJOR_VERSION >= 3
+    self->n_rebuilds = (int) PyLong_AsLong(op);
+#else
+    self->n_rebuilds = (int) PyInt_AsLong(op);
+#endif
+  }
+  else if (!strcmp(name, "max_per_cell")) {
+#if PY_MAJOR_VERSION >= 3
+    self->max_per_cell = (int) PyLong_AsLong(op);
+#else
+    self->max_per_cell = (int) PyInt_AsLong(op);
+#endif
+  }
+  else if (!strcmp(name, "n_resizes")) {
+#if PY_MAJOR_VERSION >= 3
+    self->n_resizes = (int) PyLong_AsLong(op);
+#else
+    self->n_resizes = (int) PyInt_AsLong(op);
+#endif
   }
   else if (!strcmp(name, "n_cells")) {
 #if PY_MAJOR_VERSION >= 3
@@ -562,9 +1689,10 @@ static int setattr(PyNBListObject *self, char *name, PyObject *op) {
 #else
     self->n_cells = (int) PyInt_AsLong(op);
 #endif
+    self->n_pairs = -1;
     set_neighbors(self);
     del_cells(self);
-    init_cells(self, self->n_atoms);
+    return init_cells(self, self->n_atoms);
   }
   else if (!strcmp(name, "n_per_cell")) {
 #if PY_MAJOR_VERSION >= 3
@@ -624,17 +1752,72 @@ PyObject * PyNBList_nblist(PyObject *self, PyObject *args) {
   object = PyObject_NEW(PyNBListObject, &PyNBList_Type);
 
   object->n_cells      = 0;
+  object->shape[0]     = 0;
+  object->shape[1]     = 0;
+  object->shape[2]     = 0;
+  object->origin[0]    = 0.;
+  object->origin[1]    = 0.;
+  object->origin[2]    = 0.;
+  object->size[0]      = 0.;
+  object->size[1]      = 0.;
+  object->size[2]      = 0.;
   object->cellsize     = 0.;
   object->n_per_cell   = 0;
+  object->max_per_cell = 0;
+  object->n_resizes    = 0;
+  object->offsets      = NULL;
+  object->first        = NULL;
   object->contacts     = NULL;
   object->sq_distances = NULL;
-  object->n_contacts   = NULL;
+
+  object->first_array        = NULL;
+  object->contacts_array     = NULL;
+  object->sq_distances_array = NULL;
+
+  object->cell_of      = NULL;
+  object->reorder      = 0;
+  object->order        = NULL;
+  object->rank         = NULL;
+  object->x            = NULL;
+  object->f            = NULL;
+  object->t            = NULL;
+  object->slot         = NULL;
+  object->capacity     = 0;
+  object->n_threads    = 1;
+  object->buffers      = NULL;
+
   object->cells        = NULL;
+  object->n_table      = 0;
+  object->sparse       = 0;
   object->filled       = NULL;
   object->n_filled     = -1;
 
-  object->max_n_contacts = -1;
   object->enabled = 0;
+
+  object->skin       = 0.;
+  object->x0         = NULL;
+  object->n_pairs    = -1;
+  object->n_rebuilds = 0;
+
+  object->use_bvh        = 0;
+  object->segment_length = 8;
+  object->bvh            = NULL;
+
+  object->subdivision = 1;
+  object->n_neighbors = 0;
+
+  object->incremental = 0;
+  object->n_moved     = 0;
+  object->gridsize    = 0.;
+
+  object->store_pairs = 1;
+
+  /* serial builds also collect the pairs in a buffer */
+
+  if (set_nthreads(object, 1)) {
+    Py_DECREF(object);
+    return NULL;
+  }
   
   return (PyObject *) object;
 }
@@ -1,55 +1,143 @@
 #ifndef NBLIST_H
 #define NBLIST_H
 
-#define MAX_NO_NEIGHBORS  13     /* maximal number of neighbor cells in
-				    a cubic grid */
+#define MAX_SUBDIVISION   3      /* maximal no. of cells per cutoff */
 
-#define INDEX(i, j, k, n) (n * (n * i + j) + k)
+#define MAX_NO_NEIGHBORS  171    /* maximal number of neighbor cells in
+				    half of the stencil of a cubic grid
+				    with 'MAX_SUBDIVISION' cells per cutoff */
+
+#define INDEX(i, j, k, n) (((i) * (n)[1] + (j)) * (n)[2] + (k))
 
 #define BOX_MARGIN 1e-5
 
+/* spatial hash of integer grid coordinates used by the sparse grid */
+
+#define HASH(i, j, k) (((unsigned int) (i) * 73856093u) ^ \
+		       ((unsigned int) (j) * 19349663u) ^ \
+		       ((unsigned int) (k) * 83492791u))
+
 typedef struct _Cell {
 
-  int id;                  /* every cell has a unique id */
+  int id;                  /* every cell has a unique id (position in
+			      the dense grid or in the hash table) */
+  int index[3];            /* integer grid coordinates of the cell */
   int n_objects;           /* the no. of objects contained in the cell */
+  int capacity;            /* size of 'objects', grows on demand */
   int *objects;            /* the list of object ids */
 
 } Cell;
 
-typedef struct _PyNBListObject {
+typedef struct _PairBuffer {
 
-  PyObject_HEAD
+  int *contacts;           /* interaction partners */
+  double *sq_distances;    /* squared distances */
+  int capacity;            /* size of the buffers */
+  int n_resizes;           /* no. of times the buffers were enlarged */
 
-  int *n_contacts;         /* array that stores the number of interaction
-			      partners for each atom */
+  Cell *stencil_cell;      /* cell whose neighbor cells are stored in */
+  Cell *stencil[MAX_NO_NEIGHBORS];  /* 'stencil' (NULL if not yet looked up) */
 
-  int **contacts;
+} PairBuffer;
 
-  double **sq_distances; 
+typedef struct _PyNBListObject {
 
-  int n_cells;             /* the grid is assumed to be cubic with
-			      'n_cells' cells in each direction */
-  double cellsize;         /* the cells are assumed to be also cubic
-			      with extend 'cellsize'. */
+  PyObject_HEAD
+
+  int *offsets;            /* compressed sparse row layout: the interaction
+			      partners of atom 'i' are stored in 'contacts'
+			      from 'offsets[i]' to 'offsets[i+1]' */
+  int *first;              /* flat buffer of first atoms of all pairs */
+  int *contacts;           /* flat buffer of interaction partners */
+
+  double *sq_distances;    /* flat buffer of squared distances */
+
+  PyArrayObject *first_array;        /* numpy arrays owning the flat */
+  PyArrayObject *contacts_array;     /* buffers; views of the pairs   */
+  PyArrayObject *sq_distances_array; /* keep them alive if the list grows */
+
+  int reorder;             /* flag indicating that the atoms are sorted
+			      along a space-filling curve (Morton order)
+			      such that atoms in the same or neighboring
+			      cells are close in memory; the list then
+			      refers to the sorted atoms */
+  int *order;              /* atom stored at a given position in sorted
+			      order */
+  int *rank;               /* position of an atom in sorted order */
+  double *x;               /* coordinates in sorted order */
+  double *f;               /* forces in sorted order */
+  int *t;                  /* atom types in sorted order */
+
+  Cell **cell_of;          /* cell to which an atom has been assigned */
+  int *slot;               /* position of an atom in its cell */
+
+  int n_cells;             /* the dense grid has at most 'n_cells^3'
+			      cells */
+  int shape[3];            /* no. of cells along each axis such that the
+			      grid fits the bounding box */
+  double cellsize;         /* the cells are assumed to be cubic with
+			      extend 'cellsize'. */
   int n_atoms;             /* no. of atoms (private variable), needed to
 			      to allocate the interaction lists */
-  int n_per_cell;          /* the max. no. of atoms that can be stored
-			      in one grid-cell. */
+  int n_per_cell;          /* initial no. of atoms that can be stored
+			      in one grid-cell, cells grow if needed */
+  int max_per_cell;        /* max. no. of atoms found in a single cell */
+  int n_resizes;           /* no. of times a cell or the contact buffers
+			      had to be enlarged */
   int n_filled;            /* number of cells that contain at least 
 			      one atom */
-  int max_n_contacts;      /* internal variable that stores the maximal
-			      number of interaction partners for one
-			      atom, this will be the 2nd dimension of
-			      interactionList */
+  int capacity;            /* size of the flat buffers, which grow
+			      geometrically if more pairs are found */
+
+  int n_threads;           /* no. of threads used to build the list */
+  PairBuffer *buffers;     /* contact buffers of the individual threads */
   Cell **cells;            /* pointers to a grid of cells (most of them 
-			      will point to NULL) */
+			      will point to NULL) or hash table of the
+			      non-empty cells if the grid is sparse */
+  int n_table;             /* size of 'cells' */
+  int sparse;              /* flag indicating that the occupied cells
+			      are stored in a hash table rather than in
+			      a dense grid */
   Cell *filled;            /* list of the non-empty cells for some state */
 
   int enabled;
 
-  double origin;           // origin of bounding box
+  double origin[3];        // origin of bounding box
+  double size[3];          // extent of bounding box along each axis
+
+  double skin;             /* Verlet buffer: pairs are listed up to a
+			      distance of 'cellsize + skin' and the list
+			      is only rebuilt once a particle has moved
+			      more than 'skin / 2' */
+  double *x0;              /* positions at the last rebuild */
+  int n_pairs;             /* number of pairs found in the last rebuild */
+  int n_rebuilds;          /* number of times the list was rebuilt */
+
+  int incremental;         /* flag indicating that the cells are kept
+			      between rebuilds and only atoms that left
+			      their cell are moved */
+  int n_moved;             /* no. of atoms assigned in the last rebuild */
+  double gridsize;         /* edge length of the cells in the last
+			      assignment (cellsize + skin, possibly
+			      increased to fit the dense grid) */
   
+  int use_bvh;             /* flag indicating that pairs are found with a
+			      bounding volume hierarchy over segments of
+			      the chain rather than with the cell grid */
+  int segment_length;      /* no. of consecutive atoms per segment */
+  BVH *bvh;                /* hierarchy over segments */
+
+  int subdivision;         /* no. of cells per cutoff, the stencil
+			      reaches 'subdivision' cells in each
+			      direction */
+  int n_neighbors;         /* no. of neighbor cells in the stencil */
   int neighbors[MAX_NO_NEIGHBORS];
+  int neighbor_index[MAX_NO_NEIGHBORS][3];
+
+  int store_pairs;         /* flag indicating that the pairs are stored;
+			      otherwise only the cells are updated and the
+			      partners of every atom are collected while
+			      the interactions are evaluated */
 
 } PyNBListObject;
 
@@ -57,4 +145,10 @@ extern PyTypeObject PyNBList_Type;
 
 PyObject * PyNBList_nblist(PyObject *self, PyObject *args);
 
+void nblist_gather(PyNBListObject *self, double *coords, int *types, int n);
+int  nblist_is_listfree(PyNBListObject *self);
+int  nblist_partners(PyNBListObject *self, vector *positions, int atom_id, PairBuffer *row);
+void nblist_free_row(PairBuffer *row);
+void nblist_scatter(PyNBListObject *self, double *forces, int n);
+
 #endif
@@ -27,13 +27,52 @@ static double prolsq_gradient(PyForceFieldObject *_self, double d, double d0, do
     c = (d0 - d);
     c *= k * c * c;
 
-    *E += (d0 - d) * c;
+    *E += (d0 - d) * c / 2.;
 
     c *= - 2 / d;
   }
   return c;
 }
 
+#define N_PARAMS 2
+
+static void prolsq_params(PyProlsqObject *self, double *params) {
+  /*
+    Constants of every type pair: sum of radii and force constant.
+   */
+  int index;
+
+  for (index = 0; index < self->n_types * self->n_types; index++) {
+    params[N_PARAMS * index + 0] = self->d[index];
+    params[N_PARAMS * index + 1] = self->k[index];
+  }
+}
+
+static double prolsq_kernel(PyProlsqObject *self, PairBlock *block) {
+  /*
+    Evaluates all pairs of a block without branches.
+   */
+  double *d0 = block->p[0];
+  double *k  = block->p[1];
+
+  double E=0., r, a, b;
+  int m;
+
+#pragma omp simd private(r, a, b) reduction(+:E)
+  for (m = 0; m < block->n; m++) {
+
+    r = sqrt(block->r2[m]);
+
+    a = d0[m] - r;
+    a = a > 0. ? a : 0.;
+    b = k[m] * a * a * a;
+
+    block->c[m] = -2 * b / r;
+    E += a * b / 2.;
+  }
+  return E;
+}
+
 static double energy(PyProlsqObject *self, 
 		     double *coords, 
 		     int *types, 
@@ -53,49 +92,11 @@ static int gradient(PyProlsqObject *self,
 }
 
 static PyObject * py_energy(PyProlsqObject *self, PyObject *args) {
-  
-  PyArrayObject *coords, *types;
-
-  if (!PyArg_ParseTuple(args, "O!O!", &PyArray_Type, &coords, &PyArray_Type, &types)) {
-    RAISE(PyExc_ValueError, "numpy arrays storing coordinates and atom types expected.", NULL);
-  }
-  return Py_BuildValue("d", forcefield_energy((PyForceFieldObject*)self, 
-					      (double*) coords->data, 
-					      (int*) types->data,
-					      types->dimensions[0]));
+  return forcefield_py_energy((PyForceFieldObject*)self, args);
 }
 
 static PyObject * py_update_gradient(PyProlsqObject *self, PyObject *args) {
-  
-  int calculate_energy = 0;
-  PyArrayObject *coords, *forces, *types;
-  double E;
-
-  if (!PyArg_ParseTuple(args, "O!O!O!i", 
-			&PyArray_Type, &coords, 
-			&PyArray_Type, &forces, 
-			&PyArray_Type, &types, 
-			&calculate_energy)) {
-    RAISE(PyExc_TypeError, "numpy arrays storing coordinates, forces and atom types expected.", NULL);
-  }
-  if (calculate_energy) {
-    gradient(self, 
-	     (double*) coords->data, 
-	     (double*) forces->data, 
-	     (int*) types->data, 
-	     types->dimensions[0],
-	     &E);
-    return Py_BuildValue("d", E);
-  }
-  else {
-    gradient(self, 
-	     (double*) coords->data, 
-	     (double*) forces->data, 
-	     (int*) types->data, 
-	     types->dimensions[0],
-	     NULL);
-    RETURN_PY_NONE;
-  }
+  return forcefield_py_update_gradient((PyForceFieldObject*)self, args);
 }
 
 static PyMethodDef methods[] = {
@@ -183,5 +184,11 @@ PyObject * PyProlsq_New(PyObject *self, PyObject *args) {
   ob->f      = (forcefield_energyterm) prolsq_energy;
   ob->grad_f = (forcefield_gradenergyterm) prolsq_gradient;
 
+  /* specialized pair kernel */
+
+  ob->n_params   = N_PARAMS;
+  ob->kernel     = (forcefield_pairkernel) prolsq_kernel;
+  ob->set_params = (forcefield_paramfunc) prolsq_params;
+
   return (PyObject*) ob;
 }
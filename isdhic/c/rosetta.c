@@ -64,7 +64,7 @@ static double rosetta_gradient(PyForceFieldObject *_self, double d, double d0, d
     a*= a*a;	
     a*= (2-a) / (r_max-r_lin);
     
-    *E += k * a * (d - r_lin);    
+    *E += k * a * (d - r_max);
     dE  = k * a / d;
   }
   else if (r_sw * d0 < d) {
@@ -89,6 +89,96 @@ static double rosetta_gradient(PyForceFieldObject *_self, double d, double d0, d
   return dE;
 }
 
+#define N_PARAMS 6
+
+static void rosetta_params(PyRosettaObject *self, double *params) {
+  /*
+    Constants of every type pair: squared sum of radii, force constant,
+    slope of the linear tail, switching distance and slope and offset of
+    the linear ramp at short distances.
+   */
+  int index;
+  double a, d0, k, *p;
+
+  double r_max = self->r_max;
+  double r_lin = self->r_lin;
+  double r_sw  = self->r_sw;      
+
+  for (index = 0; index < self->n_types * self->n_types; index++) {
+
+    d0 = self->d[index];
+    k  = self->k[index];
+    p  = params + N_PARAMS * index;
+
+    p[0] = d0 * d0;
+    p[1] = k;
+
+    a = d0 / r_lin;
+    a*= a;
+    a*= a*a;	
+
+    p[2] = k * a * (2-a) / (r_max-r_lin);
+    p[3] = r_sw * d0;
+
+    a = 1. / r_sw;
+    a*= a * a;
+    a*= a;
+
+    p[4] = -12 * k * (a - 1) * a / (r_sw * d0);
+    p[5] = k * (13 * a - 14) * a;
+  }
+}
+
+static double rosetta_kernel(PyRosettaObject *self, PairBlock *block) {
+  /*
+    Evaluates all pairs of a block without branches: the energy and
+    gradient factor of the Lennard-Jones term are overwritten by those
+    of the linear ramps and the cutoff.
+   */
+  double r_max = self->r_max;
+  double r_lin = self->r_lin;
+
+  double *d2   = block->p[0];
+  double *k    = block->p[1];
+  double *lin  = block->p[2];
+  double *r_sw = block->p[3];
+  double *sw   = block->p[4];
+  double *sw0  = block->p[5];
+
+  double E=0., r2, r, q, a, e, c, e_sw, e_lin;
+  int m;
+
+#pragma omp simd private(r2, r, q, a, e, c, e_sw, e_lin) reduction(+:E)
+  for (m = 0; m < block->n; m++) {
+
+    r2 = block->r2[m];
+    r  = sqrt(r2);
+    q  = 1. / r;
+
+    a = d2[m] * q * q;
+    a*= a * a;
+
+    e = k[m] * (a - 2) * a;
+    c = -12 * k[m] * (a - 1) * a * q * q;
+
+    e_sw  = sw[m] * r + sw0[m];
+    e_lin = lin[m] * (r - r_max);
+
+    e = r <= r_sw[m] ? e_sw : e;
+    c = r <= r_sw[m] ? sw[m] * q : c;
+
+    e = r >= r_lin ? e_lin : e;
+    c = r >= r_lin ? lin[m] * q : c;
+
+    e = r > r_max ? 0. : e;
+    c = r > r_max ? 0. : c;
+
+    block->c[m] = c;
+    E += e;
+  }
+  return E;
+}
+
 static double energy(PyRosettaObject *self, 
 		     double *coords, 
 		     int *types, 
@@ -108,49 +198,11 @@ static int gradient(PyRosettaObject *self,
 }
 
 static PyObject * py_energy(PyRosettaObject *self, PyObject *args) {
-  
-  PyArrayObject *coords, *types;
-
-  if (!PyArg_ParseTuple(args, "O!O!", &PyArray_Type, &coords, &PyArray_Type, &types)) {
-    RAISE(PyExc_ValueError, "numpy arrays storing coordinates and atom types expected.", NULL);
-  }
-  return Py_BuildValue("d", forcefield_energy((PyForceFieldObject*)self, 
-					      (double*) coords->data, 
-					      (int*) types->data,
-					      types->dimensions[0]));
+  return forcefield_py_energy((PyForceFieldObject*)self, args);
 }
 
 static PyObject * py_update_gradient(PyRosettaObject *self, PyObject *args) {
-  
-  int calculate_energy = 0;
-  PyArrayObject *coords, *forces, *types;
-  double E;
-
-  if (!PyArg_ParseTuple(args, "O!O!O!i", 
-			&PyArray_Type, &coords, 
-			&PyArray_Type, &forces, 
-			&PyArray_Type, &types, 
-			&calculate_energy)) {
-    RAISE(PyExc_TypeError, "numpy arrays storing coordinates, forces and atom types expected.", NULL);
-  }
-  if (calculate_energy) {
-    gradient(self, 
-	     (double*) coords->data, 
-	     (double*) forces->data, 
-	     (int*) types->data, 
-	     types->dimensions[0],
-	     &E);
-    return Py_BuildValue("d", E);
-  }
-  else {
-    gradient(self, 
-	     (double*) coords->data, 
-	     (double*) forces->data, 
-	     (int*) types->data, 
-	     types->dimensions[0],
-	     NULL);
-    RETURN_PY_NONE;
-  }
+  return forcefield_py_update_gradient((PyForceFieldObject*)self, args);
 }
 
 static PyMethodDef methods[] = {
@@ -257,5 +309,11 @@ PyObject * PyRosetta_New(PyObject *self, PyObject *args) {
   ob->f      = (forcefield_energyterm) rosetta_energy;
   ob->grad_f = (forcefield_gradenergyterm) rosetta_gradient;
 
+  /* specialized pair kernel */
+
+  ob->n_params   = N_PARAMS;
+  ob->kernel     = (forcefield_pairkernel) rosetta_kernel;
+  ob->set_params = (forcefield_paramfunc) rosetta_params;
+
   return (PyObject*) ob;
 }
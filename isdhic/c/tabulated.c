@@ -0,0 +1,319 @@
+#define NO_IMPORT_ARRAY
+
+#include "isdhic.h"
+
+/*
+  Pairwise potential given by a cubic spline in the squared distance. For
+  every type pair, the spline is stored as 'n_bins' polynomials of third
+  degree in the fractional position within a bin:
+
+    E(s) = c[0] + t * (c[1] + t * (c[2] + t * c[3]))
+
+  where 's = r^2', 't = s / h - i' and 'h = r_max^2 / n_bins'. The
+  potential vanishes beyond 'r_max' and is scaled by the force constant.
+ */
+
+#define N_PARAMS 2
+
+static double tabulated_lookup(PyTabulatedObject *self, double s, int index, double *dE) {
+  /*
+    Evaluates the spline and its derivative with respect to 's'.
+   */
+  double h = self->r_max * self->r_max / self->n_bins;
+  double x = s / h, t, *c;
+  int i = (int) x;
+
+  if (i >= self->n_bins) {
+    *dE = 0.;
+    return 0.;
+  }
+  t = x - i;
+  c = self->table + 4 * (index * self->n_bins + i);
+
+  *dE = (c[1] + t * (2 * c[2] + 3 * t * c[3])) / h;
+
+  return c[0] + t * (c[1] + t * (c[2] + t * c[3]));
+}
+
+static void tabulated_params(PyTabulatedObject *self, double *params) {
+  /*
+    Constants of every type pair: offset of the spline and force constant.
+   */
+  int index;
+
+  for (index = 0; index < self->n_types * self->n_types; index++) {
+    params[N_PARAMS * index + 0] = 4 * index * self->n_bins;
+    params[N_PARAMS * index + 1] = self->k[index];
+  }
+}
+
+static double tabulated_kernel(PyTabulatedObject *self, PairBlock *block) {
+  /*
+    Evaluates all pairs of a block by table lookup without square roots
+    or branches.
+   */
+  double *offset = block->p[0];
+  double *k      = block->p[1];
+  double *table  = self->table;
+
+  double s_max = self->r_max * self->r_max;
+  double inv_h = self->n_bins / s_max;
+
+  double E=0., s, x, t, e, de, *c;
+  int m, i, last = self->n_bins - 1;
+
+#pragma omp simd private(s, x, t, e, de, c, i) reduction(+:E)
+  for (m = 0; m < block->n; m++) {
+
+    s = block->r2[m];
+
+    x = s * inv_h;
+    i = (int) x;
+    i = i < last ? i : last;
+    t = x - i;
+    c = table + (int) offset[m] + 4 * i;
+
+    e  = c[0] + t * (c[1] + t * (c[2] + t * c[3]));
+    de = (c[1] + t * (2 * c[2] + 3 * t * c[3])) * inv_h;
+
+    /* gradient factor: dE/dr / r = 2 dE/ds */
+
+    block->c[m] = s < s_max ? 2 * k[m] * de : 0.;
+    E += s < s_max ? k[m] * e : 0.;
+  }
+  return E;
+}
+
+static double energy(PyTabulatedObject *self,
+		     double *coords,
+		     int *types,
+		     int n_particles) {
+
+  return forcefield_energy((PyForceFieldObject*)self, coords, types, n_particles);
+}
+
+static int gradient(PyTabulatedObject *self,
+		    double *coords,
+		    double *forces,
+		    int *types,
+		    int n_particles,
+		    double *E_ptr) {
+
+  return forcefield_gradient((PyForceFieldObject*)self, coords, forces, types, n_particles, E_ptr);
+}
+
+static PyObject * py_energy(PyTabulatedObject *self, PyObject *args) {
+
+  if (!self->table) {
+    RAISE(PyExc_ValueError, "table has not been set.", NULL);
+  }
+  return forcefield_py_energy((PyForceFieldObject*)self, args);
+}
+
+static PyObject * py_update_gradient(PyTabulatedObject *self, PyObject *args) {
+
+  if (!self->table) {
+    RAISE(PyExc_ValueError, "table has not been set.", NULL);
+  }
+  return forcefield_py_update_gradient((PyForceFieldObject*)self, args);
+}
+
+static PyObject * py_lookup(PyTabulatedObject *self, PyObject *args) {
+  /*
+    Returns energy and derivative with respect to the squared distance
+    of a type pair (without force constant).
+   */
+  int i, j;
+  double s, E, dE;
+
+  if (!PyArg_ParseTuple(args, "dii", &s, &i, &j)) {
+    RAISE(PyExc_TypeError, "squared distance and two atom types expected.", NULL);
+  }
+  if (!self->table) {
+    RAISE(PyExc_ValueError, "table has not been set.", NULL);
+  }
+  if (i < 0 || j < 0 || i >= self->n_types || j >= self->n_types) {
+    RAISE(PyExc_IndexError, "atom type out of range.", NULL);
+  }
+  E = tabulated_lookup(self, s, i * self->n_types + j, &dE);
+
+  return Py_BuildValue("dd", E, dE);
+}
+
+static PyMethodDef methods[] = {
+  {"update_gradient", (PyCFunction) py_update_gradient, 1},
+  {"energy", (PyCFunction) py_energy, 1},
+  {"lookup", (PyCFunction) py_lookup, 1},
+  {NULL, NULL }
+};
+
+static void del_table(PyTabulatedObject *self) {
+
+  if (self->table) free(self->table);
+  self->table = NULL;
+}
+
+static int set_table(PyTabulatedObject *self, PyObject *op) {
+
+  int i, size;
+  double *table;
+
+  PyArrayObject *T;
+
+  if (!PyArray_Check(op)) {
+    RAISE(PyExc_TypeError, "numpy array expected (set_table).", -1);
+  }
+  if (!(T = (PyArrayObject*) PyArray_ContiguousFromObject(op, PyArray_DOUBLE, 4, 4))) {
+    return -1;
+  }
+  if ((T->dimensions[0] != self->n_types) || (T->dimensions[1] != self->n_types) ||
+      (T->dimensions[2] != self->n_bins)  || (T->dimensions[3] != 4)) {
+    Py_DECREF(T);
+    RAISE(PyExc_ValueError, "shape must be (n_types, n_types, n_bins, 4).", -1);
+  }
+  size = self->n_types * self->n_types * self->n_bins * 4;
+
+  if (!(table = MALLOC(size, double))) {
+    Py_DECREF(T);
+    RAISE(PyExc_MemoryError, "malloc failed (set_table)", -1);
+  }
+  for (i = 0; i < size; i++) table[i] = ((double*) T->data)[i];
+
+  Py_DECREF(T);
+
+  del_table(self);
+  self->table = table;
+
+  return 0;
+}
+
+static void dealloc(PyTabulatedObject *self) {
+  del_table(self);
+  forcefield_dealloc((PyForceFieldObject*) self);
+  PyObject_Del(self);
+}
+
+static PyObject *getattr(PyTabulatedObject *self, char *name) {
+
+  PyObject *attr=NULL;
+  int dims[4];
+
+  if (!strcmp(name, "r_max")) {
+    return Py_BuildValue("d", self->r_max);
+  }
+  else if (!strcmp(name, "n_bins")) {
+    return Py_BuildValue("i", self->n_bins);
+  }
+  else if (!strcmp(name, "table")) {
+    if (self->table) {
+      dims[0] = dims[1] = self->n_types;
+      dims[2] = self->n_bins;
+      dims[3] = 4;
+
+      return PyArray_CopyFromDimsAndData(4, dims, PyArray_DOUBLE, (char *) self->table);
+    }
+    else RETURN_PY_NONE;
+  }
+  else {
+    attr = forcefield_getattr((PyForceFieldObject*)self, name);
+    if (!attr) {
+      return Py_FindMethod(methods, (PyObject *)self, name);
+    }
+    else {
+      return attr;
+    }
+  }
+}
+
+static int setattr(PyTabulatedObject *self, char *name, PyObject *op) {
+
+  int n_types = self->n_types, n_bins;
+
+  if (!strcmp(name, "r_max")) {
+    self->r_max = (double) PyFloat_AsDouble(op);
+  }
+  else if (!strcmp(name, "n_bins")) {
+#if PY_MAJOR_VERSION >= 3
+    n_bins = (int) PyLong_AsLong(op);
+#else
+    n_bins = (int) PyInt_AsLong(op);
+#endif
+    if (n_bins < 1) {
+      RAISE(PyExc_ValueError, "number of bins must be positive", -1);
+    }
+    if (n_bins != self->n_bins) {
+      del_table(self);
+      self->n_bins = n_bins;
+    }
+  }
+  else if (!strcmp(name, "table")) {
+    return set_table(self, op);
+  }
+  else if (!forcefield_setattr((PyForceFieldObject*)self, name, op)) {
+    RAISE(PyExc_AttributeError, "Attribute does not exist or cannot be set", -1);
+  }
+  if (self->n_types != n_types) del_table(self);
+
+  return 0;
+}
+
+static char __doc__[] = "tabulated forcefield";
+
+PyTypeObject PyTabulated_Type = {
+  PyObject_HEAD_INIT(0)
+  0,			       /*ob_size*/
+  "tabulated",	               /*tp_name*/
+  sizeof(PyTabulatedObject),   /*tp_basicsize*/
+  0,			       /*tp_itemsize*/
+
+  (destructor)dealloc,         /*tp_dealloc*/
+  (printfunc)NULL,	       /*tp_print*/
+  (getattrfunc)getattr,        /*tp_getattr*/
+  (setattrfunc)setattr,        /*tp_setattr*/
+#if PY_MAJOR_VERSION < 3
+  (cmpfunc)NULL,               /*tp_compare*/
+#endif
+  (reprfunc)NULL,	       /*tp_repr*/
+
+  NULL,		               /*tp_as_number*/
+  NULL,	                       /*tp_as_sequence*/
+  NULL,		 	       /*tp_as_mapping*/
+
+  (hashfunc)0,		       /*tp_hash*/
+  (ternaryfunc)0,	       /*tp_call*/
+  (reprfunc)0,		       /*tp_str*/
+
+  0L,0L,0L,0L,
+  __doc__                        /* Documentation string */
+};
+
+PyObject * PyTabulated_New(PyObject *self, PyObject *args) {
+
+  PyTabulatedObject *ob;
+
+  if (!PyArg_ParseTuple(args, "")) return NULL;
+
+  ob = PyObject_NEW(PyTabulatedObject, &PyTabulated_Type);
+
+  forcefield_init((PyForceFieldObject*)ob);
+
+  ob->r_max  = 1.;
+  ob->n_bins = 1;
+  ob->table  = NULL;
+
+  /* set energy and gradient function pointers; there is no energy
+     term per pair, the interactions are always evaluated with the
+     pair kernel */
+
+  ob->energy   = (forcefield_energyfunc) energy;
+  ob->gradient = (forcefield_gradientfunc) gradient;
+
+  ob->f      = NULL;
+  ob->grad_f = NULL;
+
+  ob->n_params   = N_PARAMS;
+  ob->kernel     = (forcefield_pairkernel) tabulated_kernel;
+  ob->set_params = (forcefield_paramfunc) tabulated_params;
+
+  return (PyObject*) ob;
+}
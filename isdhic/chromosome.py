@@ -9,6 +9,7 @@ from .model import Probability, Normal, LowerUpper, Logistic, Relu
 from .params import Forces, Coordinates, Parameters, ModelDistances, RadiusOfGyration
 from .posterior import PosteriorCoordinates
 from .forcefield import ForcefieldFactory
+from .core import set_n_threads
 
 class ChromosomeSimulation(object):
 
@@ -24,9 +25,19 @@ class ChromosomeSimulation(object):
         self.steepness     = settings.get('steepness', 100.)
         self.factor        = settings.get('factor', 1.5)
         self.contact_model = settings.get('contact_model','logistic')
+        self.skin          = settings.get('skin', 0.)
+        self.autotune      = settings.get('autotune', 1000)
+        self.n_threads     = settings.get('n_threads', 1)
+        self.dtype         = settings.get('dtype', np.float64)
         
         self._universe = None
         self._params   = None
+
+        ## the restraint kernels use the global number of threads, which
+        ## is only changed on request
+
+        if 'n_threads' in settings:
+            set_n_threads(self.n_threads)
         
     @property
     def universe(self):
@@ -48,7 +59,7 @@ class ChromosomeSimulation(object):
     
     def create_universe(self):
 
-        self._universe = create_universe(self.n_particles)
+        self._universe = create_universe(self.n_particles, dtype=self.dtype)
 
     def create_params(self):
 
@@ -66,6 +77,11 @@ class ChromosomeSimulation(object):
             self.forcefield, self.universe)
         forcefield.d = np.array([[self.diameter]])
         forcefield.k = np.array([[self.k_forcefield]])
+        forcefield.nblist.skin = self.skin
+        forcefield.autotune_every = self.autotune
+        forcefield.n_threads = self.n_threads
+        forcefield.nblist.n_threads = self.n_threads
+        forcefield.autotune()
 
         prior = TsallisEnsemble('tsallis', forcefield, self.params)
         prior.beta   = self.beta
@@ -83,17 +99,17 @@ class ChromosomeSimulation(object):
 
         return lowerupper
 
-    def create_contacts(self, pairs, name='contacts', model='logistic'):
+    def create_contacts(self, pairs, name='contacts', model='logistic', weights=None):
 
         threshold = np.ones(len(pairs)) * self.factor * self.diameter
-        contacts  = ModelDistances(pairs, name)
+        contacts  = ModelDistances(pairs, name, sort=True)
 
         if model == 'logistic':
             return Logistic(contacts.name, threshold, contacts,
-                            self.steepness, params=self.params)
+                            self.steepness, params=self.params, weights=weights)
         elif model == 'relu':
             return Relu(contacts.name, threshold, contacts,
-                        self.steepness, params=self.params)
+                        self.steepness, params=self.params, weights=weights)
         else:
             raise ValueError(model)
 
@@ -104,7 +120,7 @@ class ChromosomeSimulation(object):
 
         return normal
 
-    def create_chromosome(self, contacts):
+    def create_chromosome(self, contacts, counts=None):
 
         self.create_universe()
         self.create_params()
@@ -112,7 +128,8 @@ class ChromosomeSimulation(object):
         priors = (self.create_prior(),)
 
         likelihoods = (self.create_chain(),
-                       self.create_contacts(contacts, model=self.contact_model),
+                       self.create_contacts(contacts, model=self.contact_model,
+                                            weights=counts),
                        self.create_radius_of_gyration())
 
         posterior = PosteriorCoordinates(
@@ -15,6 +15,25 @@ def format_time(t):
         
     return '{0:.1f} {1}'.format(t/scale, unit)
 
+## number of threads used to evaluate distances and restraints
+
+_n_threads = 1
+
+def set_n_threads(n_threads):
+    """
+    Set the number of threads used by the kernels that evaluate distances
+    and restraints (forcefields and neighbor lists have their own setting).
+    """
+    global _n_threads
+    _n_threads = max(1, int(n_threads))
+
+def get_n_threads():
+    """
+    Number of threads used by the kernels that evaluate distances and
+    restraints.
+    """
+    return _n_threads
+
 @contextlib.contextmanager
 def take_time(desc):
     t0 = time.clock()
@@ -60,6 +60,19 @@ class HiCData(object):
 
         self.__init__(unique)
 
+    def unique_contacts(self):
+        """
+        Returns the distinct contacts and the number of times each of them
+        occurs. Equivalent contacts (e.g. (1,2) and (2,1)) are counted as
+        the same contact. After coarsening, many contacts are mapped onto
+        the same pair of beads; restraining the distinct contacts weighted
+        by their counts is equivalent to restraining all contacts.
+        """
+        contacts = np.sort(np.reshape(self.data, (-1,2)), 1)
+        pairs, counts = np.unique(contacts, axis=0, return_counts=True)
+
+        return map(tuple, pairs), counts
+
     def coarsen(self, n_beads, chrsize):
 
         scale  = n_beads / float(chrsize)
@@ -1,7 +1,20 @@
+# distutils: extra_compile_args = -fopenmp
+# distutils: extra_link_args = -fopenmp
+"""
+Distances between pairs of particles and their contribution to the
+forces. Coordinates and forces can be stored in single or double
+precision; distances are always returned in double precision.
+
+With several threads, every thread scatters the forces of its pairs into
+a private buffer and the buffers are summed in the end.
+"""
 import numpy
 cimport numpy
 cimport cython
 
+from cython cimport floating
+from cython.parallel cimport prange, parallel, threadid
+
 DTYPE_FLOAT = numpy.float
 ctypedef numpy.float_t DTYPE_FLOAT_t
 
@@ -14,13 +27,13 @@ ctypedef numpy.double_t DTYPE_DOUBLE_t
 DTYPE_LONG = numpy.long
 ctypedef numpy.long_t DTYPE_LONG_t
 
-cdef extern from "math.h":
+cdef extern from "math.h" nogil:
     double sqrt(double)
 
 @cython.cdivision(True)
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def calc_distances(double [::1] coords,
+def calc_distances(floating [::1] coords,
                    int [::1] indices1,
                    int [::1] indices2):
 
@@ -50,61 +63,120 @@ def calc_distances(double [::1] coords,
 @cython.cdivision(True)
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def calc_data(double [::1] coords,
+def calc_data(floating [::1] coords,
               int [::1] first_index,
               int [::1] second_index,
-              double [::1] mock):
+              double [::1] mock,
+              int n_threads=1):
 
     cdef Py_ssize_t i, j, n
     cdef int N = len(first_index)
     cdef double d, x
 
-    for n in range(N):
+    if n_threads < 2:
 
-        i = first_index[n]
-        j = second_index[n]
+        for n in range(N):
 
-        x = coords[3*i+0] - coords[3*j+0]
-        d = x * x
+            i = first_index[n]
+            j = second_index[n]
 
-        x = coords[3*i+1] - coords[3*j+1]
-        d+= x * x
+            x = coords[3*i+0] - coords[3*j+0]
+            d = x * x
 
-        x = coords[3*i+2] - coords[3*j+2]
-        d+= x * x
+            x = coords[3*i+1] - coords[3*j+1]
+            d+= x * x
+
+            x = coords[3*i+2] - coords[3*j+2]
+            d+= x * x
+
+            mock[n] = sqrt(d)
+
+        return
+
+    with nogil:
+        for n in prange(N, num_threads=n_threads, schedule='static'):
+
+            i = first_index[n]
+            j = second_index[n]
+
+            x = coords[3*i+0] - coords[3*j+0]
+            d = x * x
+
+            x = coords[3*i+1] - coords[3*j+1]
+            d = d + x * x
+
+            x = coords[3*i+2] - coords[3*j+2]
+            d = d + x * x
 
-        mock[n] = sqrt(d)
+            mock[n] = sqrt(d)
 
 @cython.cdivision(True)
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def update_forces(double [::1] coords,
+def update_forces(floating [::1] coords,
                   int [::1] first_index,
                   int [::1] second_index,
                   double [::1] mock,
                   double [::1] gradient,
-                  double [::1] forces):
+                  floating [::1] forces,
+                  int n_threads=1):
 
-    cdef Py_ssize_t i, j, n
-    cdef int N = len(first_index)
-    cdef double c, d, x
+    cdef Py_ssize_t i, j, k, n, t
+    cdef int N = len(first_index), M = len(forces)
+    cdef double c, d, x, f
+    cdef double [:, ::1] buffers
 
-    for n in range(N):
+    if n_threads < 2:
 
-        i = first_index[n]
-        j = second_index[n]
-        c = gradient[n] / mock[n]
+        for n in range(N):
 
-        x = coords[3*i+0] - coords[3*j+0]
-        forces[3*i+0] += c * x
-        forces[3*j+0] -= c * x
-        
-        x = coords[3*i+1] - coords[3*j+1]
-        forces[3*i+1] += c * x
-        forces[3*j+1] -= c * x
+            i = first_index[n]
+            j = second_index[n]
+            c = gradient[n] / mock[n]
+
+            x = coords[3*i+0] - coords[3*j+0]
+            forces[3*i+0] += c * x
+            forces[3*j+0] -= c * x
         
-        x = coords[3*i+2] - coords[3*j+2]
-        forces[3*i+2] += c * x
-        forces[3*j+2] -= c * x
+            x = coords[3*i+1] - coords[3*j+1]
+            forces[3*i+1] += c * x
+            forces[3*j+1] -= c * x
         
+            x = coords[3*i+2] - coords[3*j+2]
+            forces[3*i+2] += c * x
+            forces[3*j+2] -= c * x
 
+        return
+
+    buffers = numpy.zeros((n_threads, M))
+
+    with nogil, parallel(num_threads=n_threads):
+
+        t = threadid()
+
+        for n in prange(N, schedule='static'):
+
+            i = first_index[n]
+            j = second_index[n]
+            c = gradient[n] / mock[n]
+
+            x = coords[3*i+0] - coords[3*j+0]
+            buffers[t,3*i+0] += c * x
+            buffers[t,3*j+0] -= c * x
+        
+            x = coords[3*i+1] - coords[3*j+1]
+            buffers[t,3*i+1] += c * x
+            buffers[t,3*j+1] -= c * x
+        
+            x = coords[3*i+2] - coords[3*j+2]
+            buffers[t,3*i+2] += c * x
+            buffers[t,3*j+2] -= c * x
+
+    ## sum the private forces of all threads
+
+    with nogil:
+        for k in prange(M, num_threads=n_threads, schedule='static'):
+            f = 0.
+            for t in range(n_threads):
+                f = f + buffers[t,k]
+            forces[k] += f
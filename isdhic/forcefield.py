@@ -5,30 +5,79 @@ PROLSQ uses a quartic repulsion term to penalize particle-particle
 clashses.
 
 ROSETTA is a linearly ramped Lennard-Jones potential.
+
+TABULATED is an arbitrary pairwise potential that is interpolated by
+cubic splines.
 """
 import numpy as np
 
-from ._isdhic import prolsq, rosetta
+from ._isdhic import prolsq, rosetta, tabulated
 from .nblist import NBList
 from .core import ctypeproperty, CWrapper, Nominable
 
+class parameterproperty(ctypeproperty):
+    """
+    Property decorator for parameters of a force field. Setting a parameter
+    clears the cached energy and gradient.
+    """
+    def __set__(self, instance, value):
+        super(parameterproperty, self).__set__(instance, value)
+        instance.clear_cache()
+
 class Forcefield(Nominable, CWrapper):
     """Forcefield
 
     Non-bonded force field enforcing volume exclusion. 
     """
-    @ctypeproperty(np.array)
+    @parameterproperty(np.array)
     def k():
         pass
 
-    @ctypeproperty(np.array)
+    @parameterproperty(np.array)
     def d():
         pass
 
-    @ctypeproperty(int)
+    @parameterproperty(int)
     def n_types():
         pass
 
+    @parameterproperty(float)
+    def K():
+        """
+        Overall force constant scaling energy and gradient.
+        """
+        pass
+
+    @property
+    def types(self):
+        """
+        Atom type of every particle.
+        """
+        return self._types
+
+    @types.setter
+    def types(self, values):
+        self._types = values
+        self.clear_cache()
+
+    @ctypeproperty(int)
+    def vectorize():
+        """
+        Flag indicating if the pairs are evaluated in blocks by a pair
+        kernel that is specialized to the force field and uses a table of
+        constants for every pair of atom types. Otherwise the energy term
+        is called through a function pointer for every pair.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def n_threads():
+        """
+        Number of threads evaluating energy and gradient. Every thread
+        accumulates the forces of a block of particles in its own buffer.
+        """
+        pass
+
     @property
     def nblist(self):
         return self._nblist
@@ -37,6 +86,7 @@ class Forcefield(Nominable, CWrapper):
     def nblist(self, value):
         
         self._nblist = value
+        self._cutoff = None
         if value is not None:
             self.ctype.nblist = value.ctype
 
@@ -55,12 +105,20 @@ class Forcefield(Nominable, CWrapper):
         state['n_types'] = self.n_types
         state['d'] = self.d
         state['k'] = self.k
+        state['K'] = self.K
+
+        for attr in ('_cached_coords', '_cached_energy', '_cached_gradient'):
+            state.pop(attr, None)
         
         return state
     
     def set_default_values(self):
 
         self.nblist = None
+        self._types = None
+        self.autotune_every = 0
+        self._n_updates = 0
+        self.clear_cache()
         
         self.enable()
 
@@ -69,18 +127,64 @@ class Forcefield(Nominable, CWrapper):
 
     def enable(self, enabled = 1):
         self.ctype.enabled = int(enabled)
+        self.clear_cache()
 
     def disable(self):
         self.enable(0)
 
+    def cutoff(self):
+        """
+        Distance beyond which the interaction vanishes.
+        """
+        raise NotImplementedError
+
+    def autotune(self, coords=None):
+        """
+        Adapt the neighbor list to the cutoff of the force field and, if
+        coordinates are provided, to the current density.
+        """
+        self._cutoff = self.cutoff()
+        self.nblist.autotune(self._cutoff, coords)
+
     def update_list(self, coords):
         """
-        Update neighbor list.
+        Update neighbor list. The grid of the list is tuned in the first
+        update and then every 'autotune_every' updates (if non-zero). It
+        is also tuned whenever the cutoff has changed, e.g. after changing
+        the radii, such that no interactions are lost.
         """
+        cutoff = self.cutoff()
+
+        if not self._n_updates or cutoff != self._cutoff or \
+           cutoff > self.nblist.cellsize or \
+           (self.autotune_every and not self._n_updates % self.autotune_every):
+            self.autotune(coords)
+
+        self._n_updates += 1
+
         self.ctype.nblist.update(coords.reshape(-1,3),1)
         
+    def clear_cache(self):
+        """
+        Forget the result of the last call to 'energy_and_gradient'. This
+        happens automatically if parameters of the force field are set; it
+        is only needed after modifying parameters in place (e.g. 'types').
+        """
+        self._cached_coords   = None
+        self._cached_energy   = None
+        self._cached_gradient = None
+
+    def is_cached(self, coords):
+        """
+        Checks if energy and gradient of the coordinates are cached.
+        """
+        return self._cached_coords is not None and \
+               np.array_equal(self._cached_coords, np.reshape(coords, (-1,)))
+
     def energy(self, coords, update=True):
 
+        if self.is_cached(coords): return self._cached_energy
+
         if update: self.update_list(coords)
 
         return self.ctype.energy(coords.reshape(-1,3), self.types)
@@ -89,6 +193,31 @@ class Forcefield(Nominable, CWrapper):
 
         return self.ctype.update_gradient(coords, forces, self.types, 1)
 
+    def energy_and_gradient(self, coords):
+        """
+        Updates the neighbor list and evaluates energy and gradient in
+        a single sweep over all pairs. The result is cached until the
+        coordinates change, such that a subsequent call to 'energy' is
+        free. The returned gradient must not be modified.
+        """
+        if self.is_cached(coords):
+            return self._cached_energy, self._cached_gradient
+
+        coords = np.ascontiguousarray(np.reshape(coords, (-1,)))
+
+        if self._cached_gradient is None or \
+           len(self._cached_gradient) != len(coords):
+            self._cached_gradient = np.zeros(len(coords))
+        else:
+            self._cached_gradient[...] = 0.
+
+        self.update_list(coords)
+
+        self._cached_energy = self.update_gradient(coords, self._cached_gradient)
+        self._cached_coords = coords.copy()
+
+        return self._cached_energy, self._cached_gradient
+
     def __str__(self):
 
         s = '{0}(n_types={1:.2f})'
@@ -105,17 +234,20 @@ class PROLSQ(Forcefield):
     def init_ctype(self):
         self.ctype = prolsq()
 
+    def cutoff(self):
+        return self.d.max()
+
 class ROSETTA(Forcefield):
 
-    @ctypeproperty(float)
+    @parameterproperty(float)
     def r_max():
         pass
 
-    @ctypeproperty(float)
+    @parameterproperty(float)
     def r_lin():
         pass
 
-    @ctypeproperty(float)
+    @parameterproperty(float)
     def r_sw():
         pass
 
@@ -125,6 +257,127 @@ class ROSETTA(Forcefield):
     def init_ctype(self):
         self.ctype = rosetta()
 
+    def cutoff(self):
+        return self.r_max
+
+class TABULATED(Forcefield):
+    """TABULATED
+
+    Pairwise potential that is stored for every pair of atom types as a
+    cubic spline in the squared distance. The evaluation of a pair is a
+    table lookup without square root. The potential is scaled by the
+    force constants 'k' and vanishes beyond 'r_max'.
+    """
+    @parameterproperty(float)
+    def r_max():
+        pass
+
+    @parameterproperty(int)
+    def n_bins():
+        pass
+
+    @parameterproperty(np.array)
+    def table():
+        """
+        Spline coefficients of shape (n_types, n_types, n_bins, 4).
+        """
+        pass
+
+    def __init__(self, name='TABULATED'):
+        super(TABULATED, self).__init__(name)
+
+    def init_ctype(self):
+        self.ctype = tabulated()
+
+    def __getstate__(self):
+
+        state = super(TABULATED, self).__getstate__()
+
+        ## the table can only be set once the number of types is known
+
+        for attr in ('r_max', 'n_bins', 'table'):
+            state[attr] = state.pop(attr)
+
+        return state
+
+    def cutoff(self):
+        return self.r_max
+
+    def knots(self, r_max=None, n_bins=None):
+        """
+        Distances at which the potential is tabulated (equally spaced in
+        the squared distance).
+        """
+        r_max  = self.r_max if r_max is None else r_max
+        n_bins = self.n_bins if n_bins is None else n_bins
+
+        return np.sqrt(np.linspace(0., r_max**2, n_bins + 1))
+
+    def _evaluate(self, potential, r):
+
+        if callable(potential):
+            values = potential(r)
+        else:
+            potential = np.array(potential)
+            if potential.dtype == object:
+                values = [[f(r) for f in row] for row in potential]
+            else:
+                values = potential
+
+        return np.ones((self.n_types, self.n_types, len(r))) * values
+
+    def tabulate(self, potential, r_max, n_bins=1000, derivative=None):
+        """
+        Interpolate a pairwise potential by cubic splines.
+
+        Parameters
+        ----------
+
+        potential :
+          energy as a function of the distance: a single callable that is
+          used for all type pairs, an (n_types, n_types) nested sequence
+          of callables or energies at the knots (see 'knots') of shape
+          (n_bins+1,) or (n_types, n_types, n_bins+1)
+
+        r_max :
+          cutoff distance beyond which the potential vanishes
+
+        n_bins :
+          number of spline segments
+
+        derivative :
+          derivative of the potential with respect to the distance (same
+          layout as 'potential'); if not provided, it will be estimated
+          by finite differences
+
+        """
+        r = self.knots(r_max, n_bins)
+        s = r**2
+        h = s[1] - s[0]
+        E = self._evaluate(potential, r)
+
+        ## derivatives with respect to the squared distance
+
+        dE = np.gradient(E, h, axis=-1, edge_order=2)
+
+        if derivative is not None:
+            dE[...,1:] = self._evaluate(derivative, r)[...,1:] / (2 * r[1:])
+
+        ## cubic Hermite polynomials on every segment
+
+        E0, E1 = E[...,:-1], E[...,1:]
+        D0, D1 = h * dE[...,:-1], h * dE[...,1:]
+
+        table = np.array([E0, D0, 3 * (E1 - E0) - 2 * D0 - D1, 2 * (E0 - E1) + D0 + D1])
+
+        self.r_max  = float(r_max)
+        self.n_bins = int(n_bins)
+        self.table  = np.rollaxis(table, 0, 4)
+
+        self.clear_cache()
+
+        if self.nblist is not None: self.autotune()
+
 class ForcefieldFactory(object):
 
     @classmethod
@@ -132,22 +385,30 @@ class ForcefieldFactory(object):
 
         if name.lower() == 'rosetta':
             forcefield = ROSETTA()
-            cellsize = 5.51
             
         elif name.lower() == 'prolsq':
             forcefield = PROLSQ()
-            cellsize = 3.71
+
+        elif name.lower() == 'tabulated':
+            forcefield = TABULATED()
             
         else:
             msg = 'Forcefield "{}" not supported'
             raise ValueError(msg.format(name))
 
-        nblist   = NBList(cellsize, 100, 500, universe.n_particles)
-
-        forcefield.nblist = nblist
         forcefield.n_types = 1
         forcefield.types = np.zeros(universe.n_particles,'i')
         forcefield.k = np.array([[1.]])
         forcefield.d = np.array([[1.]])
 
+        ## tabulated force field defaults to the PROLSQ repulsion
+
+        if isinstance(forcefield, TABULATED):
+            forcefield.tabulate(lambda r: 0.5 * np.clip(1. - r, 0., None)**4, 1.)
+
+        ## grid will be tuned to the cutoff and density in the first update
+        
+        forcefield.nblist = NBList(forcefield.cutoff() + 1e-2, 100, 500,
+                                   universe.n_particles)
+
         return forcefield    
@@ -0,0 +1,305 @@
+# distutils: extra_compile_args = -fopenmp
+# distutils: extra_link_args = -fopenmp
+"""
+Fused kernels for likelihoods whose mock data are inter-particle distances.
+Every kernel evaluates the distances, stores them as mock data and either
+accumulates the log probability or computes the derivatives and scatters
+the resulting forces in a single loop over the restraints. Coordinates and
+forces can be stored in single or double precision. The contributions of
+the individual restraints are computed by the kernels in 'kernels.pxd'
+and are optionally weighted by the multiplicities of the restraints.
+
+With several threads, every thread scatters the forces of its restraints
+into a private buffer and the buffers are summed in the end.
+"""
+import numpy
+cimport numpy
+cimport cython
+
+from cython cimport floating
+from cython.parallel cimport prange, parallel, threadid
+
+from isdhic cimport kernels
+from isdhic.kernels cimport sqrt
+
+cdef enum:
+    LOGISTIC   = 0
+    RELU       = 1
+    LOWERUPPER = 2
+    NORMAL     = 3
+
+cdef inline double log_prob_term(int model, double d, double a, double b,
+                                 double p) nogil:
+    """
+    Contribution of a single distance 'd' to the log probability (squared
+    deviation for Gaussian error models). 'a' is the data or lower bound,
+    'b' the upper bound and 'p' the steepness.
+    """
+    if model == LOGISTIC:
+        return kernels.logistic_log_prob(d, a, p)
+    elif model == RELU:
+        return kernels.relu_log_prob(d, a, p)
+    elif model == LOWERUPPER:
+        return - kernels.lowerupper_chi2(d, a, b)
+    else:
+        return kernels.normal_chi2(d, a)
+
+cdef inline double derivative(int model, double d, double a, double b,
+                              double p) nogil:
+    """
+    Derivative of the log probability with respect to a single distance.
+    'p' is the steepness or the precision.
+    """
+    if model == LOGISTIC:
+        return kernels.logistic_derivative(d, a, p)
+    elif model == RELU:
+        return kernels.relu_derivative(d, a, p)
+    elif model == LOWERUPPER:
+        return kernels.lowerupper_derivative(d, a, b, p)
+    else:
+        return kernels.normal_derivative(d, a, p)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline double log_prob(int model,
+                            floating [::1] coords,
+                            int [::1] first_index,
+                            int [::1] second_index,
+                            double [::1] mock,
+                            double [::1] a,
+                            double [::1] b,
+                            double [::1] w,
+                            double p,
+                            int n_threads):
+
+    cdef Py_ssize_t i, j, n
+    cdef int N = len(first_index)
+    cdef bint weighted = w is not None
+    cdef double x, y, z, lgp = 0.
+
+    if n_threads < 2:
+
+        for n in range(N):
+
+            i = first_index[n]
+            j = second_index[n]
+
+            x = coords[3*i+0] - coords[3*j+0]
+            y = coords[3*i+1] - coords[3*j+1]
+            z = coords[3*i+2] - coords[3*j+2]
+
+            mock[n] = sqrt(x * x + y * y + z * z)
+
+            lgp += (w[n] if weighted else 1.) * log_prob_term(model, mock[n], a[n], b[n], p)
+
+        return lgp
+
+    with nogil:
+        for n in prange(N, num_threads=n_threads, schedule='static'):
+
+            i = first_index[n]
+            j = second_index[n]
+
+            x = coords[3*i+0] - coords[3*j+0]
+            y = coords[3*i+1] - coords[3*j+1]
+            z = coords[3*i+2] - coords[3*j+2]
+
+            mock[n] = sqrt(x * x + y * y + z * z)
+
+            lgp += (w[n] if weighted else 1.) * log_prob_term(model, mock[n], a[n], b[n], p)
+
+    return lgp
+
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void update_forces(int model,
+                               floating [::1] coords,
+                               int [::1] first_index,
+                               int [::1] second_index,
+                               double [::1] mock,
+                               double [::1] grad,
+                               floating [::1] forces,
+                               double [::1] a,
+                               double [::1] b,
+                               double [::1] w,
+                               double p,
+                               double scale,
+                               int n_threads):
+
+    cdef Py_ssize_t i, j, k, n, t
+    cdef int N = len(first_index), M = len(forces)
+    cdef bint weighted = w is not None
+    cdef double c, x, y, z, f
+    cdef double [:, ::1] buffers
+
+    if n_threads < 2:
+
+        for n in range(N):
+
+            i = first_index[n]
+            j = second_index[n]
+
+            x = coords[3*i+0] - coords[3*j+0]
+            y = coords[3*i+1] - coords[3*j+1]
+            z = coords[3*i+2] - coords[3*j+2]
+
+            mock[n] = sqrt(x * x + y * y + z * z)
+            grad[n] = (w[n] * scale if weighted else scale) * \
+                      derivative(model, mock[n], a[n], b[n], p)
+
+            if grad[n] == 0.: continue
+
+            c = grad[n] / mock[n]
+
+            forces[3*i+0] += c * x
+            forces[3*j+0] -= c * x
+            forces[3*i+1] += c * y
+            forces[3*j+1] -= c * y
+            forces[3*i+2] += c * z
+            forces[3*j+2] -= c * z
+
+        return
+
+    buffers = numpy.zeros((n_threads, M))
+
+    with nogil, parallel(num_threads=n_threads):
+
+        t = threadid()
+
+        for n in prange(N, schedule='static'):
+
+            i = first_index[n]
+            j = second_index[n]
+
+            x = coords[3*i+0] - coords[3*j+0]
+            y = coords[3*i+1] - coords[3*j+1]
+            z = coords[3*i+2] - coords[3*j+2]
+
+            mock[n] = sqrt(x * x + y * y + z * z)
+            grad[n] = (w[n] * scale if weighted else scale) * \
+                      derivative(model, mock[n], a[n], b[n], p)
+
+            c = grad[n] / mock[n] if grad[n] != 0. else 0.
+
+            buffers[t,3*i+0] += c * x
+            buffers[t,3*j+0] -= c * x
+            buffers[t,3*i+1] += c * y
+            buffers[t,3*j+1] -= c * y
+            buffers[t,3*i+2] += c * z
+            buffers[t,3*j+2] -= c * z
+
+    ## sum the private forces of all threads
+
+    with nogil:
+        for k in prange(M, num_threads=n_threads, schedule='static'):
+            f = 0.
+            for t in range(n_threads):
+                f = f + buffers[t,k]
+            forces[k] += f
+
+def logistic_log_prob(floating [::1] coords,
+                      int [::1] first_index,
+                      int [::1] second_index,
+                      double [::1] mock,
+                      double [::1] data,
+                      double steepness,
+                      double [::1] weights=None,
+                      int n_threads=1):
+
+    return log_prob(LOGISTIC, coords, first_index, second_index, mock,
+                    data, data, weights, steepness, n_threads)
+
+def logistic_update_forces(floating [::1] coords,
+                           int [::1] first_index,
+                           int [::1] second_index,
+                           double [::1] mock,
+                           double [::1] grad,
+                           floating [::1] forces,
+                           double [::1] data,
+                           double steepness,
+                           double beta,
+                           double [::1] weights=None,
+                           int n_threads=1):
+
+    update_forces(LOGISTIC, coords, first_index, second_index, mock, grad,
+                  forces, data, data, weights, steepness, beta, n_threads)
+
+def relu_log_prob(floating [::1] coords,
+                  int [::1] first_index,
+                  int [::1] second_index,
+                  double [::1] mock,
+                  double [::1] data,
+                  double steepness,
+                  double [::1] weights=None,
+                  int n_threads=1):
+
+    return log_prob(RELU, coords, first_index, second_index, mock,
+                    data, data, weights, steepness, n_threads)
+
+def relu_update_forces(floating [::1] coords,
+                       int [::1] first_index,
+                       int [::1] second_index,
+                       double [::1] mock,
+                       double [::1] grad,
+                       floating [::1] forces,
+                       double [::1] data,
+                       double steepness,
+                       double beta,
+                       double [::1] weights=None,
+                       int n_threads=1):
+
+    update_forces(RELU, coords, first_index, second_index, mock, grad,
+                  forces, data, data, weights, steepness, beta, n_threads)
+
+def lowerupper_log_prob(floating [::1] coords,
+                        int [::1] first_index,
+                        int [::1] second_index,
+                        double [::1] mock,
+                        double [::1] lower,
+                        double [::1] upper,
+                        double [::1] weights=None,
+                        int n_threads=1):
+
+    return log_prob(LOWERUPPER, coords, first_index, second_index, mock,
+                    lower, upper, weights, 0., n_threads)
+
+def lowerupper_update_forces(floating [::1] coords,
+                             int [::1] first_index,
+                             int [::1] second_index,
+                             double [::1] mock,
+                             double [::1] grad,
+                             floating [::1] forces,
+                             double [::1] lower,
+                             double [::1] upper,
+                             double precision,
+                             double [::1] weights=None,
+                             int n_threads=1):
+
+    update_forces(LOWERUPPER, coords, first_index, second_index, mock, grad,
+                  forces, lower, upper, weights, precision, 1., n_threads)
+
+def normal_log_prob(floating [::1] coords,
+                    int [::1] first_index,
+                    int [::1] second_index,
+                    double [::1] mock,
+                    double [::1] data,
+                    double [::1] weights=None,
+                    int n_threads=1):
+
+    return log_prob(NORMAL, coords, first_index, second_index, mock,
+                    data, data, weights, 0., n_threads)
+
+def normal_update_forces(floating [::1] coords,
+                         int [::1] first_index,
+                         int [::1] second_index,
+                         double [::1] mock,
+                         double [::1] grad,
+                         floating [::1] forces,
+                         double [::1] data,
+                         double precision,
+                         double [::1] weights=None,
+                         int n_threads=1):
+
+    update_forces(NORMAL, coords, first_index, second_index, mock, grad,
+                  forces, data, data, weights, precision, 1., n_threads)
@@ -0,0 +1,85 @@
+"""
+Inline kernels of the error models shared by the Cython modules. Every
+error model provides the contribution of a single observation to the log
+probability (for Gaussian error models the squared deviation, which is
+scaled by the precision) and its derivative with respect to the mock data.
+None of the kernels needs the GIL.
+"""
+cimport cython
+
+cdef extern from "math.h" nogil:
+    double sqrt(double)
+    double log(double)
+    double log1p(double)
+    double exp(double)
+
+@cython.cdivision(True)
+cdef inline double softplus(double x) nogil:
+    """
+    log(1 + exp(x)) without overflow for large arguments.
+    """
+    if x > 0.:
+        return x + log1p(exp(-x))
+    else:
+        return log1p(exp(x))
+
+@cython.cdivision(True)
+cdef inline double sigmoid(double x) nogil:
+    """
+    1 / (1 + exp(-x)) without overflow for large negative arguments.
+    """
+    cdef double e
+
+    if x >= 0.:
+        return 1. / (1. + exp(-x))
+    else:
+        e = exp(x)
+        return e / (1. + e)
+
+## logistic: log p = - softplus(steepness * (mock - data))
+
+cdef inline double logistic_log_prob(double mock, double data,
+                                     double steepness) nogil:
+    return - softplus(steepness * (mock - data))
+
+cdef inline double logistic_derivative(double mock, double data,
+                                       double steepness) nogil:
+    return - steepness * sigmoid(steepness * (mock - data))
+
+## relu: log p = - steepness * max(mock - data, 0)
+
+cdef inline double relu_log_prob(double mock, double data,
+                                 double steepness) nogil:
+    return steepness * (data - mock) if mock > data else 0.
+
+cdef inline double relu_derivative(double mock, double data,
+                                   double steepness) nogil:
+    return - steepness if mock > data else 0.
+
+## lowerupper: log p = - precision / 2 * (distance from [lower, upper])^2
+
+cdef inline double lowerupper_chi2(double mock, double lower, double upper) nogil:
+    if mock < lower:
+        return (mock - lower) * (mock - lower)
+    elif mock > upper:
+        return (mock - upper) * (mock - upper)
+    else:
+        return 0.
+
+cdef inline double lowerupper_derivative(double mock, double lower, double upper,
+                                         double precision) nogil:
+    if mock < lower:
+        return precision * (lower - mock)
+    elif mock > upper:
+        return precision * (upper - mock)
+    else:
+        return 0.
+
+## normal: log p = - precision / 2 * (mock - data)^2
+
+cdef inline double normal_chi2(double mock, double data) nogil:
+    return (mock - data) * (mock - data)
+
+cdef inline double normal_derivative(double mock, double data,
+                                     double precision) nogil:
+    return precision * (data - mock)
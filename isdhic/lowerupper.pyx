@@ -1,7 +1,13 @@
+# distutils: extra_compile_args = -fopenmp
+# distutils: extra_link_args = -fopenmp
 import numpy
 cimport numpy
 cimport cython
 
+from cython.parallel cimport prange
+
+from isdhic cimport kernels
+
 DTYPE_FLOAT = numpy.float
 ctypedef numpy.float_t DTYPE_FLOAT_t
 
@@ -14,7 +20,7 @@ ctypedef numpy.double_t DTYPE_DOUBLE_t
 DTYPE_LONG = numpy.long
 ctypedef numpy.long_t DTYPE_LONG_t
 
-cdef extern from "math.h":
+cdef extern from "math.h" nogil:
     double sqrt(double)
     double log(double)
     
@@ -25,21 +31,19 @@ cdef extern from "math.h":
 def log_prob(double [::1] data,
              double [::1] mock,
              double [::1] lower,
-             double [::1] upper):
+             double [::1] upper,
+             double [::1] weights=None):
 
     cdef Py_ssize_t i
     cdef int n = len(data)
-    cdef double x, logp = 0.
+    cdef bint weighted = weights is not None
+    cdef double logp = 0.
 
-    for i in range(n):
+    with nogil:
+        for i in range(n):
 
-        if mock[i] < lower[i]:
-            x = mock[i] - lower[i]
-            logp -= x * x
-
-        elif mock[i] > upper[i]:
-            x = mock[i] - upper[i]
-            logp -= x * x
+            logp -= (weights[i] if weighted else 1.) * \
+                    kernels.lowerupper_chi2(mock[i], lower[i], upper[i])
 
     return logp
 
@@ -48,15 +52,17 @@ def log_prob(double [::1] data,
 @cython.wraparound(False)
 def logZ(double [::1] lower,
          double [::1] upper,
-         double precision):
+         double precision,
+         double [::1] weights=None):
 
     cdef Py_ssize_t i
     cdef int n = len(lower)
+    cdef bint weighted = weights is not None
     cdef double logZ = 0., x = sqrt(2 * numpy.pi / precision)
 
     for i in range(n):
 
-        logZ += log(x + upper[i] - lower[i])
+        logZ += (weights[i] if weighted else 1.) * log(x + upper[i] - lower[i])
 
     return logZ
 
@@ -67,16 +73,12 @@ def update_derivatives(double [::1] mock,
                        double [::1] grad,
                        double [::1] lower,
                        double [::1] upper,
-                       double precision):
+                       double precision,
+                       int n_threads=1):
 
     cdef Py_ssize_t i
     cdef int n = len(mock)
 
-    for i in range(n):
+    for i in prange(n, nogil=True, num_threads=max(n_threads, 1), schedule='static'):
 
-        if mock[i] < lower[i]:
-            grad[i] = precision * (lower[i] - mock[i])
-        elif mock[i] > upper[i]:
-            grad[i] = precision * (upper[i] - mock[i])
-        else:
-            grad[i] = 0.
+        grad[i] = kernels.lowerupper_derivative(mock[i], lower[i], upper[i], precision)
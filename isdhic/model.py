@@ -1,7 +1,7 @@
 import numpy as np
 
-from .core import Nominable
-from .params import Parameters, Scale, Precision
+from .core import Nominable, get_n_threads
+from .params import Parameters, Scale, Precision, Distances, ModelDistances
 
 from csb.core import validatedproperty
 
@@ -22,10 +22,18 @@ class Probability(Nominable):
         
 class Likelihood(Probability):
 
+    ## error models providing fused kernels set '_has_fused_kernels';
+    ## '_use_fused' switches their use on or off
+
+    _has_fused_kernels = False
+    _use_fused = True
+
     @validatedproperty
     def data(values):
         """
-        Observed data stored in a single vector.
+        Observed data stored in a single vector. If the mock data are sorted
+        distances, the data follow the sorted order of the pairs ('external'
+        of the mock data restores the order in which they were passed).
         """
         return np.ascontiguousarray(values)
 
@@ -36,6 +44,28 @@ class Likelihood(Probability):
         """
         return np.ascontiguousarray(values)
 
+    @property
+    def weights(self):
+        """
+        Multiplicities of the observations (None if every observation
+        counts once). An observation with weight k contributes as much
+        as k copies of the observation. Stored in the same order as the
+        data.
+        """
+        return self._weights
+
+    @weights.setter
+    def weights(self, values):
+        if values is not None:
+            values = np.ascontiguousarray(values, dtype='d')
+            if values.shape != self.data.shape:
+                msg = 'Weights must have the same shape as the data'
+                raise ValueError(msg)
+            if np.any(values < 0.):
+                msg = 'Weights must be non-negative'
+                raise ValueError(msg)
+        self._weights = values
+
     @property
     def beta(self):
         """
@@ -46,8 +76,43 @@ class Likelihood(Probability):
     @beta.setter
     def beta(self, value):
         self._beta.set(value)
+
+    @property
+    def fused(self):
+        """
+        Flag indicating if mock data, log probability and forces are
+        evaluated in a single loop over the restraints. This is only
+        possible for distances as mock data and for error models that
+        provide fused kernels (see 'isdhic.fused'). Fused likelihoods
+        do not need to be updated before evaluating them. Subclasses that
+        override 'log_prob' or 'update_derivatives' are evaluated without
+        fused kernels.
+        """
+        return self._use_fused and isinstance(self.mock, ModelDistances) and \
+               self.supports_fused()
+
+    @fused.setter
+    def fused(self, value):
+        self._use_fused = bool(value)
+
+    @classmethod
+    def supports_fused(cls):
+        """
+        Checks if 'log_prob' and 'update_derivatives' are implemented by an
+        error model that provides fused kernels. The result is stored in
+        the class.
+        """
+        if '_supports_fused' not in cls.__dict__:
+
+            owners = [next(c for c in cls.__mro__ if name in c.__dict__)
+                      for name in ('log_prob', 'update_derivatives')]
+
+            cls._supports_fused = all(c.__dict__.get('_has_fused_kernels', False)
+                                      for c in owners)
+
+        return cls._supports_fused
     
-    def __init__(self, name, data, mock, beta=1.0, params=None):
+    def __init__(self, name, data, mock, beta=1.0, params=None, weights=None):
         """Likelihood
 
         Initialize likelihood by providing a name, the raw data
@@ -64,16 +129,27 @@ class Likelihood(Probability):
 
         mock : instance of Parameters
           theory for calculating idealized data (needs to implement
-          update_forces)
+          update_forces); if the mock data are sorted distances, the
+          data and weights are stored in the sorted order of the pairs
 
         beta : non-negative float
           inverse temperature used in tempering and annealing          
+
+        weights : iterable or None
+          multiplicities of the data points, e.g. the number of times
+          a contact was observed (None: every data point counts once)
         """
         super(Likelihood, self).__init__(name, params)
 
+        if isinstance(mock, Distances):
+            data = mock.internal(data)
+            if weights is not None:
+                weights = mock.internal(weights)
+
         self.data = data
         self.mock = mock
         self.grad = np.zeros(data.shape)
+        self.weights = weights
 
         self._beta = Scale(self.name + '.beta')
         self.params.add(self._beta)
@@ -93,8 +169,18 @@ class Likelihood(Probability):
         """
         Update Cartesian forces by applying the chain rule.
         """
-        self.update_derivatives()
-        self.mock.update_forces(self.grad, self.params)
+        if self.fused:
+            self.update_forces_fused()
+        else:
+            self.update_derivatives()
+            self.mock.update_forces(self.grad, self.params)
+
+    def update_forces_fused(self):
+        """
+        Update mock data, derivatives and Cartesian forces with a fused
+        kernel.
+        """
+        raise NotImplementedError
 
 class Normal(Likelihood):
     """Normal
@@ -124,9 +210,9 @@ class Normal(Likelihood):
         """
         return 1 / self.tau**0.5
 
-    def __init__(self, name, data, mock, precision=1.0, params=None):
+    def __init__(self, name, data, mock, precision=1.0, params=None, weights=None):
 
-        super(Normal, self).__init__(name, data, mock, params=params)
+        super(Normal, self).__init__(name, data, mock, params=params, weights=weights)
 
         self._precision = Precision(self.name + '.precision')
         self.tau = precision
@@ -136,13 +222,25 @@ class Normal(Likelihood):
         """
         Normalization constant of the Normal distribution
         """
-        return - 0.5 * len(self.data) * np.log(0.5 * self.tau / np.pi)
+        n = len(self.data) if self.weights is None else self.weights.sum()
+
+        return - 0.5 * n * np.log(0.5 * self.tau / np.pi)
         
+    _has_fused_kernels = True
+
     def log_prob(self):
 
-        diff = self.mock.get() - self.data
+        if self.fused:
+            from .fused import normal_log_prob
 
-        log_prob = - 0.5 * self.tau * np.dot(diff,diff) - self.logZ
+            chi2 = self.mock.fused_log_prob(normal_log_prob, self.params, self.data,
+                                            self.weights)
+        else:
+            diff = self.mock.get() - self.data
+            chi2 = np.dot(diff,diff) if self.weights is None else \
+                   np.dot(self.weights * diff, diff)
+
+        log_prob = - 0.5 * self.tau * chi2 - self.logZ
 
         return self.beta * log_prob
 
@@ -150,6 +248,16 @@ class Normal(Likelihood):
 
         self.grad[...] = self.beta * self.tau * (self.data - self.mock.get())
 
+        if self.weights is not None:
+            self.grad *= self.weights
+
+    def update_forces_fused(self):
+
+        from .fused import normal_update_forces
+
+        self.mock.fused_update_forces(normal_update_forces, self.grad, self.params,
+                                      self.data, self.beta * self.tau, self.weights)
+
     def __str__(self):
 
         s = super(Normal, self).__str__()
@@ -163,12 +271,20 @@ class LowerUpper(Normal):
     start and end of the plateau are marked by lower bounds (stored in 'lower')
     and upper bounds (stored in 'upper')
     """
+    _has_fused_kernels = True
+
     @validatedproperty
     def lower(values):
+        """
+        Lower bounds stored in the same order as the data.
+        """
         return np.ascontiguousarray(values)
 
     @validatedproperty
     def upper(values):
+        """
+        Upper bounds stored in the same order as the data.
+        """
         return np.ascontiguousarray(values)
 
     @property
@@ -178,11 +294,17 @@ class LowerUpper(Normal):
         """
         from .lowerupper import logZ
 
-        return logZ(self.lower, self.upper, self.tau)
+        return logZ(self.lower, self.upper, self.tau, self.weights)
+
+    def __init__(self, name, data, mock, lower, upper, precision=1.0, params=None,
+                 weights=None):
 
-    def __init__(self, name, data, mock, lower, upper, precision=1.0, params=None):
+        super(LowerUpper, self).__init__(name, data, mock, precision, params=params,
+                                         weights=weights)
 
-        super(LowerUpper, self).__init__(name, data, mock, precision, params=params)
+        if isinstance(mock, Distances):
+            lower = mock.internal(lower)
+            upper = mock.internal(upper)
 
         self.lower = lower
         self.upper = upper
@@ -191,9 +313,16 @@ class LowerUpper(Normal):
 
     def log_prob(self):
 
-        from .lowerupper import log_prob
+        if self.fused:
+            from .fused import lowerupper_log_prob
 
-        lgp = log_prob(self.data, self.mock.get(), self.lower, self.upper)
+            lgp = self.mock.fused_log_prob(lowerupper_log_prob, self.params,
+                                           self.lower, self.upper, self.weights)
+        else:
+            from .lowerupper import log_prob
+
+            lgp = log_prob(self.data, self.mock.get(), self.lower, self.upper,
+                           self.weights)
 
         return 0.5 * self.beta * self.tau * lgp - self.beta * self.logZ
     
@@ -202,7 +331,18 @@ class LowerUpper(Normal):
         from .lowerupper import update_derivatives
 
         update_derivatives(self.mock.get(), self.grad, self.lower,
-                           self.upper, self.beta * self.tau)
+                           self.upper, self.beta * self.tau, get_n_threads())
+
+        if self.weights is not None:
+            self.grad *= self.weights
+
+    def update_forces_fused(self):
+
+        from .fused import lowerupper_update_forces
+
+        self.mock.fused_update_forces(lowerupper_update_forces, self.grad, self.params,
+                                      self.lower, self.upper, self.beta * self.tau,
+                                      self.weights)
 
     def validate(self):
         if np.any(self.lower > self.upper):
@@ -213,7 +353,19 @@ class Logistic(Likelihood):
     """Logistic
 
     Logistic likelihood for binary observations.
+
+    With a positive tolerance, restraints that are deep inside the
+    satisfied region (distance well below the threshold) are skipped
+    (active-set mode). After a full pass over all restraints, only the
+    restraints that could contribute more than the tolerance to the log
+    probability are evaluated until a particle has moved by more than
+    half the skin. The error of the log probability (before scaling with
+    the inverse temperature) is then bounded by the tolerance. Mock data
+    and derivatives of the skipped restraints are only updated in full
+    passes. Requires distances as mock data (see 'fused').
     """
+    _has_fused_kernels = True
+
     @property
     def steepness(self):
         """
@@ -232,27 +384,155 @@ class Logistic(Likelihood):
     def alpha(self, value):
         self._steepness.set(value)
     
-    def __init__(self, name, data, mock, steepness=1.0, params=None):
+    @property
+    def tolerance(self):
+        """
+        Bound on the error of the log probability caused by skipping
+        satisfied restraints (zero: all restraints are evaluated).
+        """
+        return self._tolerance
+
+    @tolerance.setter
+    def tolerance(self, value):
+        if value < 0.:
+            msg = 'Tolerance must be non-negative'
+            raise ValueError(msg)
+        self._tolerance = float(value)
+        self._active = None
+
+    @property
+    def skin(self):
+        """
+        Buffer on the distances of the skipped restraints that allows the
+        particles to move without a full pass.
+        """
+        return self._skin
+
+    @skin.setter
+    def skin(self, value):
+        if value <= 0.:
+            msg = 'Skin must be positive'
+            raise ValueError(msg)
+        self._skin = float(value)
+        self._active = None
+
+    @property
+    def active_set(self):
+        """
+        Distances of the restraints that are currently evaluated or None
+        if all restraints are evaluated. A full pass over the restraints
+        is made if necessary.
+        """
+        if not (self.fused and self.tolerance > 0.):
+            return None
+
+        coords = self.params['coordinates'].get().reshape(-1,3)
+
+        if self._active is None or self.margin() > self._margin or \
+           coords.shape != self._coords.shape or \
+           2 * np.sqrt(np.sum((coords - self._coords)**2,1).max()) > self.skin:
+            self.update_active_set()
+
+        return self._active
+
+    def __init__(self, name, data, mock, steepness=1.0, params=None,
+                 tolerance=0., skin=1., weights=None):
         
-        super(Logistic, self).__init__(name, data, mock, params=params)
+        super(Logistic, self).__init__(name, data, mock, params=params, weights=weights)
 
         self._steepness = Scale(self.name + '.steepness')        
         self.alpha = steepness
+        self.n_passes = 0
+        self.tolerance = tolerance
+        self.skin = skin
         
+    def margin(self):
+        """
+        Distance below the threshold beyond which the contribution of a
+        single restraint to the log probability is smaller than the
+        tolerance divided by the number of restraints.
+        """
+        n = len(self.data) if self.weights is None else self.weights.sum()
+
+        return np.log(n / self.tolerance) / self.alpha
+
+    def update_active_set(self):
+        """
+        Evaluate all restraints and select the restraints that are closer
+        to the threshold than the margin plus the skin. The number of full
+        passes is counted in 'n_passes'.
+        """
+        self.mock.update(self.params)
+        self.n_passes += 1
+
+        margin = self.margin()
+        active = np.flatnonzero(self.data - self.mock.get() < margin + self.skin)
+        pairs  = np.transpose([self.mock.first_index[active],
+                               self.mock.second_index[active]])
+        
+        self._active = ModelDistances(pairs.reshape(-1,2), self.mock.name + '.active')
+        self._active_data = np.ascontiguousarray(self.data[active])
+        self._active_grad = np.zeros(len(active))
+        self._active_weights = None if self.weights is None else \
+                               np.ascontiguousarray(self.weights[active])
+        self._margin = margin
+        self._coords = self.params['coordinates'].get().reshape(-1,3).copy()
+
+    def fused_kernels(self):
+        """
+        Kernels evaluating the log probability and the forces together
+        with the distances.
+        """
+        from .fused import logistic_log_prob, logistic_update_forces
+
+        return logistic_log_prob, logistic_update_forces
+
     def log_prob(self):
 
+        if self.fused:
+
+            kernel = self.fused_kernels()[0]
+            active = self.active_set
+
+            if active is None:
+                lgp = self.mock.fused_log_prob(kernel, self.params, self.data,
+                                               self.alpha, self.weights)
+            else:
+                lgp = active.fused_log_prob(kernel, self.params, self._active_data,
+                                            self.alpha, self._active_weights)
+
+            return self.beta * lgp
+
         from .logistic import log_prob
 
-        return self.beta * log_prob(self.data, self.mock.get(), self.alpha)
+        return self.beta * log_prob(self.data, self.mock.get(), self.alpha, self.weights)
 
     def update_derivatives(self):
 
         from .logistic import update_derivatives
 
-        update_derivatives(self.data, self.mock.get(), self.grad, self.alpha)
+        update_derivatives(self.data, self.mock.get(), self.grad, self.alpha,
+                           get_n_threads())
 
         self.grad *= self.beta
 
+        if self.weights is not None:
+            self.grad *= self.weights
+
+    def update_forces_fused(self):
+
+        kernel = self.fused_kernels()[1]
+        active = self.active_set
+
+        if active is None:
+            self.mock.fused_update_forces(kernel, self.grad, self.params,
+                                          self.data, self.alpha, self.beta,
+                                          self.weights)
+        else:
+            active.fused_update_forces(kernel, self._active_grad, self.params,
+                                       self._active_data, self.alpha, self.beta,
+                                       self._active_weights)
+
     def __str__(self):
 
         s = super(Logistic, self).__str__()
@@ -263,13 +543,29 @@ class Logistic(Likelihood):
 class Relu(Logistic):
     """Relu
 
-    Relu likelihood for binary observations.
+    Relu likelihood for binary observations. In active-set mode, the
+    satisfied restraints contribute exactly zero, so the tolerance only
+    switches the mode on.
     """
+    _has_fused_kernels = True
+
+    def margin(self):
+        return 0.
+
+    def fused_kernels(self):
+
+        from .fused import relu_log_prob, relu_update_forces
+
+        return relu_log_prob, relu_update_forces
+
     def log_prob(self):
 
+        if self.fused:
+            return super(Relu, self).log_prob()
+
         from .relu import log_prob
 
-        return self.beta * log_prob(self.data, self.mock.get(), self.alpha)
+        return self.beta * log_prob(self.data, self.mock.get(), self.alpha, self.weights)
 
     def update_derivatives(self):
 
@@ -277,7 +573,10 @@ class Relu(Logistic):
 
         ## self.grad[...] = 0.
 
-        update_derivatives(self.data, self.mock.get(), self.grad, self.alpha)
+        update_derivatives(self.data, self.mock.get(), self.grad, self.alpha,
+                           get_n_threads())
 
         self.grad *= self.beta
 
+        if self.weights is not None:
+            self.grad *= self.weights
@@ -1,6 +1,8 @@
 """
 Wrapper class for neighbor list.
 """
+import numpy as np
+
 from ._isdhic import nblist
 from .core import ctypeproperty, CWrapper
 
@@ -16,6 +18,17 @@ class NBList(CWrapper):
     this trick the evaluation of pairwise interactions no longer has
     a complexity that is quadratic in the number of particles, but
     grows only linearly with the size of the system.
+
+    The cells can be stored either in a dense grid or in a hash table
+    holding only the occupied cells (sparse grid). The dense grid
+    adapts the number of cells along each axis to the bounding box of
+    the particles and increases the cellsize if more than 'n_cells^3'
+    cells would be needed, whereas the sparse grid keeps the cellsize
+    for any bounding box.
+
+    With a non-zero skin, the list contains all pairs that are closer
+    than 'cellsize + skin' and is only rebuilt once a particle has
+    moved more than half the skin since the last rebuild (Verlet list).
     """
     @ctypeproperty(float)
     def cellsize():
@@ -27,15 +40,32 @@ class NBList(CWrapper):
     @ctypeproperty(int)
     def n_cells():
         """
-        Number of cubic cells in each spatial direction such that the
-        total number of cells is 'n_cells^3'.
+        Maximum number of cells of the dense grid is 'n_cells^3'. The
+        cells are distributed over the axes according to the shape of
+        the bounding box (see 'ctype.shape').
         """
         pass
 
     @ctypeproperty(int)
     def n_per_cell():
         """
-        Maximum number of particles that fits into a cell. 
+        Initial number of particles that fits into a cell. Cells that
+        receive more particles are enlarged.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def max_per_cell():
+        """
+        Largest number of particles found in a single cell (can be reset
+        by setting it to zero).
+        """
+        pass
+
+    @ctypeproperty(int)
+    def n_resizes():
+        """
+        Number of times a cell or the contact buffers had to be enlarged.
         """
         pass
 
@@ -45,8 +75,103 @@ class NBList(CWrapper):
         Number of particles. 
         """
         pass
+
+    @ctypeproperty(float)
+    def skin():
+        """
+        Buffer added to the cellsize that allows particles to move
+        without rebuilding the list.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def sparse():
+        """
+        Flag indicating if the occupied cells are stored in a hash table
+        rather than in a dense grid.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def reorder():
+        """
+        Flag indicating if the particles are sorted internally along a
+        space-filling curve through the occupied cells. The list then
+        refers to the sorted particles, which improves memory locality
+        in the pair loops. Forcefields translate back to the original
+        order of the coordinates and forces.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def bvh():
+        """
+        Flag indicating if the pairs are found with a bounding volume
+        hierarchy over contiguous segments of the chain rather than with
+        the cell grid. The hierarchy adapts to inhomogeneous conformations
+        and does not depend on the cell parameters (except for the
+        cellsize, which is the cutoff). Particles are not reordered.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def segment_length():
+        """
+        Number of consecutive particles whose bounding box forms a leaf
+        of the bounding volume hierarchy.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def subdivision():
+        """
+        Number of cells per cellsize (1, 2 or 3). Smaller cells with a
+        correspondingly larger stencil of neighbor cells approximate the
+        sphere within the cellsize more closely, so fewer distances are
+        computed in vain.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def incremental():
+        """
+        Flag indicating if the cells are kept between rebuilds such that
+        only particles that left their cell need to be moved. The grid
+        stays fixed until a particle leaves the dense grid. With 'reorder'
+        switched on, the particles keep their sorted order until the list
+        is reset.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def store_pairs():
+        """
+        Flag indicating if the pairs are stored when the list is updated.
+        Otherwise the forcefields collect the partners of every particle
+        from the cells while evaluating the interactions and reuse the
+        squared distances computed during the traversal (list-free mode,
+        not available with the bounding volume hierarchy).
+        """
+        pass
+
+    @ctypeproperty(int)
+    def n_threads():
+        """
+        Number of threads used to build the list. Every thread collects
+        the pairs of a block of particles; the resulting list does not
+        depend on the number of threads.
+        """
+        pass
+
+    @ctypeproperty(int)
+    def n_rebuilds():
+        """
+        Number of times the list has been rebuilt. 
+        """
+        pass
     
-    def __init__(self, cellsize, n_cells, n_per_cell, n_particles):
+    def __init__(self, cellsize, n_cells, n_per_cell, n_particles, skin=0.,
+                 sparse=False, reorder=False):
         """NBList
 
         Initialize a neighbor list that allows the computation of pairwise
@@ -59,18 +184,30 @@ class NBList(CWrapper):
           length of a single cell
 
         n_cells :
-          number of cells in one dimension
+          the dense grid has at most n_cells^3 cells
           
         n_per_cell :
-          max. no. of atoms assignable to one cell
+          initial no. of atoms assignable to one cell
 
         n_particles :
           number of particles
+
+        skin :
+          Verlet buffer (by default the list is rebuilt in every update)
+
+        sparse : boolean
+          use hash table instead of dense grid for storing the cells
+
+        reorder : boolean
+          sort particles along a space-filling curve
           
         """
         self.init_ctype()
 
         self.cellsize   = cellsize
+        self.skin       = skin
+        self.sparse     = sparse
+        self.reorder    = reorder
         self.n_per_cell = n_per_cell
         self.n_atoms    = n_particles
 
@@ -110,6 +247,66 @@ class NBList(CWrapper):
         """
         self.ctype.update(universe.coords, int(update_box))
 
+    def reset(self):
+        """
+        Enforce a rebuild of the list in the next update.
+        """
+        self.ctype.reset()
+
+    def autotune(self, cutoff, coords=None, margin=1e-2):
+        """
+        Adapt the grid to the range of the interaction and, if coordinates
+        are provided, to the current density of the particles.
+
+        Parameters
+        ----------
+
+        cutoff :
+          distance beyond which the interaction vanishes
+
+        coords :
+          current positions of the particles
+
+        margin :
+          small offset added to the cutoff to obtain the cellsize
+          
+        """
+        cellsize = float(cutoff) + margin
+        if abs(cellsize - self.cellsize) > 1e-8: self.cellsize = cellsize
+
+        if coords is None: return
+
+        ## cells that are occupied by the current configuration; with a
+        ## subdivision, the grid is made of the smaller cells
+
+        coords = np.reshape(coords, (-1,3))
+        index  = np.floor((coords - coords.min(0)) / ((cellsize + self.skin) / self.subdivision))
+        index  = index.astype('l')
+        shape  = index.max(0) + 1
+
+        ## allow the grid to expand by a factor of two in each direction
+        ## before the cells need to be enlarged
+
+        n_occupied = float(np.prod(shape))
+        if not n_occupied <= self.n_cells**3 <= 64 * n_occupied:
+            self.n_cells = int(np.ceil(2 * n_occupied**(1/3.)))
+
+        counts = np.bincount(np.ravel_multi_index(index.T, shape))
+        self.n_per_cell = int(counts.max())
+
+    def pairs(self):
+        """
+        Returns read-only views of all pairs in the list without copying
+        them: the first and second particle of every pair and their squared
+        distance. With 'reorder' switched on, the particle indices refer
+        to the sorted particles ('ctype.order' maps them to the original
+        indices).
+
+        The views reflect later rebuilds of the list unless the buffers
+        had to be enlarged, in which case they keep the old pairs.
+        """
+        return self.ctype.pairs()
+
     def __setstate__(self, state):
 
         n_cells = state.pop('n_cells')
@@ -121,11 +318,11 @@ class NBList(CWrapper):
         
     def __str__(self):
 
-        s = '{0}({1},{2},{3},{4})'
+        s = '{0}({1},{2},{3},{4},skin={5})'
 
         return s.format(self.__class__.__name__,
                         self.cellsize, self.n_cells,
-                        self.n_per_cell, self.n_atoms)
+                        self.n_per_cell, self.n_atoms, self.skin)
 
     __repr__ = __str__
 
@@ -1,6 +1,6 @@
 import numpy as np
 
-from .core import Nominable
+from .core import Nominable, get_n_threads
 from csb.core import validatedproperty
 from collections import OrderedDict
 
@@ -123,6 +123,13 @@ class Distances(Array):
     Class for storing and evaluating inter-particle distances. In addition
     to the distances, this class also stores the indices of the particles
     between which the distances are defined
+
+    Optionally, the pairs are sorted by their particle indices such that
+    the evaluation of the distances and forces accesses coordinates and
+    forces in the order in which they are stored. Distances, indices and
+    the data of likelihoods defined on the distances then follow the
+    sorted order; the permutation relating it to the order in which the
+    pairs were passed is kept (see 'internal' and 'external').
     """
     @validatedproperty
     def first_index(values):
@@ -148,7 +155,15 @@ class Distances(Array):
         for i in xrange(len(self)):
             yield (self._first_index[i], self._second_index[i])
 
-    def __init__(self, pairs, name='distances'):
+    @property
+    def permutation(self):
+        """
+        Position of each pair in the list of pairs passed to the constructor
+        (None if the pairs were not sorted)
+        """
+        return self._permutation
+
+    def __init__(self, pairs, name='distances', sort=False):
         """Distances
 
         Pairwise distances between particles
@@ -159,14 +174,52 @@ class Distances(Array):
         pairs: iterable
           2-tuples specifying the particles whose pairwise distances will be
           computed
+
+        sort : boolean
+          store the pairs sorted by the first and then by the second index
         """
         super(Distances, self).__init__(name, len(pairs))
 
-        i, j = np.transpose(pairs).astype('i')
+        i, j = np.reshape(pairs, (-1,2)).T.astype('i')
+
+        self._permutation = None
+
+        if sort:
+            self._permutation = np.lexsort((j, i))
+
+            i = i[self._permutation]
+            j = j[self._permutation]
 
         self.first_index  = i
         self.second_index = j
 
+    def internal(self, values):
+        """
+        Returns values given in the order of the pairs passed to the
+        constructor in the order in which the pairs are stored.
+        """
+        values = np.asarray(values)
+
+        if self._permutation is None:
+            return values
+
+        return np.ascontiguousarray(values[self._permutation])
+
+    def external(self, values):
+        """
+        Returns values given in the order in which the pairs are stored in
+        the order of the pairs passed to the constructor.
+        """
+        values = np.asarray(values)
+
+        if self._permutation is None:
+            return values
+
+        result = np.empty_like(values)
+        result[self._permutation] = values
+
+        return result
+
     def set(self, distances):
 
         if np.any(distances < 0.):
@@ -189,7 +242,7 @@ class ModelDistances(Distances,MockData):
 
     Class for storing and *evaluating* inter-particle distances. 
     """
-    def __init__(self, pairs, name='distances'):
+    def __init__(self, pairs, name='distances', sort=False):
         """Distances
 
         Pairwise distances between particles
@@ -200,8 +253,12 @@ class ModelDistances(Distances,MockData):
         pairs : iterable
           2-tuples specifying the particles whose pairwise distances will be
           computed
+
+        sort : boolean
+          store the pairs sorted by the first and then by the second index
+          (improves memory locality in the evaluation of distances and forces)
         """
-        super(ModelDistances, self).__init__(pairs, name)
+        super(ModelDistances, self).__init__(pairs, name, sort)
 
     def update(self, params):
 
@@ -210,7 +267,8 @@ class ModelDistances(Distances,MockData):
         calc_data(params['coordinates'].get(),
                   self.first_index,
                   self.second_index,
-                  self._value)
+                  self._value,
+                  n_threads=get_n_threads())
 
     def update_forces(self, derivatives, params):
         """
@@ -224,7 +282,33 @@ class ModelDistances(Distances,MockData):
                       self.second_index,
                       self._value,
                       derivatives,
-                      params['forces'].get())
+                      params['forces'].get(),
+                      n_threads=get_n_threads())
+
+    def fused_log_prob(self, kernel, params, *args):
+        """
+        Evaluates the distances and the log probability computed by 'kernel'
+        (see 'isdhic.fused') in a single loop. Additional arguments are
+        passed on to the kernel.
+        """
+        return kernel(params['coordinates'].get(),
+                      self.first_index,
+                      self.second_index,
+                      self._value,
+                      *args, n_threads=get_n_threads())
+
+    def fused_update_forces(self, kernel, derivatives, params, *args):
+        """
+        Evaluates the distances, the derivatives computed by 'kernel' (see
+        'isdhic.fused') and the Cartesian forces in a single loop.
+        """
+        kernel(params['coordinates'].get(),
+               self.first_index,
+               self.second_index,
+               self._value,
+               derivatives,
+               params['forces'].get(),
+               *args, n_threads=get_n_threads())
 
 class RadiusOfGyration(MockData):
 
@@ -81,7 +81,7 @@ class ConditionalPosterior(Probability):
         Total log probability generated by the prior and likelihood
         factors.
         """
-        self.update()
+        self.update(skip_fused=True)
 
         log_p = 0.
         
@@ -89,9 +89,14 @@ class ConditionalPosterior(Probability):
 
         return log_p
 
-    def update(self):
+    def update(self, skip_fused=False):
+        """
+        Update the mock data of all likelihoods. Likelihoods that evaluate
+        their mock data in fused kernels can be skipped.
+        """
         for model in self.likelihoods:
-            model.update()
+            if not (skip_fused and model.fused):
+                model.update()
 
 class PosteriorCoordinates(ConditionalPosterior):
     """PosteriorCoordinates
@@ -105,7 +110,7 @@ class PosteriorCoordinates(ConditionalPosterior):
         to guide a sampler for generating conformations from
         the conditional posterior. 
         """
-        self.update()
+        self.update(skip_fused=True)
         self.params['forces'].set(0.)
         
         for p in self: p.update_forces()
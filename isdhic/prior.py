@@ -27,10 +27,6 @@ class BoltzmannEnsemble(Probability):
 
         self._beta = Scale(self.name + '.beta')
         self.params.add(self._beta)
-
-        ## local copy of Cartesian gradient
-
-        self._forces = self.params['coordinates'].get() * 0.
         
     def log_prob(self):
 
@@ -38,18 +34,21 @@ class BoltzmannEnsemble(Probability):
 
         return - self.beta * self.forcefield.energy(coords)
 
-    def update_forces(self):
-
+    def energy_and_gradient(self):
+        """
+        Negative log probability and its gradient with respect to the
+        coordinates evaluated in a single sweep over the neighbor list.
+        """
         coords = self.params['coordinates'].get()
+        E, grad = self.forcefield.energy_and_gradient(coords)
 
-        self._forces[...] = 0.
+        return self.beta * E, self.beta * grad
 
-        self.forcefield.update_list(coords)        
-        self.forcefield.update_gradient(coords, self._forces)
+    def update_forces(self):
 
-        self._forces *= -self.beta
+        E, grad = self.energy_and_gradient()
         
-        self.params['forces']._value += self._forces
+        self.params['forces']._value -= grad
 
 class TsallisEnsemble(BoltzmannEnsemble):
 
@@ -103,27 +102,17 @@ class TsallisEnsemble(BoltzmannEnsemble):
             
             return - q / (q-1) * np.log(1 + (q-1) * (E-E_min)) - E_min
 
-    def update_forces(self):
+    def energy_and_gradient(self):
 
         if self.q == 1.:
-            super(TsallisEnsemble, self).update_forces()
-
-        else:
-
-            coords = self.params['coordinates'].get()
-
-            self._forces[...] = 0.
-
-            self.forcefield.update_list(coords)        
-            E = self.forcefield.update_gradient(coords, self._forces)
+            return super(TsallisEnsemble, self).energy_and_gradient()
 
-            q  = self.q
-            E *= self.beta
-            E_min = self.beta * self.E_min
-            f = - self.beta * q / (1 + (q-1) * (E-E_min))
-        
-            self._forces *= f
+        coords = self.params['coordinates'].get()
+        E, grad = self.forcefield.energy_and_gradient(coords)
 
-            self.params['forces']._value += self._forces
+        q  = self.q
+        E *= self.beta
+        E_min = self.beta * self.E_min
+        f = self.beta * q / (1 + (q-1) * (E-E_min))
 
-        
+        return q / (q-1) * np.log(1 + (q-1) * (E-E_min)) + E_min, f * grad
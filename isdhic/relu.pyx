@@ -1,7 +1,13 @@
+# distutils: extra_compile_args = -fopenmp
+# distutils: extra_link_args = -fopenmp
 import numpy
 cimport numpy
 cimport cython
 
+from cython.parallel cimport prange
+
+from isdhic cimport kernels
+
 DTYPE_FLOAT = numpy.float
 ctypedef numpy.float_t DTYPE_FLOAT_t
 
@@ -14,45 +20,39 @@ ctypedef numpy.double_t DTYPE_DOUBLE_t
 DTYPE_LONG = numpy.long
 ctypedef numpy.long_t DTYPE_LONG_t
 
-cdef extern from "math.h":
-    double log(double)
-    double exp(double)
-    
-
-@cython.boundscheck(True)
+@cython.cdivision(True)
+@cython.boundscheck(False)
 @cython.wraparound(False)
 def log_prob(double [::1] data,
              double [::1] mock,
-             double steepness):
+             double steepness,
+             double [::1] weights=None):
 
     cdef Py_ssize_t i
     cdef int n = len(data)
-    cdef double x, lgp = 0.
+    cdef bint weighted = weights is not None
+    cdef double lgp = 0.
     
-    for i in range(n):
+    with nogil:
+        for i in range(n):
 
-        x = mock[i] - data[i]
-        if x > 0.: lgp -= x
+            lgp += (weights[i] if weighted else 1.) * \
+                   kernels.relu_log_prob(mock[i], data[i], steepness)
 
-    return steepness * lgp
+    return lgp
 
-@cython.boundscheck(True)
+@cython.cdivision(True)
+@cython.boundscheck(False)
 @cython.wraparound(False)
 def update_derivatives(double [::1] data,
                        double [::1] mock,
                        double [::1] grad,
-                       double steepness):
+                       double steepness,
+                       int n_threads=1):
 
     cdef Py_ssize_t i
     cdef int n = len(data)
-    cdef double x
     
-    for i in range(n):
-
-        x = mock[i] - data[i]
-
-        if x > 0.:
-            grad[i] = -steepness
-        else:
-            grad[i] = 0.
+    for i in prange(n, nogil=True, num_threads=max(n_threads, 1), schedule='static'):
 
+        grad[i] = kernels.relu_derivative(mock[i], data[i], steepness)
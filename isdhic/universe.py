@@ -75,14 +75,29 @@ class Universe(object):
         """
         return self._forces
 
-    def __init__(self, n_particles):
+    @property
+    def dtype(self):
+        """
+        Floating point type of coordinates and forces.
+        """
+        return self._coords.dtype
+
+    def __init__(self, n_particles, dtype=np.float64):
         """Universe
 
         Initialize Universe by specifying the number of particles contained
-        in the universe.
+        in the universe. Coordinates and forces can be stored in single
+        precision (dtype=np.float32), which halves the memory needed for
+        them; energies and log probabilities are still computed in double
+        precision.
         """
-        self._coords = np.zeros((n_particles,3))
-        self._forces = np.zeros((n_particles,3))
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            msg = 'Coordinates must be stored in single or double precision'
+            raise ValueError(msg)
+
+        self._coords = np.zeros((n_particles,3), dtype)
+        self._forces = np.zeros((n_particles,3), dtype)
 
         Particle.set_coords(self.coords)
 
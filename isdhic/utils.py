@@ -30,7 +30,7 @@ def randomwalk(n_steps, dim=3):
 
     return np.add.accumulate(bonds,0)
 
-def create_universe(n_particles=1, diameter=1):
+def create_universe(n_particles=1, diameter=1, dtype=np.float64):
     """
     Create a universe containing 'n_particles' Particles of
     given diameter. The coordinates of the particles follow
@@ -44,8 +44,11 @@ def create_universe(n_particles=1, diameter=1):
 
     diameter : non-negative float
       particle diameter
+
+    dtype : np.float32 or np.float64
+      precision of coordinates and forces
     """
-    universe = Universe(int(n_particles))
+    universe = Universe(int(n_particles), dtype)
     universe.coords[...] = randomwalk(n_particles) * diameter
 
     return universe
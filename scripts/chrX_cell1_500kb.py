@@ -44,7 +44,8 @@ tau_rog     = n_rog / sigma_rog**2
 
 ## Read data and map chromosomal positions onto 500Kb beads and
 ## remove contacts arising from loci that are close in sequence and
-## were mapped to the same bead.
+## were mapped to the same bead. Contacts between the same pair of
+## beads are restrained once and weighted by their number.
 
 parser      = HiCParser(filename, 'X', 'X')
 datasets    = parser.parse()
@@ -54,6 +55,8 @@ model       = ('logistic', 'relu')[0]
 dataset.coarsen(n_particles, chrsize)
 dataset.remove_self_contacts()
 
+contacts, counts = dataset.unique_contacts()
+
 ## Set up posterior probability using the above settings
 
 simulation  = ChromosomeSimulation(n_particles,
@@ -63,7 +66,7 @@ simulation  = ChromosomeSimulation(n_particles,
                                    factor     = factor,
                                    contact_model = model)
 
-posterior = simulation.create_chromosome(list(dataset))
+posterior = simulation.create_chromosome(contacts, counts)
 universe  = simulation.universe
 coords    = simulation.params['coordinates']
 forces    = simulation.params['forces']
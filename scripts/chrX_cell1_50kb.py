@@ -44,7 +44,8 @@ tau_rog     = n_rog / sigma_rog**2
 
 ## Read data and map chromosomal positions onto 500Kb beads and
 ## remove contacts arising from loci that are close in sequence and
-## were mapped to the same bead.
+## were mapped to the same bead. Contacts between the same pair of
+## beads are restrained once and weighted by their number.
 
 parser      = HiCParser(filename, 'X', 'X')
 datasets    = parser.parse()
@@ -53,6 +54,8 @@ dataset     = datasets[('X','X')]
 dataset.coarsen(n_particles, chrsize)
 dataset.remove_self_contacts()
 
+contacts, counts = dataset.unique_contacts()
+
 ## Set up posterior probability using the above settings
 
 simulation  = ChromosomeSimulation(n_particles,
@@ -61,7 +64,7 @@ simulation  = ChromosomeSimulation(n_particles,
                                    diameter   = diameter,
                                    factor     = factor)
 
-posterior = simulation.create_chromosome(list(dataset))
+posterior = simulation.create_chromosome(contacts, counts)
 universe  = simulation.universe
 coords    = simulation.params['coordinates']
 forces    = simulation.params['forces']
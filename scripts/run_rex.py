@@ -36,6 +36,11 @@ class Replica(HamiltonianMonteCarlo):
 
         self.set_replica_params()
 
+        ## replicas differ in their compaction, therefore the neighbor
+        ## list is adapted to the current structure of each replica
+
+        self.model['tsallis'].forcefield.autotune(self.parameter.get())
+
         for i in xrange(self.n_steps):
             state = super(Replica, self).next()
 
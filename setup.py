@@ -33,13 +33,16 @@ module = Extension('isdhic._isdhic',
                                     ('MINOR_VERSION', '1'),
                                     ('PY_ARRAY_UNIQUE_SYMBOL','ISDHIC')],
                       include_dirs = [numpy.get_include(), './isdhic/c'],
-                      extra_compile_args = ['-Wno-cpp'],
+                      extra_compile_args = ['-Wno-cpp', '-fopenmp', '-fno-math-errno', '-fno-trapping-math'],
+                      extra_link_args = ['-fopenmp'],
                       sources = ['./isdhic/c/_isdhicmodule.c',
                                  './isdhic/c/mathutils.c',
                                  './isdhic/c/forcefield.c',
                                  './isdhic/c/prolsq.c',
                                  './isdhic/c/nblist.c',
+                                 './isdhic/c/bvh.c',
                                  './isdhic/c/rosetta.c', 
+                                 './isdhic/c/tabulated.c',
                                  ])
 
 os.environ['CFLAGS'] = '-Wno-cpp'
@@ -0,0 +1,79 @@
+"""
+Microbenchmark of the specialized pair kernels of the force fields
+against the evaluation of every pair through a function pointer.
+"""
+import time
+import isdhic
+import numpy as np
+
+from benchmark_nblist import confined_walk
+
+def benchmark(forcefield, coords, n_repeats=10):
+    """
+    Average time needed to evaluate the energy and the gradient for a
+    fixed neighbor list.
+    """
+    coords = np.ascontiguousarray(coords.flatten())
+    forces = np.zeros(coords.shape)
+    types  = forcefield.types
+
+    forcefield.update_list(coords)
+
+    t_energy = t_grad = 0.
+
+    for _ in range(n_repeats):
+
+        t0 = time.time()
+        forcefield.ctype.energy(coords.reshape(-1,3), types)
+        t1 = time.time()
+        forcefield.ctype.update_gradient(coords, forces, types, 1)
+        t2 = time.time()
+
+        t_energy += t1 - t0
+        t_grad   += t2 - t1
+
+    return t_energy / n_repeats, t_grad / n_repeats
+
+def create_forcefield(name, n_particles, n_types=1):
+
+    universe   = isdhic.Universe(n_particles)
+    forcefield = isdhic.ForcefieldFactory.create_forcefield(name, universe)
+
+    forcefield.n_types = n_types
+    forcefield.d = np.ones((n_types,n_types)) * 4.
+    forcefield.k = np.ones((n_types,n_types)) * 0.0486
+    forcefield.types = np.random.randint(0, n_types, n_particles).astype('i')
+
+    if name == 'tabulated':
+        forcefield.tabulate(lambda r: 0.5 * np.clip(4. - r, 0., None)**4, 4.)
+
+    return forcefield
+
+if __name__ == '__main__':
+
+    from isdhic.core import format_time
+
+    n_particles = 30000
+    coords = confined_walk(n_particles)
+
+    out = '{0:>8s} {1:d} type(s) {2:>16s}   energy: {3:>9s}   gradient: {4:>9s}   ns/pair: {5:.1f}'
+
+    for name in ('prolsq', 'rosetta', 'tabulated'):
+
+        for n_types in (1, 3):
+
+            forcefield = create_forcefield(name, n_particles, n_types)
+
+            ## tabulated force field has no energy term per pair
+
+            for vectorize in ((0, 1), (1,))[name == 'tabulated']:
+
+                forcefield.vectorize = vectorize
+
+                t_energy, t_grad = benchmark(forcefield, coords)
+                n_pairs = forcefield.nblist.ctype.n_pairs
+
+                print out.format(name, n_types,
+                                 ('function pointer', 'pair kernel')[vectorize],
+                                 format_time(t_energy), format_time(t_grad),
+                                 1e9 * t_grad / n_pairs)
@@ -0,0 +1,71 @@
+"""
+Benchmark of the likelihoods over distances: time per restraint needed to
+evaluate the log probability and the forces in separate passes and with
+fused kernels.
+"""
+import time
+import isdhic
+import numpy as np
+
+from isdhic import utils
+from test_params import random_pairs
+
+def benchmark(likelihood, forces, n_repeats=100):
+    """
+    Average time needed to evaluate the log probability and to update the
+    forces including the evaluation of the distances.
+    """
+    t_prob = t_forces = 0.
+
+    for _ in range(n_repeats):
+
+        t0 = time.time()
+        if not likelihood.fused: likelihood.update()
+        likelihood.log_prob()
+        t1 = time.time()
+        if not likelihood.fused: likelihood.update()
+        likelihood.update_forces()
+        t2 = time.time()
+
+        t_prob   += t1 - t0
+        t_forces += t2 - t1
+
+    return t_prob / n_repeats, t_forces / n_repeats
+
+def create_likelihoods(n_particles, n_data):
+
+    universe = utils.create_universe(n_particles=n_particles, diameter=4.)
+    params   = isdhic.Parameters()
+    pairs    = random_pairs(n_particles, n_data)
+    data     = np.random.random(n_data) * 10. + 40.
+    mock     = isdhic.ModelDistances(pairs, 'contacts')
+
+    for param in (isdhic.Coordinates(universe), isdhic.Forces(universe), mock):
+        params.add(param)
+
+    likelihoods = (isdhic.Logistic('logistic', data, mock, 5., params=params),
+                   isdhic.Relu('relu', data, mock, 5., params=params),
+                   isdhic.LowerUpper('lowerupper', data, mock, data - 5., data, params=params),
+                   isdhic.Normal('normal', data, mock, 0.1, params=params))
+
+    return likelihoods, params['forces']
+
+if __name__ == '__main__':
+
+    n_particles = 10000
+    n_data      = 100000
+
+    likelihoods, forces = create_likelihoods(n_particles, n_data)
+
+    out = '{0:>10s} {1:>15s}   log_prob: {2:6.1f} ns   forces: {3:6.1f} ns'
+
+    for likelihood in likelihoods:
+
+        for fused in (False, True):
+
+            likelihood.fused = fused
+
+            t_prob, t_forces = benchmark(likelihood, forces)
+
+            print out.format(likelihood.name, ('separate passes','fused kernels')[fused],
+                             1e9 * t_prob / n_data, 1e9 * t_forces / n_data)
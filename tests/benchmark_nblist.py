@@ -0,0 +1,99 @@
+"""
+Benchmark of neighbor list construction and forcefield evaluation for
+compact chains of increasing size. In list-free mode, the list update
+only assigns the particles to cells and the pairs are found during the
+evaluation of the gradient.
+"""
+import time
+import isdhic
+import numpy as np
+
+def confined_walk(n_particles, density=0.015, bondlength=4.):
+    """
+    Random walk with reflecting walls that mimics a compact chromosome
+    conformation.
+    """
+    boxsize = (n_particles / density)**(1/3.)
+    bonds   = np.random.standard_normal((n_particles,3))
+    bonds   = (bonds.T / np.sum(bonds**2,1)**0.5).T * bondlength
+    coords  = np.zeros((n_particles,3))
+    x       = np.random.random(3) * boxsize
+
+    for i in xrange(n_particles):
+        x = x + bonds[i]
+        x = np.where(x < 0., -x, x)
+        x = np.where(x > boxsize, 2 * boxsize - x, x)
+        coords[i] = x
+
+    return coords
+
+def benchmark(forcefield, coords, n_repeats=10):
+    """
+    Average time needed to rebuild the neighbor list and to evaluate the
+    gradient.
+    """
+    coords = np.ascontiguousarray(coords.flatten())
+    forces = np.zeros(coords.shape)
+    types  = forcefield.types
+    
+    t_list = t_grad = 0.
+
+    ## the first update also tunes the grid
+
+    forcefield.update_list(coords)
+
+    for _ in range(n_repeats):
+
+        forcefield.nblist.reset()
+
+        t0 = time.time()
+        forcefield.update_list(coords)
+        t1 = time.time()
+        forcefield.ctype.update_gradient(coords, forces, types, 1)
+        t2 = time.time()
+
+        t_list += t1 - t0
+        t_grad += t2 - t1
+
+    return t_list / n_repeats, t_grad / n_repeats
+
+def create_forcefield(n_particles, **options):
+
+    universe   = isdhic.Universe(n_particles)
+    forcefield = isdhic.ForcefieldFactory.create_forcefield('rosetta', universe)
+    forcefield.d = np.array([[4.]])
+    forcefield.k = np.array([[0.0486]])
+
+    for attr, value in options.items():
+        setattr(forcefield.nblist, attr, value)
+
+    return forcefield
+
+if __name__ == '__main__':
+
+    from isdhic.core import format_time
+
+    settings = [('original order', {}),
+                ('Morton order', {'reorder': True}),
+                ('4 threads', {'reorder': True, 'n_threads': 4}),
+                ('half cells', {'reorder': True, 'subdivision': 2}),
+                ('third cells', {'reorder': True, 'subdivision': 3}),
+                ('segment BVH', {'bvh': True}),
+                ('list-free', {'reorder': True, 'store_pairs': False})]
+
+    out = '{0:>7d} {1:>16s}   list: {2:>9s}   gradient: {3:>9s}   speedup: {4:.2f}'
+
+    for n_particles in (3000, 30000, 300000):
+
+        coords = confined_walk(n_particles)
+        timing = []
+
+        for name, options in settings:
+
+            forcefield = create_forcefield(n_particles, **options)
+            t_list, t_grad = benchmark(forcefield, coords)
+
+            timing.append(t_list + t_grad)
+
+            print out.format(n_particles, name, format_time(t_list),
+                             format_time(t_grad), timing[0] / timing[-1])
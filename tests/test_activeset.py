@@ -0,0 +1,71 @@
+"""
+Compare logistic and relu likelihoods evaluated in active-set mode, which
+skips satisfied restraints, with the evaluation of all restraints along a
+random walk of the particles.
+"""
+import isdhic
+import numpy as np
+
+from isdhic import utils
+from isdhic.core import take_time
+
+from test_params import random_pairs
+
+def evaluate(likelihood, forces):
+
+    forces.set(0.)
+    likelihood.update_forces()
+
+    return likelihood.log_prob(), forces.get().copy()
+
+if __name__ == '__main__':
+
+    universe = utils.create_universe(n_particles=2000, diameter=4.)
+    coords   = isdhic.Coordinates(universe)
+    forces   = isdhic.Forces(universe)
+    params   = isdhic.Parameters()
+    n_data   = 30000
+    pairs    = random_pairs(universe.n_particles, n_data)
+    mock     = isdhic.ModelDistances(pairs, 'contacts')
+
+    for param in (coords, forces, mock):
+        params.add(param)
+
+    mock.update(params)
+
+    ## most contacts are satisfied
+
+    data = mock.get() + np.random.standard_normal(n_data) * 2. + 3.
+
+    for likelihood in (isdhic.Logistic('logistic', data, mock, 5., params=params),
+                       isdhic.Relu('relu', data, mock, 5., params=params)):
+
+        active = likelihood.__class__(likelihood.name + '.active', data, mock, 5.,
+                                      params=params, tolerance=1e-3)
+
+        x = coords.get().copy()
+        y = x.copy()
+        errors, n_steps = [], 50
+
+        for step in range(n_steps):
+
+            y += np.random.standard_normal(x.shape) * 0.02
+            coords.set(y)
+
+            with take_time('{0:>10s} evaluated for all restraints'.format(likelihood.name)):
+                a = evaluate(likelihood, forces)
+            with take_time('{0:>10s} evaluated in active-set mode'.format(likelihood.name)):
+                b = evaluate(active, forces)
+
+            errors.append((abs(a[0]-b[0]), np.fabs(a[1]-b[1]).max() / np.fabs(a[1]).max()))
+
+        errors = np.array(errors)
+
+        print '{0}: {1} of {2} restraints active, {3} full passes in {4} steps'.format(
+            likelihood.name, len(active.active_set), n_data, active.n_passes, n_steps)
+        print 'Are full passes rare? ---', active.n_passes < n_steps / 10
+        print 'Is the error of the log probability below the tolerance? ---', \
+              errors[:,0].max() <= active.tolerance, errors[:,0].max()
+        print 'Do forces agree? ---', errors[:,1].max() < 1e-3, errors[:,1].max()
+
+    coords.set(x)
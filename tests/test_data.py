@@ -1,4 +1,5 @@
 import isdhic
+import numpy as np
 
 data = isdhic.HiCData(np.array([(1,1),(1,2),(2,1),(3,1)]))
 print data.data
@@ -9,6 +10,9 @@ print data.data
 data.remove_redundant_contacts()
 print data.data
 
+data = isdhic.HiCData(np.array([(1,2),(2,1),(3,1),(1,2)]))
+print data.unique_contacts()
+
 filename = '../data/GSM1173493_cell-1.txt'
 parser = isdhic.HiCParser(filename)
 datasets = parser.parse()
@@ -0,0 +1,76 @@
+"""
+Compare likelihoods over distances evaluated with fused kernels against
+the evaluation in separate passes over the restraints.
+"""
+import isdhic
+import numpy as np
+
+from isdhic import utils
+from isdhic.core import take_time
+
+from test_params import random_pairs
+
+def evaluate(likelihood, forces):
+
+    forces.set(0.)
+    if not likelihood.fused: likelihood.update()
+    likelihood.update_forces()
+
+    return likelihood.log_prob(), forces.get().copy()
+
+if __name__ == '__main__':
+
+    universe = utils.create_universe(n_particles=5000, diameter=4.)
+    coords   = isdhic.Coordinates(universe)
+    forces   = isdhic.Forces(universe)
+    params   = isdhic.Parameters()
+
+    for param in (coords, forces):
+        params.add(param)
+
+    n_data   = 30000
+    pairs    = random_pairs(universe.n_particles, n_data)
+    data     = np.random.random(n_data) * 10. + 40.
+    mock     = isdhic.ModelDistances(pairs, 'contacts')
+
+    params.add(mock)
+
+    likelihoods = (isdhic.Logistic('logistic', data, mock, 5., params=params),
+                   isdhic.Relu('relu', data, mock, 5., params=params),
+                   isdhic.LowerUpper('lowerupper', data, mock, data - 5., data, params=params),
+                   isdhic.Normal('normal', data, mock, 0.1, params=params))
+
+    for likelihood in likelihoods:
+
+        likelihood.fused = False
+
+        with take_time('{0:>10s} in separate passes'.format(likelihood.name)):
+            a = evaluate(likelihood, forces)
+
+        likelihood.fused = True
+
+        with take_time('{0:>10s} with fused kernels'.format(likelihood.name)):
+            b = evaluate(likelihood, forces)
+
+        print 'Do log probability and forces agree? ---', \
+              np.isclose(a[0], b[0]) and np.allclose(a[1], b[1])
+
+    ## kernels with several threads and per-thread force buffers
+
+    for likelihood in likelihoods:
+
+        isdhic.set_n_threads(1)
+        a = evaluate(likelihood, forces)
+
+        isdhic.set_n_threads(4)
+        b = evaluate(likelihood, forces)
+
+        likelihood.fused = False
+        c = evaluate(likelihood, forces)
+        likelihood.fused = True
+
+        print 'Do results with {0} threads agree? ---'.format(isdhic.get_n_threads()), \
+              np.isclose(a[0], b[0]) and np.allclose(a[1], b[1]) and \
+              np.isclose(a[0], c[0]) and np.allclose(a[1], c[1])
+
+    isdhic.set_n_threads(1)
@@ -76,9 +76,17 @@ if __name__ == '__main__':
     with take_time('evaluating derivatives of cython version'):
         logistic2.update_derivatives()
 
+    forces.set(0.)
+    logistic2.update_forces()
+
+    forces_fused = forces.get().copy()
+
     forces.set(0.)
     logistic.update_forces()
 
+    print 'Do fused kernel and python version yield the same forces? ---', \
+          logistic2.fused and not logistic.fused and np.allclose(forces_fused, forces.get())
+
     ## numerical gradient
 
     f = lambda x, params=params, likelihood=logistic: \
@@ -76,9 +76,17 @@ if __name__ == '__main__':
     with take_time('evaluating derivatives of cython version'):
         relu2.update_derivatives()
 
+    forces.set(0.)
+    relu2.update_forces()
+
+    forces_fused = forces.get().copy()
+
     forces.set(0.)
     relu.update_forces()
 
+    print 'Do fused kernel and python version yield the same forces? ---', \
+          relu2.fused and not relu.fused and np.allclose(forces_fused, forces.get())
+
     ## numerical gradient
 
     f = lambda x, params=params, likelihood=relu: \
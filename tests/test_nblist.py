@@ -62,3 +62,154 @@ if __name__ == '__main__':
     print np.all(squareform(A,checks=False) ==
                  squareform((d<nblist.cellsize).astype('i'),checks=False))
 
+    ## sparse grid storing only occupied cells in a hash table
+
+    sparse = isdhic.NBList(cellsize, n_cells, n_per_cell, n_particles, sparse=True)
+    C = pairs_to_matrix(nblist_pairs(sparse, universe), n_particles)
+
+    print 'Are contact matrices of dense and sparse grid identical? ---',
+    print np.all(A == C)
+
+    ## cells that are too small are enlarged instead of dropping particles
+
+    small = isdhic.NBList(cellsize, n_cells, 2, n_particles)
+    C = pairs_to_matrix(nblist_pairs(small, universe), n_particles)
+
+    print 'Are contact matrices identical if cells need to grow? ---',
+    print np.all(A == C), '({0} resizes, max. {1} per cell)'.format(
+        small.n_resizes, small.max_per_cell)
+
+    ## parallel construction yields the same list
+
+    parallel = isdhic.NBList(cellsize, n_cells, n_per_cell, n_particles)
+    parallel.n_threads = 4
+    parallel.update(universe)
+    nblist.update(universe)
+
+    print 'Is list built with {} threads identical? ---'.format(parallel.n_threads),
+    print np.all(parallel.ctype.contacts == nblist.ctype.contacts)
+
+    ## zero-copy views of the pairs
+
+    first, second, sq_distances = nblist.pairs()
+    D = pairs_to_matrix(zip(first, second), n_particles)
+
+    print 'Do pair views agree with the contact list? ---',
+    print np.all(A == D) and np.allclose(sq_distances, d[first,second]**2)
+
+    ## elongated conformation: grid adapts to the shape of the bounding box
+
+    elongated = coords * np.array([10., 1., 1.])
+    universe.coords[...] = elongated
+
+    shaped = isdhic.NBList(cellsize, 20, n_per_cell, n_particles)
+    contacts = nblist_pairs(shaped, universe)
+    contacts = set([(min(i,j),max(i,j)) for i, j in contacts])
+
+    print 'Is list of elongated conformation correct? ---',
+    print contacts == kd_pairs(elongated, cellsize), \
+          '(grid shape: {0})'.format(shaped.ctype.shape)
+
+    ## grid tuned to the interaction cutoff and the density
+
+    shaped.autotune(cellsize, elongated)
+    contacts = nblist_pairs(shaped, universe)
+    contacts = set([(min(i,j),max(i,j)) for i, j in contacts])
+
+    print 'Is list correct after autotuning? ---',
+    print contacts == kd_pairs(elongated, shaped.cellsize), \
+          '(n_cells={0}, n_per_cell={1})'.format(shaped.n_cells, shaped.n_per_cell)
+
+    ## autotuning provides room for the finer grid of a subdivision
+
+    shape = np.array(shaped.ctype.shape)
+
+    for subdivision in (2, 3):
+
+        subdivided = isdhic.NBList(cellsize, n_cells, n_per_cell, n_particles)
+        subdivided.subdivision = subdivision
+        subdivided.autotune(cellsize, elongated)
+        contacts = nblist_pairs(subdivided, universe)
+        contacts = set([(min(i,j),max(i,j)) for i, j in contacts])
+
+        print 'Is grid subdivided {0} times after autotuning? ---'.format(subdivision),
+        print contacts == kd_pairs(elongated, subdivided.cellsize) and \
+              np.all(np.array(subdivided.ctype.shape) >= subdivision * (shape - 1)), \
+              '(grid shape: {0})'.format(subdivided.ctype.shape)
+
+    universe.coords[...] = coords
+
+    ## bounding volume hierarchy over chain segments instead of cells
+
+    hierarchy = isdhic.NBList(cellsize, n_cells, n_per_cell, n_particles)
+    hierarchy.bvh = True
+    C = pairs_to_matrix(nblist_pairs(hierarchy, universe), n_particles)
+
+    print 'Are contact matrices of grid and BVH identical? ---',
+    print np.all(A == C)
+
+    ## grid maintenance is skipped if the hierarchy finds the pairs
+
+    hierarchy.incremental = True
+    hierarchy.reorder = True
+
+    for _ in range(3):
+        universe.coords[...] += np.random.standard_normal(coords.shape) * 0.1
+        contacts = set([(min(i,j),max(i,j)) for i, j in nblist_pairs(hierarchy, universe)])
+
+    print 'Is BVH unaffected by incremental and reordered grid? ---',
+    print contacts == kd_pairs(universe.coords, cellsize) and \
+          np.all(hierarchy.ctype.order == np.arange(n_particles))
+
+    universe.coords[...] = coords
+
+    ## incremental update: only particles that left their cell are moved
+
+    incremental = isdhic.NBList(cellsize, n_cells, n_per_cell, n_particles, sparse=True)
+    incremental.incremental = True
+    incremental.update(universe)
+
+    complete = True
+    n_moved  = 0
+
+    for _ in range(10):
+
+        universe.coords[...] += np.random.uniform(-1,1,coords.shape) * 1e-2 * cellsize
+
+        contacts = nblist_pairs(incremental, universe)
+        contacts = set([(min(i,j),max(i,j)) for i, j in contacts])
+        complete&= kd_pairs(universe.coords, cellsize) == contacts
+        n_moved += incremental.ctype.n_moved
+
+    print 'Is incrementally updated list correct? ---', complete, \
+          '({0:.1f} particles moved per update)'.format(n_moved / 10.)
+
+    ## Verlet skin: list is only rebuilt if particles move too much
+
+    nblist.skin = 0.2 * cellsize
+    nblist.n_rebuilds = 0
+
+    complete = True
+    
+    for _ in range(100):
+
+        universe.coords[...] += np.random.uniform(-1,1,coords.shape) * 1e-2 * cellsize
+
+        contacts = nblist_pairs(nblist, universe)
+        contacts = set([(min(i,j),max(i,j)) for i, j in contacts])
+        complete&= kd_pairs(universe.coords, cellsize).issubset(contacts)
+        
+    print 'Is Verlet list complete? ---', complete
+    print 'Number of rebuilds in 100 updates: {}'.format(nblist.n_rebuilds)
+
+    ## errors of the update are raised
+
+    tiny = isdhic.NBList(0.01, 2000, 10, universe.n_particles)
+
+    try:
+        tiny.ctype.update(universe.coords * 100., 1)
+        raised = False
+    except ValueError:
+        raised = True
+
+    print 'Is an oversized grid reported? ---', raised
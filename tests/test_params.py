@@ -76,3 +76,64 @@ if __name__ == '__main__':
 
     print params
 
+    print 'Does it pay off to sort the pairs?\n'
+
+    forces = isdhic.Forces(universe)
+    params.add(forces)
+
+    ## contacts close to the diagonal in random order (like Hi-C contacts)
+
+    first  = np.random.randint(0, n_particles-100, 100000)
+    second = first + 1 + np.random.geometric(0.05, len(first)).clip(0, 98)
+    pairs  = np.transpose([first, second])
+    grad   = np.random.standard_normal(len(pairs))
+
+    unsorted = isdhic.ModelDistances(pairs, 'unsorted')
+    ordered  = isdhic.ModelDistances(pairs, 'sorted', sort=True)
+
+    results = []
+
+    for distances, g in ((unsorted, grad), (ordered, ordered.internal(grad))):
+
+        forces.set(0.)
+
+        with take_time('\t"{0}"'.format(distances.name)):
+            for _ in range(10):
+                distances.update(params)
+                distances.update_forces(g, params)
+
+        results.append((distances.external(distances.get()), forces.get().copy()))
+
+    print '\n\tmax discrepancy between distances: {0:.1e}, forces: {1:.1e}\n'.format(
+        np.fabs(results[0][0] - results[1][0]).max(),
+        np.fabs(results[0][1] - results[1][1]).max())
+
+    ## likelihoods on sorted distances store data, bounds and weights in
+    ## the sorted order
+
+    params.add(ordered)
+    params.add(unsorted)
+
+    d = unsorted.get()
+    lower, upper = d - np.random.random(len(d)), d + np.random.random(len(d))
+    weights = np.random.randint(1, 5, len(d))
+
+    results = []
+
+    for distances in (unsorted, ordered):
+
+        likelihood = isdhic.LowerUpper(distances.name, d, distances, lower, upper,
+                                       params=params, weights=weights)
+        ordered_inputs = [distances.internal(values)
+                          for values in (d, lower, upper, weights)]
+
+        print 'Are data, bounds and weights stored in the order of the "{}" pairs? ---'.format(
+            distances.name), \
+            all(np.array_equal(a, b) for a, b in zip(
+                (likelihood.data, likelihood.lower, likelihood.upper, likelihood.weights),
+                ordered_inputs))
+
+        results.append(likelihood.log_prob())
+
+    print 'Is the log probability independent of sorting? ---', \
+          np.isclose(*results)
@@ -0,0 +1,33 @@
+"""
+Compare the posterior of a chromosome model evaluated with coordinates
+and forces stored in single and double precision.
+"""
+import isdhic
+import numpy as np
+
+from isdhic.chromosome import ChromosomeSimulation
+
+n_particles = 500
+contacts    = [(i,j) for i in range(0, n_particles, 7)
+               for j in range(i+5, n_particles, 37)]
+results     = {}
+
+for dtype in (np.float64, np.float32):
+
+    np.random.seed(42)
+
+    simulation = ChromosomeSimulation(n_particles, dtype=dtype)
+    posterior  = simulation.create_chromosome(contacts)
+    forces     = posterior.params['forces']
+
+    forces.set(0.)
+    posterior.update_forces()
+
+    results[dtype] = posterior.log_prob(), forces.get().astype('d')
+
+    print 'coordinates and forces stored as', forces.get().dtype
+
+a, b = results[np.float64], results[np.float32]
+
+print 'Do log probabilities agree? ---', np.isclose(a[0], b[0], rtol=1e-6)
+print 'Do forces agree? ---', np.fabs(a[1]-b[1]).max() < 1e-4 * np.fabs(a[1]).max()
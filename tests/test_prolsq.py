@@ -26,3 +26,50 @@ for eps in np.logspace(-3,-8,6):
 
     b = optimize.approx_fprime(coords, forcefield.energy, eps)
     print msg.format(eps, np.fabs((a-b)/(np.fabs(a)+1e-300)).max(), np.corrcoef(a,b)[0,1]*100)
+
+## the grid of the neighbor list follows changes of the cutoff
+
+forcefield.d = np.array([[4.]])
+
+reference = isdhic.ForcefieldFactory.create_forcefield('prolsq', universe)
+reference.d = np.array([[4.]])
+
+print 'Is the neighbor list retuned after increasing the radii? ---', \
+      np.isclose(forcefield.energy(coords), reference.energy(coords))
+
+## the cached result of the fused evaluation follows parameter changes
+
+E = forcefield.energy_and_gradient(coords)[0]
+
+forcefield.k = np.array([[10.]])
+forcefield.K = 2.
+
+print 'Is the cache cleared after changing parameters? ---', \
+      np.isclose(forcefield.energy(coords), 20 * E)
+
+## a disabled force field contributes neither energy nor forces
+
+forcefield.disable()
+universe.forces[...] = 0.
+
+E = forcefield.ctype.update_gradient(coords, universe.forces, forcefield.types, 1)
+
+print 'Does a disabled force field have zero energy and forces? ---', \
+      E == 0. and not np.any(universe.forces)
+
+## without stored pairs, missing parameters of the pair kernel are reported
+
+ctype = isdhic._isdhic.prolsq()
+ctype.nblist = forcefield.nblist.ctype
+ctype.n_types = 1
+ctype.enabled = 1
+
+forcefield.nblist.store_pairs = False
+
+try:
+    ctype.energy(coords.reshape(-1,3), forcefield.types)
+    raised = False
+except RuntimeError:
+    raised = True
+
+print 'Is a missing pair kernel reported? ---', raised
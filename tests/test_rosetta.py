@@ -26,3 +26,23 @@ for eps in np.logspace(-3,-8,6):
 
     b = optimize.approx_fprime(coords, forcefield.energy, eps)
     print(msg.format(eps, np.fabs((a-b)/np.fabs(a)).max(), np.corrcoef(a,b)[0,1]*100))
+
+## evaluation with several threads and per-thread force buffers
+
+forces = np.zeros(3*n_particles)
+forcefield.n_threads = 4
+E4 = forcefield.ctype.update_gradient(coords, forces, forcefield.types, 1)
+
+print('Are energy and gradient computed with {} threads identical? --- {}'.format(
+    forcefield.n_threads, np.isclose(E, E4) and np.allclose(a, forces)))
+
+## evaluation while walking the cells without storing the pairs
+
+forces = np.zeros(3*n_particles)
+forcefield.n_threads = 1
+forcefield.nblist.store_pairs = False
+forcefield.update_list(coords)
+E0 = forcefield.ctype.update_gradient(coords, forces, forcefield.types, 1)
+
+print('Are energy and gradient computed without a stored list identical? --- {}'.format(
+    np.isclose(E, E0) and np.allclose(a, forces) and np.isclose(E, forcefield.energy(coords))))
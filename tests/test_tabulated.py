@@ -0,0 +1,59 @@
+"""
+Test the tabulated force field
+"""
+import isdhic
+import numpy as np
+
+from scipy import optimize
+
+n_particles = 100
+boxsize     = 10
+coords      = np.ascontiguousarray(np.random.rand(3*n_particles) * boxsize)
+universe    = isdhic.Universe(n_particles)
+forcefield  = isdhic.ForcefieldFactory.create_forcefield('tabulated', universe)
+prolsq      = isdhic.ForcefieldFactory.create_forcefield('prolsq', universe)
+
+## tabulated PROLSQ repulsion with a diameter of 4 
+
+d = 4.
+forcefield.tabulate(lambda r: 0.5 * np.clip(d - r, 0., None)**4, d,
+                    derivative=lambda r: -2 * np.clip(d - r, 0., None)**3)
+prolsq.d = np.array([[d]])
+
+print 'Energies of tabulated and PROLSQ forcefield:',
+print forcefield.energy(coords), prolsq.energy(coords)
+
+forces = np.zeros(3*n_particles)
+E = forcefield.ctype.update_gradient(coords, universe.forces, forcefield.types, 1)
+E2 = prolsq.ctype.update_gradient(coords, forces, prolsq.types, 1)
+print 'Gradients agree? ---',
+print np.fabs(universe.forces.flatten() - forces).max() < 1e-4 * np.fabs(forces).max()
+
+a = universe.forces.flatten()
+
+msg = 'eps={0:.0e}, norm={1:.2e}, corr={2:.1f}'
+
+for eps in np.logspace(-3,-8,6):
+
+    b = optimize.approx_fprime(coords, forcefield.energy, eps)
+    print msg.format(eps, np.fabs((a-b)/(np.fabs(a)+1e-300)).max(), np.corrcoef(a,b)[0,1]*100)
+
+## several atom types with soft-core potentials given as callables
+
+n_types = 2
+forcefield.n_types = n_types
+forcefield.k = np.ones((n_types,n_types))
+forcefield.d = np.ones((n_types,n_types))
+forcefield.types = np.random.randint(0, n_types, n_particles).astype('i')
+
+soft = lambda w: lambda r: w * np.clip(1 - (r/4.)**2, 0., None)**2
+
+forcefield.tabulate([[soft(1.), soft(2.)], [soft(2.), soft(3.)]], 4.)
+
+x = coords.reshape(-1,3)
+r = np.sqrt(np.sum((x[:,None] - x[None])**2, -1))
+t = forcefield.types
+w = np.array([[1., 2.], [2., 3.]])[t[:,None], t[None]]
+E = np.sum(np.triu(w * np.clip(1 - (r/4.)**2, 0., None)**2, 1))
+
+print 'Energy of mixture matches brute force? ---', np.isclose(forcefield.energy(coords), E)
@@ -0,0 +1,92 @@
+"""
+Compare likelihoods over duplicated restraints with likelihoods over the
+distinct restraints weighted by their multiplicities.
+"""
+import isdhic
+import numpy as np
+
+from isdhic import utils
+from isdhic.core import take_time
+
+from test_params import random_pairs
+
+def evaluate(likelihood, forces):
+
+    forces.set(0.)
+    if not likelihood.fused: likelihood.update()
+    likelihood.update_forces()
+
+    return likelihood.log_prob(), forces.get().copy()
+
+def create_likelihoods(params, pairs, data, counts=None):
+
+    mocks = [isdhic.ModelDistances(pairs, name, sort=True)
+             for name in ('logistic', 'relu', 'lowerupper', 'normal')]
+
+    for mock in mocks:
+        params.add(mock)
+
+    return (isdhic.Logistic('logistic', data, mocks[0], 5., params=params, weights=counts),
+            isdhic.Relu('relu', data, mocks[1], 5., params=params, weights=counts),
+            isdhic.LowerUpper('lowerupper', data, mocks[2], data - 5., data,
+                              params=params, weights=counts),
+            isdhic.Normal('normal', data, mocks[3], 0.1, params=params, weights=counts))
+
+if __name__ == '__main__':
+
+    universe = utils.create_universe(n_particles=1000, diameter=4.)
+    coords   = isdhic.Coordinates(universe)
+    forces   = isdhic.Forces(universe)
+
+    ## every contact is observed several times
+
+    dataset  = isdhic.HiCData(random_pairs(universe.n_particles, 5000))
+    contacts = list(dataset)
+    
+    for n in np.random.randint(0, len(contacts), 20000):
+        dataset.add(contacts[n][::-1])
+
+    pairs, counts = dataset.unique_contacts()
+
+    print '{0} contacts, {1} distinct contacts'.format(len(dataset), len(pairs))
+
+    params = [isdhic.Parameters(), isdhic.Parameters()]
+
+    for param in (coords, forces):
+        params[0].add(param)
+        params[1].add(param)
+
+    likelihoods = zip(create_likelihoods(params[0], list(dataset), np.ones(len(dataset)) * 30.),
+                      create_likelihoods(params[1], pairs, np.ones(len(pairs)) * 30., counts))
+
+    for all_contacts, weighted in likelihoods:
+
+        for fused in (False, True):
+
+            all_contacts.fused = weighted.fused = fused
+
+            with take_time('{0:>10s} for all contacts'.format(all_contacts.name)):
+                a = evaluate(all_contacts, forces)
+
+            with take_time('{0:>10s} for weighted contacts'.format(weighted.name)):
+                b = evaluate(weighted, forces)
+
+            print 'Do log probability and forces agree (fused={0})? ---'.format(fused), \
+                  np.isclose(a[0], b[0]) and np.allclose(a[1], b[1])
+
+    ## posteriors with duplicated and with weighted contacts
+
+    posteriors = [isdhic.PosteriorCoordinates(str(k), likelihoods=list(models))
+                  for k, models in enumerate(zip(*likelihoods))]
+
+    results = []
+
+    for posterior in posteriors:
+        forces.set(0.)
+        posterior.update_forces()
+        results.append((posterior.log_prob(), forces.get().copy()))
+
+    a, b = results
+
+    print 'Do posterior log probability and forces agree? ---', \
+          np.isclose(a[0], b[0]) and np.allclose(a[1], b[1])